@@ -0,0 +1,53 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" benchmarks loading synthetic state files with each of the installed JSON backends
+
+    $ python -m benchmarks.codec
+"""
+
+from benchmarks.resources import generate_checkpoint, timeit
+from pathlib import Path
+from pitfall import codec
+import json
+import tempfile
+
+
+SIZES = [1000, 5000, 10000, 20000]
+
+
+def main() -> None:
+    backends = codec.available_backends()
+    previous = codec.get_backend()
+
+    print(f'{"resources":>10} {"size (MB)":>10} ' + ' '.join(f'{i + " (s)":>14}' for i in backends))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in SIZES:
+            path = Path(tmp).joinpath(f'checkpoint-{size}.json')
+            path.write_text(json.dumps(generate_checkpoint(size), indent=4))
+
+            timings = []
+            for backend in backends:
+                codec.set_backend(backend)
+                timings.append(timeit(lambda: codec.load_file(path)))
+
+            megabytes = path.stat().st_size / 1024 / 1024
+            print(f'{size:>10} {megabytes:>10.1f} ' + ' '.join(f'{i:>14.4f}' for i in timings))
+
+    codec.set_backend(previous)
+
+
+if __name__ == '__main__':
+    main()
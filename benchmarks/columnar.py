@@ -0,0 +1,60 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" benchmarks counting resources per type per stack with Python loops and with columnar tables
+
+    $ python -m benchmarks.columnar
+"""
+
+from benchmarks.resources import generate_checkpoint, timeit
+from pitfall.columnar import PulumiTable, resources_table
+from pitfall.state import PulumiResources
+
+
+STACKS = [10, 100, 1000]
+
+RESOURCES_PER_STACK = 200
+
+
+def count_loop(stacks: list) -> dict:
+    return {n: dict(i.types) for n, i in enumerate(stacks)}
+
+
+def count_columnar(table: PulumiTable) -> tuple:
+    return table.crosstab("run", "type")
+
+
+def main() -> None:
+    print(f'{"stacks":>8} {"resources":>10} {"loop (s)":>10} {"columnar (s)":>13}')
+
+    checkpoint = generate_checkpoint(RESOURCES_PER_STACK)
+
+    for size in STACKS:
+        stacks = [PulumiResources.from_checkpoint(checkpoint) for _ in range(size)]
+        table  = PulumiTable.concat([resources_table(i, stack=f'stack-{n}', run=n) for n, i in enumerate(stacks)])
+
+        def loop():
+            for i in stacks:
+                i._types = {}
+                i._indexes.clear()
+            count_loop(stacks)
+
+        elapsed_loop     = timeit(loop)
+        elapsed_columnar = timeit(lambda: count_columnar(table))
+
+        print(f'{size:>8} {len(table):>10} {elapsed_loop:>10.4f} {elapsed_columnar:>13.4f}')
+
+
+if __name__ == '__main__':
+    main()
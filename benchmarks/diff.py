@@ -0,0 +1,46 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" benchmarks diffing two synthetic checkpoints in which 1% of the resources changed
+
+    $ python -m benchmarks.diff
+"""
+
+from benchmarks.resources import generate_checkpoint, timeit
+from pitfall.diff import diff_checkpoints
+import copy
+
+
+SIZES = [1000, 5000, 10000, 20000]
+
+
+def main() -> None:
+    print(f'{"resources":>10} {"changed":>8} {"diff (s)":>10}')
+
+    for size in SIZES:
+        old = generate_checkpoint(size)
+        new = copy.deepcopy(old)
+
+        resources = new["checkpoint"]["latest"]["resources"]
+        for i in resources[::100]:
+            i.setdefault("outputs", {})["tags"] = {"Environment": "prod"}
+
+        elapsed = timeit(lambda: diff_checkpoints(old, new))
+        changed = len(diff_checkpoints(old, new))
+
+        print(f'{size:>10} {changed:>8} {elapsed:>10.4f}')
+
+
+if __name__ == '__main__':
+    main()
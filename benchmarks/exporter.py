@@ -0,0 +1,48 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" benchmarks exporting the resources tree to DOT with anytree's DotExporter and the streaming exporter
+
+    $ python -m benchmarks.exporter
+"""
+
+from anytree.exporter import DotExporter
+from benchmarks.resources import generate_checkpoint, timeit
+from pitfall.exporter import PulumiGraphExporter, format_node_name
+from pitfall.state import PulumiResources
+import io
+
+
+SIZES = [1000, 5000, 10000, 20000]
+
+
+def main() -> None:
+    print(f'{"resources":>10} {"anytree (s)":>12} {"streaming (s)":>14}')
+
+    for size in SIZES:
+        resources = PulumiResources.from_checkpoint(generate_checkpoint(size))
+        root      = resources[0]
+
+        def anytree():
+            for _ in DotExporter(root, nodenamefunc=format_node_name):
+                pass
+
+        def streaming():
+            PulumiGraphExporter(resources, roots=[root]).write_dot(io.StringIO())
+
+        print(f'{size:>10} {timeit(anytree):>12.4f} {timeit(streaming):>14.4f}')
+
+
+if __name__ == '__main__':
+    main()
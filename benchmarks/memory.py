@@ -0,0 +1,131 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" benchmarks the memory retained by the resources built from a state file, by the baseline resources that hold their decoded
+    properties and by the compact resources of PulumiResources
+
+    $ python -m benchmarks.memory
+"""
+
+from pathlib import Path
+from anytree import NodeMixin
+from pitfall.state import PulumiResources
+from typing import Any, Dict, List, Union
+import copy
+import gc
+import json
+import tracemalloc
+
+
+SIZES = [1000, 10000]
+
+TEMPLATES = Path(__file__).parent.parent.joinpath('tests/test_data/state.json')
+
+
+def unique(value: Any, n: int) -> Any:
+    """ returns a copy of value with `-<n>` appended to every string, so that no two copies of a resource share a value """
+    if isinstance(value, dict):
+        return {k: unique(v, n) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [unique(i, n) for i in value]
+    elif isinstance(value, str):
+        return f'{value}-{n}'
+    return value
+
+
+def generate_checkpoint(size: int) -> dict:
+    """ returns a state file with `size` resources that are copies of the resources in the test state file with unique values """
+    templates = json.loads(TEMPLATES.read_text())["checkpoint"]["latest"]["resources"]
+    stack     = templates[0]
+
+    resources = [stack]
+    for i in range(1, size):
+        resource = copy.deepcopy(templates[1 + i % (len(templates) - 1)])
+        resource["urn"] = f'{resource["urn"]}-{i}'
+        resource["parent"] = stack["urn"]
+        for key in ("id", "inputs", "outputs"):
+            if key in resource:
+                resource[key] = unique(resource[key], i)
+        resources.append(resource)
+
+    return {"version": 3, "checkpoint": {"stack": "bench-stack", "latest": {"resources": resources}}}
+
+
+class BaselineResource(NodeMixin):
+    """ PulumiResource before resources were stored compactly: a plain NodeMixin holding decoded properties in its __dict__ """
+    def __init__(self,
+        urn: str, rtype: str, rid: str, provider: str = None,
+        inputs: dict = None, outputs: dict = None, dependencies: dict = None,
+        parent: Union['BaselineResource', None] = None
+    ) -> None:
+        super().__init__()
+
+        self.urn          = urn
+        self.type         = rtype
+        self.id           = rid
+        self.provider     = provider
+        self.inputs       = inputs
+        self.outputs      = outputs
+        self.dependencies = dependencies
+        self.parent       = parent
+
+
+def build_baseline(checkpoint: dict) -> List[BaselineResource]:
+    """ builds the resources the way PulumiState.resources did before resources were stored compactly """
+    resources: List[BaselineResource] = []
+    urns: Dict[str, BaselineResource] = {}
+
+    for i in checkpoint["checkpoint"]["latest"]["resources"]:
+        resource = BaselineResource(
+            urn=i["urn"], rtype=i["type"], rid=i.get("id"), provider=i.get("provider"),
+            inputs=i.get("inputs", {}), outputs=i.get("outputs", {}), dependencies=i.get("propertyDependencies", {}),
+            parent=urns.get(i.get("parent"))
+        )
+        resources.append(resource)
+        urns[resource.urn] = resource
+
+    return resources
+
+
+def retained(build, text: str) -> int:
+    """ returns the memory in bytes still allocated by the resources once the decoded state file is released """
+    gc.collect()
+    tracemalloc.start()
+
+    resources = build(json.loads(text))
+
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del resources
+    return current
+
+
+def main() -> None:
+    mb = 1024 * 1024
+
+    print(f'{"resources":>10} {"baseline (MB)":>14} {"compact (MB)":>13} {"reduction":>10}')
+
+    for size in SIZES:
+        text = json.dumps(generate_checkpoint(size))
+
+        baseline = retained(build_baseline, text)
+        compact  = retained(PulumiResources.from_checkpoint, text)
+
+        print(f'{size:>10} {baseline / mb:>14.1f} {compact / mb:>13.1f} {baseline / compact:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" benchmarks recording API requests to an upstream with simulated network latency and replaying them from the cassette
+
+    $ python -m benchmarks.proxy
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from pitfall.proxy import PulumiRecordingProxy
+from urllib.parse import urlsplit
+import http.client
+import tempfile
+import threading
+import time
+
+
+LATENCY  = 0.05  # seconds per request to the upstream, a typical round trip to a cloud API
+REQUESTS = 100
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        body = b'{"Vpcs": []}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run(proxy: PulumiRecordingProxy, upstream_url: str) -> float:
+    start = time.perf_counter()
+
+    with proxy:
+        parts      = urlsplit(proxy.url)
+        connection = http.client.HTTPConnection(parts.hostname, parts.port)
+        for n in range(REQUESTS):
+            connection.request('GET', f'{upstream_url}/?Action=DescribeVpcs&VpcId=vpc-{n}')
+            connection.getresponse().read()
+        connection.close()
+
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = 'http://%s:%d' % upstream.server_address[:2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cassette = Path(tmp).joinpath('cassette.json')
+
+        recorded = run(PulumiRecordingProxy(cassette=cassette, mode='record'), upstream_url)
+        replayed = run(PulumiRecordingProxy(cassette=cassette, mode='replay'), upstream_url)
+
+    upstream.shutdown()
+
+    print(f'{"requests":>10} {"record (s)":>12} {"replay (s)":>12} {"speedup":>8}')
+    print(f'{REQUESTS:>10} {recorded:>12.3f} {replayed:>12.3f} {recorded / replayed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
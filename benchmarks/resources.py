@@ -0,0 +1,85 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" benchmarks building PulumiResources from synthetic state files of increasing size
+
+    $ python -m benchmarks.resources
+"""
+
+from pitfall.state import PulumiResources
+import time
+
+
+SIZES = [100, 1000, 5000, 10000, 20000]
+
+
+def generate_checkpoint(size: int, components: int = 50) -> dict:
+    """ returns a synthetic state file with `size` resources nested under a stack and component resources """
+    prefix   = 'urn:pulumi:bench-stack::bench-project::'
+    stack    = f'{prefix}pulumi:pulumi:Stack::bench-project-bench-stack'
+    provider = f'{prefix}pulumi:providers:aws::default::04da6b54-80e4-46f7-96ec-b56ff0331ba9'
+
+    resources = [
+        {"urn": stack, "custom": False, "type": "pulumi:pulumi:Stack"},
+        {"urn": provider.rsplit('::', 1)[0], "custom": True, "id": "04da6b54-80e4-46f7-96ec-b56ff0331ba9", "type": "pulumi:providers:aws"}
+    ]
+
+    parents = []
+    for i in range(min(components, size)):
+        urn = f'{prefix}Component$bench:index:Component::component-{i}'
+        resources.append({"urn": urn, "custom": False, "type": "bench:index:Component", "parent": stack})
+        parents.append(urn)
+
+    for i in range(len(resources), size):
+        resources.append({
+            "urn": f'{prefix}Component$aws:s3/bucket:Bucket::bucket-{i}',
+            "custom": True,
+            "id": f'bucket-{i}',
+            "type": "aws:s3/bucket:Bucket",
+            "inputs": {"bucket": f'bucket-{i}', "tags": {"Environment": "test", "Index": str(i)}},
+            "outputs": {"arn": f'arn:aws:s3:::bucket-{i}', "bucket": f'bucket-{i}', "tags": {"Environment": "test", "Index": str(i)}},
+            "parent": parents[i % len(parents)],
+            "provider": provider,
+            "propertyDependencies": {"bucket": [], "tags": []}
+        })
+
+    return {"version": 3, "checkpoint": {"stack": "bench-stack", "latest": {"resources": resources[:size]}}}
+
+
+def timeit(func, repeat: int = 3) -> float:
+    """ returns the fastest of `repeat` executions of func in seconds """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    print(f'{"resources":>10} {"build (s)":>12} {"urn lookups (s)":>16}')
+
+    for size in SIZES:
+        checkpoint = generate_checkpoint(size)
+        resources  = PulumiResources.from_checkpoint(checkpoint)
+        urns       = [i["urn"] for i in checkpoint["checkpoint"]["latest"]["resources"]]
+
+        build  = timeit(lambda: PulumiResources.from_checkpoint(checkpoint))
+        lookup = timeit(lambda: [resources.lookup(key="urn", value=i) for i in urns])
+
+        print(f'{size:>10} {build:>12.4f} {lookup:>16.4f}')
+
+
+if __name__ == '__main__':
+    main()
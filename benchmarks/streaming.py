@@ -0,0 +1,76 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" benchmarks the peak memory of loading a state file whole versus streaming its resources
+
+    $ python -m benchmarks.streaming
+"""
+
+from .resources import generate_checkpoint
+from pathlib import Path
+from pitfall import streaming
+from pitfall.state import PulumiResources
+import json
+import tempfile
+import tracemalloc
+
+
+SIZES = [1000, 5000, 20000]
+
+
+def measure(func) -> int:
+    """ returns the peak memory allocated in bytes while executing func """
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def count_loaded(path: Path) -> int:
+    checkpoint = json.loads(path.read_text())
+    return sum(1 for _ in checkpoint["checkpoint"]["latest"]["resources"])
+
+
+def count_streamed(path: Path) -> int:
+    with path.open('rb') as f:
+        return sum(1 for _ in streaming.iter_items(f, ('checkpoint', 'latest', 'resources')))
+
+
+def build_loaded(path: Path) -> PulumiResources:
+    return PulumiResources.from_checkpoint(json.loads(path.read_text()))
+
+
+def build_streamed(path: Path) -> PulumiResources:
+    with path.open('rb') as f:
+        return PulumiResources.from_iterable(streaming.iter_items(f, ('checkpoint', 'latest', 'resources')))
+
+
+def main() -> None:
+    mb = 1024 * 1024
+
+    print(f'{"resources":>10} {"file (MB)":>10} {"iterate: load":>14} {"stream":>8} {"build: load":>12} {"stream":>8}')
+
+    with tempfile.TemporaryDirectory() as d:
+        for size in SIZES:
+            path = Path(d).joinpath(f'{size}.json')
+            path.write_text(json.dumps(generate_checkpoint(size), indent=4))
+
+            results = [measure(lambda: func(path)) / mb for func in [count_loaded, count_streamed, build_loaded, build_streamed]]
+
+            print(f'{size:>10} {path.stat().st_size / mb:>10.1f} {results[0]:>14.1f} {results[1]:>8.1f} {results[2]:>12.1f} {results[3]:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,8 @@
 from pitfall import PulumiIntegrationTest, PulumiIntegrationTestOptions
 from pitfall import PulumiConfigurationKey, PulumiPlugin
+from pitfall.helpers.aws.emulator import AWSEmulator
 from pathlib import Path
 import botocore
-import boto3
 import os
 import unittest
 
@@ -12,20 +12,8 @@ class TestProvisioningS3Bucket(unittest.TestCase):
         # use localstack to test provisioning
         localstack_s3_endpoint = os.environ.get('LOCALSTACK_S3_ENDPOINT', 'http://localhost:4572')
 
-        self.s3 = boto3.client(
-            service_name='s3',
-            endpoint_url=localstack_s3_endpoint,
-            verify=False,
-            aws_access_key_id='integration-test',
-            aws_secret_access_key='integration-test',
-            config=botocore.client.Config(
-                region_name='us-east-1',
-                connect_timeout=30,
-                read_timeout=30,
-                retries={"max_attempts": 1},
-                s3={"addressing_style": "path"}
-            )
-        )
+        self.emulator = AWSEmulator.localstack(services=('s3',), endpoints={'s3': localstack_s3_endpoint})
+        self.s3       = self.emulator.client('s3')
 
         self.dir = Path(__file__)
         self.pwd = Path.cwd()
@@ -37,7 +25,6 @@ class TestProvisioningS3Bucket(unittest.TestCase):
         bucket_name = f"pitfall-localstack-test-bucket-1"
 
         config = [
-            PulumiConfigurationKey(name='local-mode', value=True),
             PulumiConfigurationKey(name='s3-bucket-name', value=bucket_name),
             PulumiConfigurationKey(name='environment', value='test'),
             PulumiConfigurationKey(name='owner', value='@bincyber'),
@@ -51,7 +38,7 @@ class TestProvisioningS3Bucket(unittest.TestCase):
 
         provisioned_bucket_name = None
 
-        opts = PulumiIntegrationTestOptions(cleanup=True, preview=True, up=True, destroy=True)
+        opts = PulumiIntegrationTestOptions(cleanup=True, preview=True, up=True, destroy=True, emulator=self.emulator)
 
         with PulumiIntegrationTest(directory=self.dir, config=config, plugins=plugins, opts=opts) as integration_test:
             outputs = integration_test.get_stack_outputs()
@@ -67,7 +54,6 @@ class TestProvisioningS3Bucket(unittest.TestCase):
         bucket_name = f"pitfall-localstack-test-bucket-2"
 
         config = [
-            PulumiConfigurationKey(name='local-mode', value=True),
             PulumiConfigurationKey(name='s3-bucket-name', value=bucket_name),
             PulumiConfigurationKey(name='environment', value='test'),
             PulumiConfigurationKey(name='owner', value='@bincyber'),
@@ -79,7 +65,7 @@ class TestProvisioningS3Bucket(unittest.TestCase):
             PulumiPlugin(kind='resource', name='aws', version='v1.7.0')
         ]
 
-        opts = PulumiIntegrationTestOptions(verbose=True, cleanup=False, preview=False, destroy=False)
+        opts = PulumiIntegrationTestOptions(verbose=True, cleanup=False, preview=False, destroy=False, emulator=self.emulator)
 
         with PulumiIntegrationTest(directory=self.dir, config=config, plugins=plugins, opts=opts) as integration_test:
             integration_test.preview.execute()
@@ -24,3 +24,15 @@ from .config import (
 from .plugins import (
     PulumiPlugin,
 )
+
+from .history import (
+    CheckpointRetention,
+)
+
+from .mocks import (
+    PulumiMocks,
+)
+
+from .fixtures import (
+    PulumiStateFixture,
+)
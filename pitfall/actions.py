@@ -12,14 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from . import codec
 from . import exceptions
+from . import streaming
 from . import utils
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import List, Union
-import json
+from typing import IO, Iterator, List, Union
+import io
+import os
 import re
 import subprocess
+import tempfile
+import weakref
+
+
+def _remove_file(path: str) -> None:
+    """ removes a temporary file, unless it was already removed """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 
 def print_verbose_output(args: list, stdout: str, stderr: str):
@@ -66,8 +79,15 @@ class PulumiStep:
 
 
 class PulumiAction(ABC):
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, state=None):
         self.verbose = verbose
+        self.state   = state  # the PulumiState that is updated when this action modifies the state file
+
+    def _update_state(self) -> None:
+        """ clears the cached contents of the state file and applies the retention policy to its backups """
+        if self.state is not None:
+            self.state.invalidate()
+            self.state.apply_retention()
 
     @abstractmethod
     def execute(self):  # pragma: no cover
@@ -83,29 +103,60 @@ class PulumiAction(ABC):
 
 
 class PulumiPreview(PulumiAction):
+    def __init__(self, verbose=False, state=None):
+        super().__init__(verbose=verbose, state=state)
+        self._stdout        = None
+        self._stdout_path   = None  # the temporary file the JSON output of the preview is written to
+        self._remove_stdout = None  # removes the temporary file, at the latest when the preview is garbage collected
+        self._decoded       = None  # the output and its decoded JSON document
+
     def execute(self) -> subprocess.CompletedProcess:
         pulumi_binary = utils.find_pulumi_binary()
         cmd           = [pulumi_binary, 'preview', '--non-interactive', '--json', '--color=always']
 
-        process = subprocess.run(cmd, capture_output=True)
+        if self._remove_stdout is not None:
+            self._remove_stdout()  # the output of the previous preview
 
-        self._stdout = utils.decode_utf8(process.stdout)
-        self._stderr = utils.decode_utf8(process.stderr)
+        # the output is written to a temporary file rather than captured, so that steps are streamed from disk.
+        # The file is closed once pulumi exits and is read again by path
+        stdout_file         = tempfile.NamedTemporaryFile(prefix='pitfall-preview-', suffix='.json', delete=False)
+        self._remove_stdout = weakref.finalize(self, _remove_file, stdout_file.name)
+
+        with stdout_file:
+            process = subprocess.run(cmd, stdout=stdout_file, stderr=subprocess.PIPE)
+
+        self._stdout_path = stdout_file.name
+        self._stdout      = None if process.stdout is None else utils.decode_utf8(process.stdout)
+        self._stderr      = utils.decode_utf8(process.stderr)
 
         if process.returncode != 0:
-            err = self._stdout
+            err = self._read_stdout()
             if len(err) == 0:
                 err = self._stderr
             raise exceptions.PulumiPreviewExecError(err)
 
         if self.verbose:
-            print_verbose_output(args=process.args, stdout=self._stdout, stderr=self._stderr)
+            print_verbose_output(args=process.args, stdout=self._read_stdout(), stderr=self._stderr)
 
         return process
 
+    def _read_stdout(self) -> str:
+        """ returns the JSON output of the preview, reading it from the temporary file on first use """
+        if self._stdout is None and self._stdout_path is not None:
+            with open(self._stdout_path, 'rb') as f:
+                self._stdout = utils.decode_utf8(f.read())
+        return self._stdout or ''
+
     @property
     def stdout(self) -> dict:
-        return json.loads(self._stdout)
+        """ returns the decoded JSON output of the preview. Decoded once and cached until the preview is executed again """
+        stdout = self._read_stdout()
+
+        cached = self._decoded
+        if cached is None or cached[0] is not stdout:
+            cached        = (stdout, codec.loads(stdout))
+            self._decoded = cached
+        return cached[1]
 
     @property
     def config(self) -> dict:
@@ -113,18 +164,29 @@ class PulumiPreview(PulumiAction):
 
     @property
     def steps(self) -> List[PulumiStep]:
-        steps = []
-
-        preview_steps = self.stdout.get("steps", [])
-
+        return list(self.iter_steps())
+
+    def iter_steps(self) -> Iterator[PulumiStep]:
+        """ yields the steps of the preview one at a time without reading the entire JSON output into memory """
+        if self._stdout is None and self._stdout_path is not None:
+            # a file object per iterator, so that several iterators can read the output at once
+            with open(self._stdout_path, 'rb') as f:
+                yield from self._iter_steps(f)
+        else:
+            stdout = self._stdout
+            if isinstance(stdout, str):
+                stdout = stdout.encode('utf-8')
+            yield from self._iter_steps(io.BytesIO(stdout))
+
+    def _iter_steps(self, fp: IO[bytes]) -> Iterator[PulumiStep]:
         regex = re.compile('pulumi:.+:.+')
 
-        for i in preview_steps:
+        for i in streaming.iter_items(fp, ('steps',)):
             step_type = i["newState"]["type"]
             if regex.match(step_type):
                 continue
 
-            pulumi_step = PulumiStep(
+            yield PulumiStep(
                 op=i["op"],
                 urn=i["urn"],
                 parent=i.get("parent", None),
@@ -134,8 +196,6 @@ class PulumiPreview(PulumiAction):
                 detailed_diff=i.get("detailedDiff", {}),
                 diff_reasons=i.get("diffReasons", [])
             )
-            steps.append(pulumi_step)
-        return steps
 
     @property
     def diagnostics(self) -> list:
@@ -168,6 +228,8 @@ class PulumiUp(PulumiAction):
 
         process = subprocess.run(cmd, capture_output=True)
 
+        self._update_state()
+
         self._stdout = utils.decode_utf8(process.stdout)
         self._stderr = utils.decode_utf8(process.stderr)
 
@@ -190,6 +252,8 @@ class PulumiDestroy(PulumiAction):
 
         process = subprocess.run(cmd, capture_output=True)
 
+        self._update_state()
+
         self._stdout = utils.decode_utf8(process.stdout)
         self._stderr = utils.decode_utf8(process.stderr)
 
@@ -0,0 +1,114 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" the JSON codec used to parse and serialize state files, preview output and stack outputs """
+
+from os import PathLike
+from pathlib import Path
+from typing import Any, Union
+import gzip
+import json
+import mmap
+import os
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:  # pragma: no cover
+    simdjson = None
+
+
+BACKENDS = ('orjson', 'simdjson', 'json')
+
+# files larger than this are memory-mapped rather than read into a buffer
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def available_backends() -> list:
+    """ returns the names of the JSON backends that are installed, fastest first """
+    installed = {'orjson': orjson is not None, 'simdjson': simdjson is not None, 'json': True}
+    return [i for i in BACKENDS if installed[i]]
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def set_backend(name: str = None) -> str:
+    """ selects the JSON backend by name, or the fastest one installed if name is None, and returns its name """
+    global _backend
+
+    if name is None:
+        name = available_backends()[0]
+    elif name not in available_backends():
+        raise ValueError(f"JSON backend {name!r} is not available. Available: {', '.join(available_backends())}")
+
+    _backend = name
+    return _backend
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """ parses a JSON document from a str or a bytes-like object. orjson and simdjson parse bytes without decoding them to str first """
+    if _backend == 'orjson':
+        return orjson.loads(data)
+    elif _backend == 'simdjson':
+        return simdjson.loads(data)
+
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: int = None) -> str:
+    """
+    serializes obj to a JSON str, compactly if indent is None. orjson only supports an indent of 2,
+    so other indents, such as the indent of 4 used by Pulumi's state files, are serialized by the stdlib
+    """
+    if _backend == 'orjson' and indent in (None, 2):
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, option=option).decode('utf-8')
+    if indent is None:
+        return json.dumps(obj, separators=(',', ':'))
+    return json.dumps(obj, indent=indent)
+
+
+def load_file(path: Union[PathLike, str]) -> Any:
+    """
+    parses the JSON document in a file. Compressed files (.gz) are inflated into a bytes buffer.
+    Large files are memory-mapped and handed to the parser as a buffer when the backend supports it
+    """
+    path = Path(path)
+
+    if path.suffix == '.gz':
+        with gzip.open(path, 'rb') as f:
+            return loads(f.read())
+
+    with path.open('rb') as f:
+        size = os.fstat(f.fileno()).st_size
+
+        if size < MMAP_THRESHOLD or _backend == 'json':
+            return loads(f.read())
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return loads(view)
+
+
+_backend = os.environ.get('PITFALL_JSON_BACKEND') or available_backends()[0]
+if _backend not in available_backends():  # pragma: no cover
+    _backend = 'json'
@@ -0,0 +1,243 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" columnar tables of resources and preview steps for analytics across many stacks. Requires NumPy; pyarrow is optional """
+
+from __future__ import annotations
+from os import PathLike
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("NumPy is required for columnar tables. Install it with: pip install numpy")
+
+
+class DictionaryColumn:
+    """
+    A dictionary-encoded column: each row stores an integer code into a list of distinct
+    values. None is encoded as -1.
+
+    :type codes: numpy.ndarray
+    :param codes: the code of each row
+
+    :type categories: list
+    :param categories: the distinct values of the column
+    """
+    def __init__(self, codes: Any, categories: List[str]) -> None:
+        self.codes      = codes
+        self.categories = categories
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> Union[str, None]:
+        code = self.codes[index]
+        return None if code < 0 else self.categories[code]
+
+    @classmethod
+    def encode(cls, values: Iterable[Union[str, None]]) -> DictionaryColumn:
+        """ dictionary-encodes the values in a single pass """
+        _require_numpy()
+
+        lookup: Dict[str, int] = {}
+        codes: List[int]       = []
+
+        for i in values:
+            if i is None:
+                codes.append(-1)
+            else:
+                codes.append(lookup.setdefault(i, len(lookup)))
+
+        return cls(np.array(codes, dtype=np.int32), list(lookup))
+
+    def to_list(self) -> List[Union[str, None]]:
+        return [self[i] for i in range(len(self))]
+
+    def value_counts(self) -> Dict[str, int]:
+        """ returns the number of rows with each value, counted with numpy.bincount """
+        codes  = self.codes[self.codes >= 0]
+        counts = np.bincount(codes, minlength=len(self.categories))
+        return {k: int(v) for k, v in zip(self.categories, counts) if v > 0}
+
+
+class PulumiTable:
+    """
+    A table of equal length columns. Columns of strings with few distinct values
+    (ie. type, provider, op) are dictionary-encoded, other columns are NumPy arrays.
+    Tables of many stacks or runs are combined with `concat()`.
+    """
+    def __init__(self, columns: Dict[str, Union[DictionaryColumn, Any]]) -> None:
+        self.columns = columns
+
+    def __len__(self) -> int:
+        for i in self.columns.values():
+            return len(i)
+        return 0
+
+    def __getitem__(self, name: str) -> Union[DictionaryColumn, Any]:
+        return self.columns[name]
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns)
+
+    @classmethod
+    def concat(cls, tables: Sequence[PulumiTable]) -> PulumiTable:
+        """ combines tables with the same columns, merging the dictionaries of their dictionary-encoded columns """
+        _require_numpy()
+
+        if not tables:
+            return cls({})
+
+        columns: Dict[str, Union[DictionaryColumn, Any]] = {}
+
+        for name, first in tables[0].columns.items():
+            if isinstance(first, DictionaryColumn):
+                lookup: Dict[str, int] = {}
+                codes = []
+
+                for table in tables:
+                    column  = table[name]
+                    mapping = np.array([lookup.setdefault(i, len(lookup)) for i in column.categories] + [-1], dtype=np.int32)
+                    codes.append(mapping[column.codes])  # -1 indexes the last element of mapping, so None stays -1
+
+                columns[name] = DictionaryColumn(np.concatenate(codes), list(lookup))
+            else:
+                columns[name] = np.concatenate([table[name] for table in tables])
+
+        return cls(columns)
+
+    def value_counts(self, column: str) -> Dict[str, int]:
+        """ returns the number of rows with each value of a dictionary-encoded column """
+        return self.columns[column].value_counts()
+
+    def crosstab(self, rows: str, columns: str) -> Tuple[List[Any], List[str], Any]:
+        """
+        counts the rows for each pair of values of two columns, eg. crosstab("run", "type") counts the
+        resources of each type in each run. Returns the row labels, the column labels and a 2D array of counts
+        """
+        row_codes, row_labels = self.__codes(rows)
+        col_codes, col_labels = self.__codes(columns)
+
+        valid = (row_codes >= 0) & (col_codes >= 0)
+        flat  = row_codes[valid].astype(np.int64) * len(col_labels) + col_codes[valid]
+
+        counts = np.bincount(flat, minlength=len(row_labels) * len(col_labels)).reshape(len(row_labels), len(col_labels))
+        return row_labels, col_labels, counts
+
+    def __codes(self, name: str) -> Tuple[Any, List[Any]]:
+        """ returns integer codes and labels of a column, factorizing columns that are not dictionary-encoded """
+        column = self.columns[name]
+        if isinstance(column, DictionaryColumn):
+            return column.codes, column.categories
+
+        labels, codes = np.unique(column, return_inverse=True)
+        return codes, labels.tolist()
+
+    def to_arrow(self) -> Any:
+        """ returns the table as a pyarrow.Table with dictionary-encoded columns """
+        if pa is None:
+            raise ImportError("pyarrow is required to export to Arrow. Install it with: pip install pyarrow")
+
+        arrays = {}
+        for name, column in self.columns.items():
+            if isinstance(column, DictionaryColumn):
+                mask = column.codes < 0
+                arrays[name] = pa.DictionaryArray.from_arrays(
+                    pa.array(column.codes, mask=mask, type=pa.int32()), pa.array(column.categories, type=pa.string())
+                )
+            else:
+                arrays[name] = pa.array(column.tolist() if column.dtype == object else column)
+
+        return pa.table(arrays)
+
+    def write_parquet(self, filename: PathLike) -> None:
+        """ writes the table to a Parquet file. Requires pyarrow """
+        table = self.to_arrow()
+        pq.write_table(table, str(filename))
+
+
+def _provider_type(provider: Union[str, None]) -> Union[str, None]:
+    """ returns the type of the provider from its reference, eg. pulumi:providers:aws """
+    if not provider:
+        return None
+    return provider.split("::")[2]
+
+
+def resources_table(resources: Iterable[Any], stack: str = None, run: int = 0) -> PulumiTable:
+    """
+    returns a table of resources with the columns run, stack, urn, type, provider, id and parent.
+    The resources are either PulumiResource objects or dictionaries in the format of the state file
+    """
+    _require_numpy()
+
+    urns, types, providers, ids, parents = [], [], [], [], []
+
+    for i in resources:
+        if isinstance(i, dict):
+            urns.append(i["urn"])
+            types.append(i["type"])
+            providers.append(_provider_type(i.get("provider")))
+            ids.append(i.get("id"))
+            parents.append(i.get("parent"))
+        else:
+            urns.append(i.urn)
+            types.append(i.type)
+            providers.append(_provider_type(i.provider))
+            ids.append(i.id)
+            parents.append(None if i.parent is None else i.parent.urn)
+
+    return PulumiTable({
+        "run": np.full(len(urns), run, dtype=np.int32),
+        "stack": DictionaryColumn(np.zeros(len(urns), dtype=np.int32), [stack]) if stack else DictionaryColumn.encode([None] * len(urns)),
+        "urn": np.array(urns, dtype=object),
+        "type": DictionaryColumn.encode(types),
+        "provider": DictionaryColumn.encode(providers),
+        "id": np.array(ids, dtype=object),
+        "parent": np.array(parents, dtype=object)
+    })
+
+
+def steps_table(steps: Iterable[Any], run: int = 0) -> PulumiTable:
+    """ returns a table of the PulumiStep objects of a preview with the columns run, op, urn, type and provider """
+    _require_numpy()
+
+    ops, urns, types, providers = [], [], [], []
+
+    for i in steps:
+        ops.append(i.op)
+        urns.append(i.urn)
+        types.append(i.new_state_type)
+        providers.append(_provider_type(i.provider))
+
+    return PulumiTable({
+        "run": np.full(len(urns), run, dtype=np.int32),
+        "op": DictionaryColumn.encode(ops),
+        "urn": np.array(urns, dtype=object),
+        "type": DictionaryColumn.encode(types),
+        "provider": DictionaryColumn.encode(providers)
+    })
@@ -13,23 +13,35 @@
 # limitations under the License.
 
 
+from . import codec
 from . import exceptions
 from . import utils
 from .config import PulumiConfigurationKey, DEFAULT_PULUMI_CONFIG_PASSPHRASE, DEFAULT_PULUMI_HOME
 from .actions import PulumiPreview, PulumiUp, PulumiDestroy
+from .fixtures import PulumiStateFixture
+from .helpers.aws.emulator import AWSEmulator
+from .history import CheckpointRetention
+from .mocks import PulumiMocks, PulumiMockRun
 from .project import PulumiProject
+from .proxy import PulumiRecordingProxy
 from .plugins import PulumiPlugin
 from .stack import PulumiStack
 from .state import PulumiState
 from dataclasses import dataclass
 from distutils import dir_util
 from pathlib import Path
-from typing import Dict, List, Union, Any
+from typing import Dict, List, Tuple, Union, Any
+import ast
 import json
 import os
 import shutil
 import subprocess
 import tempfile
+import time
+
+
+# PYTHONPYCACHEPREFIX was added in Python 3.8
+PYCACHEPREFIX_MIN_PYTHON_VERSION = (3, 8)
 
 
 @dataclass
@@ -40,6 +52,13 @@ class PulumiIntegrationTestOptions:
     preview: bool = True
     up:      bool = False  # noqa: E241
     verbose: bool = False
+    precompile: bool = False  # compile the Pulumi program to bytecode in a bytecode cache shared across tests
+    retention: CheckpointRetention = None  # the retention policy applied to state file backups after each update
+    compress_state: bool = False  # store the state file and its backups compressed with gzip
+    mocks: PulumiMocks = None  # run the Pulumi program in-process against these mock providers instead of executing preview and up
+    proxy: PulumiRecordingProxy = None  # record the HTTP traffic of the test to a cassette, or replay it from the cassette
+    emulator: AWSEmulator = None  # direct the AWS provider to a local emulator, such as LocalStack or moto, instead of AWS
+    fixture: PulumiStateFixture = None  # initialize the state from this saved checkpoint instead of an empty stack
 
 
 class PulumiIntegrationTest:
@@ -57,6 +76,10 @@ class PulumiIntegrationTest:
         if self.config is None:
             self.config = []
 
+        self.emulator = opts.emulator
+        if self.emulator is not None:
+            self.config = self.emulator.config + self.config  # keys set by the test override those of the emulator
+
         self.plugins = plugins
         if self.plugins is None:
             self.plugins = []
@@ -67,23 +90,39 @@ class PulumiIntegrationTest:
         self.old_directory  = Path.cwd()
         self.tmp_directory  = self._generate_test_directory()
 
+        self._overridden_environment: Dict[str, Union[str, None]] = {}  # the values of the environment variables that only apply to this test
         self._set_pulumi_envvars()
 
         backend = utils.get_project_backend_url(path=self.tmp_directory)  # this places the pulumi state directory in the test directory
 
-        self.encryption_key, self.encryptionsalt = utils.generate_encryptionsalt(self.pulumi_config_passphrase)
+        project_name, stack_name = self._generate_names()
 
-        self.project = PulumiProject(backend=backend)
-        self.stack   = PulumiStack(encryptionsalt=self.encryptionsalt, config=self._encrypt_and_format_config())
-        self.state   = PulumiState(stack=self.stack.name, encryptionsalt=self.encryptionsalt)
+        self.encryption_key, self.encryptionsalt = self._generate_encryptionsalt()
+
+        self.project = PulumiProject(name=project_name, backend=backend)
+        self.stack   = PulumiStack(name=stack_name, encryptionsalt=self.encryptionsalt, config=self._encrypt_and_format_config())
+        self.state   = PulumiState(stack=self.stack.name, encryptionsalt=self.encryptionsalt, encryption_key=self.encryption_key, retention=self.opts.retention, compressed=self.state_compressed)
 
         self.preview = PulumiPreview(verbose=self.opts.verbose)
-        self.up      = PulumiUp(verbose=self.opts.verbose)
-        self.destroy = PulumiDestroy(verbose=self.opts.verbose)
+        self.up      = PulumiUp(verbose=self.opts.verbose, state=self.state)
+        self.destroy = PulumiDestroy(verbose=self.opts.verbose, state=self.state)
+
+        self._proxy_environment: Dict[str, Union[str, None]] = {}  # the values of the environment variables overridden by the proxy
+
+        self.mock = None
+        if self.opts.mocks is not None:
+            self.mock = PulumiMockRun(
+                mocks=self.opts.mocks, project=self.project.name, stack=self.stack.name,
+                config=self._format_mock_config(), verbose=self.opts.verbose, state=self.state
+            )
 
     def __enter__(self):
         self.setup()
 
+        if self.mock is not None:
+            self.mock.execute()  # no resources are created, so preview, up and destroy are skipped
+            return self
+
         if self.opts.preview:
             self.preview.execute()
 
@@ -93,30 +132,67 @@ class PulumiIntegrationTest:
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
-        self.delete()
-        self._change_directory('old')  # return to the starting directory
+        try:
+            self.delete()
+        finally:
+            self._change_directory('old')  # return to the starting directory
+            self._restore_environment()
 
     def setup(self) -> None:
         """ prepares the Pulumi integration test environment """
         self._copy_pulumi_code()  # copy Pulumi code directory to temp directory
         self._change_directory('test')  # change to the temp directory
+        if self.opts.precompile:
+            self._compile_pulumi_code()  # compile the Pulumi program to bytecode
         self.project.write()  # create the Pulumi project YAML file
         self.stack.write()  # create the Pulumi stack YAML file
-        self.state.write()  # initialize Pulumi state
+        if self.opts.fixture is not None:
+            self.state.seed(self.opts.fixture, project=self.project.name)  # initialize Pulumi state from the saved checkpoint
+        else:
+            self.state.write()  # initialize Pulumi state
         self._select_current_stack()  # set the current stack as active
-        self._install_pulumi_plugins()  # install plugins
+        if self.mock is None:
+            self._install_pulumi_plugins()  # install plugins, which are not used by mock providers
+        if self.opts.proxy is not None:
+            self._start_proxy()  # route the HTTP traffic of the test through the recording proxy
 
     def delete(self) -> None:
         """ deletes the workspace and temporary test directories """
-        if self.opts.destroy:
+        if self.opts.destroy and self.mock is None:
             self.destroy.execute()
 
-        if self.opts.cleanup:
-            shutil.rmtree(self.tmp_directory, ignore_errors=True)
-            try:
-                self.workspace.unlink()
-            except FileNotFoundError:
-                pass
+        try:
+            if self.opts.proxy is not None:
+                self._stop_proxy()
+        finally:
+            if self.opts.cleanup:
+                shutil.rmtree(self.tmp_directory, ignore_errors=True)
+                try:
+                    self.workspace.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _start_proxy(self) -> None:
+        """ starts the recording proxy and sets the environment variables that route HTTP requests through it """
+        self.opts.proxy.start()
+
+        self._proxy_environment = {k: os.environ.get(k) for k in self.opts.proxy.environment}
+        os.environ.update(self.opts.proxy.environment)
+
+        if self.opts.verbose:
+            print(f"Started proxy at {self.opts.proxy.url} in {self.opts.proxy.mode} mode")
+
+    def _stop_proxy(self) -> None:
+        """ stops the recording proxy, saving the cassette if recording, and restores the environment variables """
+        try:
+            self.opts.proxy.stop()
+        finally:
+            for key, value in self._proxy_environment.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            self._proxy_environment = {}
 
     def _encrypt_and_format_config(self) -> dict:
         pulumi_stack_config: Dict[str, Any] = {}
@@ -136,6 +212,25 @@ class PulumiIntegrationTest:
 
         return pulumi_stack_config
 
+    def _format_mock_config(self) -> Dict[str, str]:
+        """ returns the configuration as plaintext strings keyed by namespaced name, as read by the Pulumi SDK """
+        mock_config: Dict[str, str] = {}
+
+        for i in self.config:
+            name = i.name
+            if name.find(':') == -1:
+                name = f'{self.project.name}:{i.name}'
+
+            value = i.value
+            if isinstance(value, bytes):
+                value = utils.decode_utf8(value)
+            elif not isinstance(value, str):
+                value = json.dumps(value)
+
+            mock_config[name] = value
+
+        return mock_config
+
     def _install_pulumi_plugins(self) -> None:
         for plugin in self.plugins:
             cmd = [self.pulumi_binary, 'plugin', 'install', plugin.kind, plugin.name, plugin.version]
@@ -148,6 +243,14 @@ class PulumiIntegrationTest:
             if self.opts.verbose:
                 print(f"Installed plugin: {plugin.kind} {plugin.name} {plugin.version}")
 
+    def _generate_names(self) -> Tuple[str, str]:
+        """ returns unique names for the Pulumi project and stack """
+        return utils.generate_project_name(), utils.generate_stack_name()
+
+    def _generate_encryptionsalt(self) -> Tuple[bytes, str]:
+        """ returns the encryption key and encryptionsalt of the stack's secrets provider """
+        return utils.generate_encryptionsalt(self.pulumi_config_passphrase)
+
     def _generate_test_directory(self) -> Path:
         """ creates a temporary test directory in the current working directory """
         return Path(tempfile.mkdtemp(prefix="pitf-", dir=Path.cwd()))
@@ -172,6 +275,26 @@ class PulumiIntegrationTest:
         dst = str(self.tmp_directory)
         return dir_util.copy_tree(src, dst)
 
+    def _compile_pulumi_code(self) -> float:
+        """ compiles the Python modules in the test directory to bytecode in parallel and returns the elapsed time """
+        cmd = [utils.find_python_binary(), '-m', 'compileall', '-q', '-j', '0', str(self.tmp_directory)]
+
+        start   = time.monotonic()
+        process = subprocess.run(cmd, capture_output=True)
+
+        self.compile_time = time.monotonic() - start
+
+        if process.returncode != 0:
+            err = utils.decode_utf8(process.stdout)
+            if len(err) == 0:
+                err = utils.decode_utf8(process.stderr)
+            raise exceptions.PulumiProgramCompileError(err)
+
+        if self.opts.verbose:
+            print(f"Compiled Pulumi program in {self.compile_time:.3f}s")
+
+        return self.compile_time
+
     def _set_pulumi_envvars(self) -> None:
         # the user's environment variables take precedence over pitfall defaults
         pulumi_home              = os.environ.get('PULUMI_HOME', DEFAULT_PULUMI_HOME)
@@ -184,6 +307,18 @@ class PulumiIntegrationTest:
             'PULUMI_SKIP_UPDATE': 'true'
         }
 
+        if self.opts.compress_state:
+            # restored when the test exits, so that it does not apply to later tests of the same process
+            self._overridden_environment.setdefault('PULUMI_SELF_MANAGED_STATE_GZIP', os.environ.get('PULUMI_SELF_MANAGED_STATE_GZIP'))
+            self.pulumi_environment_variables['PULUMI_SELF_MANAGED_STATE_GZIP'] = 'true'
+
+        # share the compiled bytecode of the SDKs in site-packages across tests, eg. when site-packages is read-only.
+        # The prefix mirrors absolute paths, so the program's bytecode is still per test directory.
+        # PYTHONPYCACHEPREFIX is ignored before Python 3.8, where the SDKs use the __pycache__ of site-packages
+        if self.opts.precompile and utils.get_python_version(utils.find_python_binary()) >= PYCACHEPREFIX_MIN_PYTHON_VERSION:
+            pycache_prefix = os.environ.get('PYTHONPYCACHEPREFIX', str(Path(pulumi_home).joinpath('pycache')))
+            self.pulumi_environment_variables['PYTHONPYCACHEPREFIX'] = pycache_prefix
+
         for key, value in self.pulumi_environment_variables.items():
             os.environ[key] = value
 
@@ -192,6 +327,15 @@ class PulumiIntegrationTest:
         if envvar in os.environ:
             os.environ.pop(envvar)
 
+    def _restore_environment(self) -> None:
+        """ restores the environment variables set by `_set_pulumi_envvars` that only apply to this test """
+        for key, value in self._overridden_environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        self._overridden_environment = {}
+
     def _select_current_stack(self) -> None:
         """ selects the current stack by creating the workspace file for it """
         contents = {"stack": self.stack.name}
@@ -200,17 +344,57 @@ class PulumiIntegrationTest:
         self.workspace.write_text(json.dumps(contents))
 
     def get_stack_outputs(self) -> dict:
-        """ returns a dictionary of the stack's output properties """
+        """ returns a dictionary of the stack's output properties. These are read from the state file when available """
+        outputs = self.state.outputs
+        if outputs is not None:
+            return outputs
+
         cmd = [self.pulumi_binary, 'stack', 'output', '--json', '--non-interactive']
 
         process = subprocess.run(cmd, capture_output=True)
 
-        stdout = utils.decode_utf8(process.stdout)
+        if process.returncode != 0:
+            raise exceptions.PulumiStackOutputError(utils.decode_utf8(process.stdout))
+
+        return codec.loads(process.stdout)
+
+    def get_import_times(self) -> Dict[str, int]:
+        """ returns the cumulative import time in microseconds of each module imported by the Pulumi program """
+        program = self.tmp_directory.joinpath('__main__.py')
+        tree    = ast.parse(program.read_text())
+
+        modules: List[str] = []
+
+        for node in tree.body:
+            if isinstance(node, ast.Import):
+                names = [i.name for i in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                names = [node.module]
+            else:
+                continue
+
+            for name in names:
+                module = name.split('.')[0]
+                if module not in modules:
+                    modules.append(module)
+
+        statements = '; '.join(f'import {i}' for i in modules)
+        cmd        = [utils.find_python_binary(), '-X', 'importtime', '-c', statements]
+
+        process = subprocess.run(cmd, capture_output=True, cwd=self.tmp_directory)
+
+        stderr = utils.decode_utf8(process.stderr)
 
         if process.returncode != 0:
-            raise exceptions.PulumiStackOutputError(stdout)
+            raise exceptions.PulumiProgramImportError(stderr)
+
+        import_times = utils.parse_import_times(stderr)
+
+        if self.opts.verbose:
+            for module, microseconds in sorted(import_times.items(), key=lambda x: x[1], reverse=True):
+                print(f"{microseconds / 1000:>10.1f} ms  {module}")
 
-        return json.loads(stdout)
+        return import_times
 
     @property
     def pulumi_binary(self) -> str:
@@ -220,6 +404,11 @@ class PulumiIntegrationTest:
     def pulumi_home(self) -> str:
         return self.pulumi_environment_variables['PULUMI_HOME']
 
+    @property
+    def state_compressed(self) -> bool:
+        """ returns True if Pulumi writes the state file compressed with gzip, as set by the `compress_state` option """
+        return self.opts.compress_state
+
     @property
     def pulumi_config_passphrase(self) -> str:
         return self.pulumi_environment_variables['PULUMI_CONFIG_PASSPHRASE']
@@ -0,0 +1,319 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+from . import utils
+from os import PathLike
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+import itertools
+import json
+import sqlite3
+
+
+# the number of rows inserted per statement when exporting resources
+BATCH_SIZE = 1000
+
+ROOT_STACK_TYPE = 'pulumi:pulumi:Stack'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    stack TEXT,
+    timestamp TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS resources (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    urn TEXT NOT NULL,
+    type TEXT NOT NULL,
+    id TEXT,
+    provider TEXT,
+    parent TEXT,
+    inputs TEXT,
+    outputs TEXT,
+    dependencies TEXT,
+    key TEXT
+);
+
+CREATE TABLE IF NOT EXISTS dependencies (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    urn TEXT NOT NULL,
+    dependency TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS outputs (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    urn TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT,
+    key TEXT
+);
+
+CREATE INDEX IF NOT EXISTS resources_run ON resources (run);
+CREATE INDEX IF NOT EXISTS resources_urn ON resources (urn);
+CREATE INDEX IF NOT EXISTS resources_type ON resources (type);
+CREATE INDEX IF NOT EXISTS resources_key ON resources (key, run);
+CREATE INDEX IF NOT EXISTS dependencies_run_urn ON dependencies (run, urn);
+CREATE INDEX IF NOT EXISTS outputs_field_key ON outputs (field, key, run);
+"""
+
+
+def resource_key(urn: str) -> str:
+    """
+    returns the key of a resource that is the same in every test run, ie. its URN without the
+    `urn:pulumi:<stack>::<project>::` prefix, as pitfall generates the stack and project names
+    of each test, eg. aws:s3/bucket:Bucket::pitfall-bucket. The root stack resource, which is
+    named after the stack and project, has the key pulumi:pulumi:Stack. Keys are returned unchanged
+    """
+    if not urn.startswith('urn:pulumi:'):
+        return urn
+
+    key = urn.split('::', 2)[-1]
+    if key.startswith(ROOT_STACK_TYPE + '::'):
+        return ROOT_STACK_TYPE
+    return key
+
+
+class PulumiResourceRow:
+    """ a resource exported to the database, with the same attributes as a PulumiResource. Its properties are decoded on first access """
+    __slots__ = ('run', 'urn', 'key', 'type', 'id', 'provider', 'parent', '_inputs', '_outputs', '_dependencies')
+
+    def __init__(
+        self, run: int, urn: str, key: str, rtype: str, rid: str, provider: str, parent: str, inputs: str, outputs: str, dependencies: str
+    ) -> None:
+        self.run           = run
+        self.urn           = urn
+        self.key           = key  # the key of the resource across runs, see resource_key()
+        self.type          = rtype
+        self.id            = rid
+        self.provider      = provider
+        self.parent        = parent  # the URN of the parent resource
+        self._inputs: Union[str, dict]       = inputs
+        self._outputs: Union[str, dict]      = outputs
+        self._dependencies: Union[str, dict] = dependencies
+
+    @property
+    def inputs(self) -> dict:
+        if isinstance(self._inputs, dict):
+            return self._inputs
+        inputs: dict = json.loads(self._inputs)
+        self._inputs = inputs
+        return inputs
+
+    @property
+    def outputs(self) -> dict:
+        if isinstance(self._outputs, dict):
+            return self._outputs
+        outputs: dict = json.loads(self._outputs)
+        self._outputs = outputs
+        return outputs
+
+    @property
+    def dependencies(self) -> dict:
+        if isinstance(self._dependencies, dict):
+            return self._dependencies
+        dependencies: dict = json.loads(self._dependencies)
+        self._dependencies = dependencies
+        return dependencies
+
+    def __repr__(self):
+        return "PulumiResourceRow(run=%r, urn=%r, rtype=%r, rid=%r)" % (self.run, self.urn, self.type, self.id)
+
+
+def get_field(value: Any, field: str) -> Any:
+    """ returns the value at the dotted path `field` of nested dictionaries, eg. tags.Name, or None if it does not exist """
+    for key in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+class PulumiStateDatabase:
+    """
+    A SQLite database of the resources in the Pulumi state across many test runs. Each
+    export is recorded as a run. Resources, their dependencies and selected output fields
+    are inserted in a single transaction, and indexed by run, URN, type and key. As the
+    URNs of resources contain the names of the stack and project generated for each test,
+    resources are compared across runs by their key, see resource_key().
+
+    :type path: PathLike
+    :param path: the path of the SQLite database file, created if it does not exist. Use ':memory:' for an in-memory database
+    """
+    def __init__(self, path: Union[PathLike, str] = ':memory:') -> None:
+        if str(path) != ':memory:':
+            path = Path(path).expanduser().absolute()
+
+        self.path       = path
+        self.connection = sqlite3.connect(str(path))
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self) -> PulumiStateDatabase:
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def export(self, resources: Iterable[Any], name: str = None, stack: str = None, fields: Sequence[str] = ()) -> int:
+        """
+        inserts the resources as a new run and returns its id. The resources are either
+        PulumiResource objects or dictionaries in the format of the state file, such as
+        those yielded by PulumiState.iter_resources(). `fields` are the dotted paths of
+        outputs stored in the outputs table, eg. ("arn", "tags.Name")
+        """
+        timestamp = utils.get_current_timestamp()
+        if name is None:
+            name = timestamp
+
+        with self.connection:
+            cursor = self.connection.execute("INSERT INTO runs (name, stack, timestamp) VALUES (?, ?, ?)", (name, stack, timestamp))
+            run    = cursor.lastrowid
+
+            dependencies: List[Tuple[int, str, str]]     = []
+            outputs: List[Tuple[int, str, str, str, str]] = []
+
+            rows = self.__rows(run, resources, fields, dependencies, outputs)
+
+            while True:
+                batch = list(itertools.islice(rows, BATCH_SIZE))
+                if not batch:
+                    break
+
+                self.connection.executemany(
+                    "INSERT INTO resources (run, urn, type, id, provider, parent, inputs, outputs, dependencies, key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch
+                )
+                self.connection.executemany("INSERT INTO dependencies (run, urn, dependency) VALUES (?, ?, ?)", dependencies)
+                self.connection.executemany("INSERT INTO outputs (run, urn, field, value, key) VALUES (?, ?, ?, ?, ?)", outputs)
+
+                dependencies.clear()
+                outputs.clear()
+
+        return run
+
+    def export_state(self, state: Any, name: str = None, fields: Sequence[str] = ()) -> int:
+        """ streams the resources of the current state file of a PulumiState into a new run and returns its id """
+        return self.export(state.iter_resources(), name=name, stack=state.stack, fields=fields)
+
+    @staticmethod
+    def __rows(run: int, resources: Iterable[Any], fields: Sequence[str], dependencies: list, outputs: list) -> Iterator[tuple]:
+        """ yields the rows of the resources table, appending the rows of the dependencies and outputs tables to the lists """
+        for i in resources:
+            if isinstance(i, dict):
+                urn, rtype, rid, provider, parent = i["urn"], i["type"], i.get("id"), i.get("provider"), i.get("parent")
+                inputs, resource_outputs          = i.get("inputs", {}), i.get("outputs", {})
+                property_dependencies, depends_on = i.get("propertyDependencies", {}), i.get("dependencies", [])
+            else:
+                urn, rtype, rid, provider = i.urn, i.type, i.id, i.provider
+                parent                    = None if i.parent is None else i.parent.urn
+                inputs, resource_outputs  = i.inputs, i.outputs
+                property_dependencies     = i.dependencies
+                depends_on                = i.depends_on
+
+            key = resource_key(urn)
+
+            for dependency in depends_on or []:
+                dependencies.append((run, urn, dependency))
+
+            for field in fields:
+                value = get_field(resource_outputs, field)
+                if value is not None:
+                    outputs.append((run, urn, field, json.dumps(value), key))
+
+            yield (
+                run, urn, rtype, rid, provider, parent,
+                json.dumps(inputs, separators=(',', ':')),
+                json.dumps(resource_outputs, separators=(',', ':')),
+                json.dumps(property_dependencies, separators=(',', ':')),
+                key
+            )
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """ returns the runs in the order they were exported """
+        cursor = self.connection.execute("SELECT id, name, stack, timestamp FROM runs ORDER BY id")
+        return [dict(zip(("id", "name", "stack", "timestamp"), i)) for i in cursor]
+
+    def query(self, where: str = None, params: Sequence[Any] = (), **criteria: Any) -> List[PulumiResourceRow]:
+        """
+        returns the exported resources matching the criteria on the columns of the resources
+        table, eg. query(type="aws:s3/bucket:Bucket", run=3), and an optional SQL `where`
+        clause with `params`, eg. query("id LIKE ?", ["vpc-%"])
+        """
+        columns = ("run", "urn", "key", "type", "id", "provider", "parent")
+
+        clauses: List[str] = []
+        values: List[Any]  = []
+
+        for name, value in criteria.items():
+            if name not in columns:
+                raise ValueError(f"Cannot query resources by {name!r}. Supported: {', '.join(columns)}")
+            clauses.append(f"{name} = ?")
+            values.append(value)
+
+        if where is not None:
+            clauses.append(f"({where})")
+            values.extend(params)
+
+        sql = "SELECT run, urn, key, type, id, provider, parent, inputs, outputs, dependencies FROM resources"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY run, rowid"
+
+        return [PulumiResourceRow(*i) for i in self.connection.execute(sql, values)]
+
+    def counts(self, run: int = None) -> Dict[str, int]:
+        """ returns the number of resources of each type, in all runs or in a single run """
+        sql, values = "SELECT type, COUNT(*) FROM resources", []
+        if run is not None:
+            sql += " WHERE run = ?"
+            values.append(run)
+        sql += " GROUP BY type ORDER BY type"
+
+        return dict(self.connection.execute(sql, values).fetchall())
+
+    def replacements(self, rtype: str = None) -> Dict[str, int]:
+        """ returns the number of times each resource was replaced across runs by key, ie. the number of times its id changed from one run to the next """
+        sql, values = "SELECT key, id FROM resources WHERE id IS NOT NULL", []
+        if rtype is not None:
+            sql += " AND type = ?"
+            values.append(rtype)
+        sql += " ORDER BY key, run"
+
+        results: Dict[str, int] = {}
+        for key, rows in itertools.groupby(self.connection.execute(sql, values), lambda x: x[0]):
+            ids     = [i[1] for i in rows]
+            changes = sum(1 for previous, current in zip(ids, ids[1:]) if previous != current)
+            if changes > 0:
+                results[key] = changes
+        return results
+
+    def values(self, field: str, key: str = None) -> Dict[str, Dict[int, Any]]:
+        """
+        returns the values of an exported output field of each resource by key and run, eg. to find tags that drift.
+        `key` selects a single resource by its key or by its URN in any run
+        """
+        sql, values = "SELECT key, run, value FROM outputs WHERE field = ?", [field]
+        if key is not None:
+            sql += " AND key = ?"
+            values.append(resource_key(key))
+        sql += " ORDER BY key, run"
+
+        results: Dict[str, Dict[int, Any]] = {}
+        for key, run, value in self.connection.execute(sql, values):
+            results.setdefault(key, {})[run] = json.loads(value)
+        return results
@@ -0,0 +1,151 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+
+@dataclass
+class PulumiPropertyChange:
+    """ a change to a single property of a resource. `path` is the dotted path of the property, eg. outputs.tags.Name """
+    path: str
+    old: Any = None
+    new: Any = None
+    kind: str = 'update'  # one of: add, delete, update
+
+
+@dataclass
+class PulumiResourceChange:
+    """ a resource that differs between two checkpoints along with the changes to its properties """
+    urn: str
+    type: str
+    operation: str  # one of: add, remove, replace, update
+    old: Union[dict, None] = field(default=None, repr=False)
+    new: Union[dict, None] = field(default=None, repr=False)
+    properties: List[PulumiPropertyChange] = field(default_factory=list)
+
+
+@dataclass
+class PulumiCheckpointDiff:
+    """ the resources added, removed, replaced (id changed) and updated between two checkpoints """
+    added: List[PulumiResourceChange] = field(default_factory=list)
+    removed: List[PulumiResourceChange] = field(default_factory=list)
+    replaced: List[PulumiResourceChange] = field(default_factory=list)
+    updated: List[PulumiResourceChange] = field(default_factory=list)
+    unchanged: int = 0
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.replaced) + len(self.updated)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @property
+    def changes(self) -> List[PulumiResourceChange]:
+        return self.added + self.removed + self.replaced + self.updated
+
+    @property
+    def summary(self) -> Dict[str, int]:
+        """ returns the number of resources for each operation """
+        return {
+            "add": len(self.added),
+            "remove": len(self.removed),
+            "replace": len(self.replaced),
+            "update": len(self.updated),
+            "same": self.unchanged
+        }
+
+
+def diff_properties(old: Any, new: Any, path: str = '') -> List[PulumiPropertyChange]:
+    """ returns the changes between two nested values, descending into dictionaries and lists """
+    changes: List[PulumiPropertyChange] = []
+
+    stack: List[Tuple[str, Any, Any]] = [(path, old, new)]
+
+    while stack:
+        p, a, b = stack.pop()
+
+        if a == b:
+            continue
+
+        if isinstance(a, dict) and isinstance(b, dict):
+            for k in b:
+                subpath = f'{p}.{k}' if p else k
+                if k not in a:
+                    changes.append(PulumiPropertyChange(path=subpath, new=b[k], kind='add'))
+                else:
+                    stack.append((subpath, a[k], b[k]))
+            for k in a:
+                if k not in b:
+                    changes.append(PulumiPropertyChange(path=f'{p}.{k}' if p else k, old=a[k], kind='delete'))
+
+        elif isinstance(a, list) and isinstance(b, list):
+            for n in range(max(len(a), len(b))):
+                subpath = f'{p}[{n}]'
+                if n >= len(a):
+                    changes.append(PulumiPropertyChange(path=subpath, new=b[n], kind='add'))
+                elif n >= len(b):
+                    changes.append(PulumiPropertyChange(path=subpath, old=a[n], kind='delete'))
+                else:
+                    stack.append((subpath, a[n], b[n]))
+
+        else:
+            changes.append(PulumiPropertyChange(path=p, old=a, new=b))
+
+    changes.sort(key=lambda x: x.path)
+    return changes
+
+
+def _resources(checkpoint: Union[dict, Iterable[dict]]) -> Dict[str, dict]:
+    """ returns the resources by URN of a checkpoint or an iterable of resources in the format of the state file """
+    if isinstance(checkpoint, dict):
+        checkpoint = (checkpoint.get("checkpoint") or {}).get("latest", {}).get("resources") or []
+    return {i["urn"]: i for i in checkpoint}
+
+
+def diff_checkpoints(old: Union[dict, Iterable[dict]], new: Union[dict, Iterable[dict]]) -> PulumiCheckpointDiff:
+    """
+    compares two checkpoints by resource URN. Each checkpoint is either the contents of a state
+    file (current, previous or a backup) or an iterable of resources in the format of the state file.
+    Unchanged resources are skipped with a single equality check, which compares the parsed
+    JSON natively and is much faster than hashing a serialized copy of each resource
+    """
+    old_resources = _resources(old)
+    new_resources = _resources(new)
+
+    result = PulumiCheckpointDiff()
+
+    for urn, b in new_resources.items():
+        a = old_resources.get(urn)
+
+        if a is None:
+            result.added.append(PulumiResourceChange(urn=urn, type=b.get("type"), operation='add', new=b))
+            continue
+
+        if a == b:
+            result.unchanged += 1
+            continue
+
+        properties = diff_properties({k: v for k, v in a.items() if k != "urn"}, {k: v for k, v in b.items() if k != "urn"})
+
+        if a.get("id") != b.get("id"):
+            result.replaced.append(PulumiResourceChange(urn=urn, type=b.get("type"), operation='replace', old=a, new=b, properties=properties))
+        else:
+            result.updated.append(PulumiResourceChange(urn=urn, type=b.get("type"), operation='update', old=a, new=b, properties=properties))
+
+    for urn, a in old_resources.items():
+        if urn not in new_resources:
+            result.removed.append(PulumiResourceChange(urn=urn, type=a.get("type"), operation='remove', old=a))
+
+    return result
@@ -23,6 +23,10 @@ class PulumiVersionExecError(Exception):
     """ raised when `pulumi version` returns non-zero exit code """
 
 
+class PythonVersionExecError(Exception):
+    """ raised when the Python interpreter of the language host fails to report its version """
+
+
 class PulumiPluginInstallError(Exception):
     """ raised when pulumi fails to install a plugin """
 
@@ -41,3 +45,57 @@ class PulumiUpExecError(Exception):
 
 class PulumiDestroyExecError(Exception):
     """ raised when `pulumi destroy` returns non-zero exit code """
+
+
+class PulumiProgramCompileError(Exception):
+    """ raised when the Pulumi program fails to compile to bytecode """
+
+
+class PulumiProgramImportError(Exception):
+    """ raised when the modules imported by the Pulumi program fail to import """
+
+
+class PulumiSecretDecryptionError(Exception):
+    """ raised when a Pulumi secret cannot be decrypted """
+
+
+class PulumiDependencyCycleError(Exception):
+    """ raised when the dependencies between resources in the Pulumi state form a cycle """
+
+
+class PulumiStackPoolTimeoutError(Exception):
+    """ raised when no stack of a pool becomes available to lease before the timeout """
+
+
+class PulumiProxyRecordingError(Exception):
+    """ raised when the recording proxy stops in record mode without having recorded any interaction """
+
+
+class PulumiFixtureError(Exception):
+    """ raised when the checkpoint of a state fixture cannot be rebased onto the stack of a test """
+
+
+class PulumiStackGraphError(Exception):
+    """ raised when stacks of a StackGraph fail to deploy or destroy """
+    def __init__(self, errors, skipped):
+        self.errors  = errors
+        self.skipped = skipped
+
+        lines = [f'{len(errors)} stack(s) failed and {len(skipped)} were skipped:']
+        for name, error in errors.items():
+            lines.append(f'  {name}: {error}')
+        for name in skipped:
+            lines.append(f'  {name}: skipped')
+        super().__init__('\n'.join(lines))
+
+
+class PulumiSnapshotMismatchError(AssertionError):
+    """ raised when a value does not match its snapshot """
+    def __init__(self, name, changes):
+        self.name    = name
+        self.changes = changes
+
+        lines = [f'snapshot {name!r} does not match:']
+        for i in changes:
+            lines.append(f'  {i.kind} {i.path}: {i.old!r} -> {i.new!r}')
+        super().__init__('\n'.join(lines))
@@ -0,0 +1,213 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from anytree import AbstractStyle, ContStyle
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple, Union
+from xml.sax.saxutils import escape, quoteattr
+import json
+
+
+FORMATS = ('dot', 'graphml', 'json')
+
+
+def format_node_name(node: Any) -> str:
+    """ formats the node name to 'node.type (node.id)' """
+    s = node.type
+    if node.id:
+        s += f" ({node.id})"
+    return s
+
+
+def find_roots(resources: Iterable[Any]) -> List[Any]:
+    """ returns the resources without a parent, in their original order """
+    return [i for i in resources if i.parent is None]
+
+
+def walk(roots: Iterable[Any]) -> Iterator[Tuple[Any, Tuple[bool, ...]]]:
+    """
+    yields each node of the trees in depth-first pre-order without recursion, along with
+    a tuple that records for each of its ancestors and itself whether more siblings follow
+    """
+    stack: List[Tuple[Any, Tuple[bool, ...]]] = [(i, ()) for i in reversed(list(roots))]
+
+    while stack:
+        node, continues = stack.pop()
+        yield node, continues
+
+        children = node.children
+        last     = len(children) - 1
+        for n in range(last, -1, -1):
+            stack.append((children[n], continues + (n != last,)))
+
+
+def render_tree(roots: Iterable[Any], fp: IO[str], style: Union[AbstractStyle, type] = ContStyle, nodenamefunc: Callable[[Any], str] = format_node_name) -> None:
+    """ writes the trees line by line to fp, producing the same output as anytree's RenderTree """
+    if isinstance(style, type):
+        style = style()
+
+    for node, continues in walk(roots):
+        if continues:
+            indent = ''.join(style.vertical if i else style.empty for i in continues[:-1])
+            branch = style.cont if continues[-1] else style.end
+            fp.write(f'{indent}{branch}{nodenamefunc(node)}\n')
+        else:
+            fp.write(f'{nodenamefunc(node)}\n')
+
+
+class PulumiGraphExporter:
+    """
+    Writes the resources tree to a file as a graph in the DOT, GraphML or JSON format. Nodes and
+    edges are written as the tree is walked iteratively, so no representation of the whole graph
+    is built in memory.
+
+    :type resources: PulumiResources
+    :param resources: the resources to export
+
+    :type dependencies: bool
+    :param dependencies: also draw an edge from each resource to the resources it depends on
+
+    :type collapse: Iterable[str]
+    :param collapse: the types of resources whose descendants are collapsed into them, eg. component resources
+
+    :type nodenamefunc: Callable
+    :param nodenamefunc: returns the label of a node. Defaults to 'type (id)'
+
+    :type roots: Iterable[PulumiResource]
+    :param roots: the roots of the trees to export. Defaults to all resources without a parent
+    """
+    def __init__(
+        self, resources: Any, dependencies: bool = False, collapse: Iterable[str] = None,
+        nodenamefunc: Callable[[Any], str] = format_node_name, roots: Iterable[Any] = None
+    ) -> None:
+        self.resources    = resources
+        self.dependencies = dependencies
+        self.collapse     = set(collapse or ())
+        self.nodenamefunc = nodenamefunc
+        self.roots        = find_roots(resources) if roots is None else list(roots)
+
+        self._visible: Set[str]         = set()
+        self._collapsed: Dict[str, str] = {}  # urn of a collapsed resource -> urn of the resource it is collapsed into
+
+    def nodes(self) -> Iterator[Tuple[Any, int]]:
+        """ yields the visible nodes and the number of descendants collapsed into each """
+        self._visible, self._collapsed = set(), {}
+
+        stack = list(reversed(self.roots))
+
+        while stack:
+            node = stack.pop()
+            self._visible.add(node.urn)
+
+            if node.type in self.collapse:
+                count = 0
+                for descendant, _ in walk(node.children):
+                    self._collapsed[descendant.urn] = node.urn
+                    count += 1
+                yield node, count
+            else:
+                yield node, 0
+                stack.extend(reversed(node.children))
+
+    def edges(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        yields the edges between visible nodes as (source, target, kind), where kind is parent or dependency.
+        Dependencies of collapsed resources are drawn from and to the resources they are collapsed into.
+        Must be called after nodes() is consumed
+        """
+        seen: Set[Tuple[str, str]] = set()
+
+        for node, _ in walk(self.roots):
+            if node.urn in self._visible and node.parent is not None:
+                yield node.parent.urn, node.urn, 'parent'
+
+            if not self.dependencies:
+                continue
+
+            source = self._collapsed.get(node.urn, node.urn)
+
+            urns = list(node.depends_on or [])
+            for i in (node.dependencies or {}).values():
+                urns.extend(i or [])
+
+            for urn in urns:
+                target = self._collapsed.get(urn, urn)
+                if target in self._visible and source != target and (source, target) not in seen:
+                    seen.add((source, target))
+                    yield source, target, 'dependency'
+
+    def label(self, node: Any, collapsed: int) -> str:
+        label = self.nodenamefunc(node)
+        if collapsed:
+            label += f" [+{collapsed}]"
+        return label
+
+    def write(self, fp: IO[str], fmt: str = 'dot') -> None:
+        """ writes the graph to the file object fp in the format `fmt` (ie. dot, graphml, json) """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported graph format: {fmt!r}. Supported: {', '.join(FORMATS)}")
+        getattr(self, f'write_{fmt}')(fp)
+
+    def write_dot(self, fp: IO[str]) -> None:
+        fp.write('digraph tree {\n')
+
+        for node, collapsed in self.nodes():
+            fp.write(f'    {dot_quote(node.urn)} [label={dot_quote(self.label(node, collapsed))}];\n')
+
+        for source, target, kind in self.edges():
+            attributes = ' [style=dashed]' if kind == 'dependency' else ''
+            fp.write(f'    {dot_quote(source)} -> {dot_quote(target)}{attributes};\n')
+
+        fp.write('}\n')
+
+    def write_graphml(self, fp: IO[str]) -> None:
+        fp.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        fp.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        fp.write('  <key id="label" for="node" attr.name="label" attr.type="string"/>\n')
+        fp.write('  <key id="type" for="node" attr.name="type" attr.type="string"/>\n')
+        fp.write('  <key id="collapsed" for="node" attr.name="collapsed" attr.type="int"/>\n')
+        fp.write('  <key id="kind" for="edge" attr.name="kind" attr.type="string"/>\n')
+        fp.write('  <graph id="resources" edgedefault="directed">\n')
+
+        for node, collapsed in self.nodes():
+            fp.write(
+                f'    <node id={quoteattr(node.urn)}>'
+                f'<data key="label">{escape(self.label(node, collapsed))}</data>'
+                f'<data key="type">{escape(node.type)}</data>'
+                f'<data key="collapsed">{collapsed}</data></node>\n'
+            )
+
+        for source, target, kind in self.edges():
+            fp.write(f'    <edge source={quoteattr(source)} target={quoteattr(target)}><data key="kind">{kind}</data></edge>\n')
+
+        fp.write('  </graph>\n')
+        fp.write('</graphml>\n')
+
+    def write_json(self, fp: IO[str]) -> None:
+        fp.write('{"nodes": [')
+
+        for n, (node, collapsed) in enumerate(self.nodes()):
+            item = {"id": node.urn, "label": self.label(node, collapsed), "type": node.type, "resource_id": node.id, "collapsed": collapsed}
+            fp.write((',\n' if n else '\n') + json.dumps(item))
+
+        fp.write('\n], "edges": [')
+
+        for n, (source, target, kind) in enumerate(self.edges()):
+            fp.write((',\n' if n else '\n') + json.dumps({"source": source, "target": target, "kind": kind}))
+
+        fp.write('\n]}\n')
+
+
+def dot_quote(s: str) -> str:
+    """ returns s as a quoted DOT identifier """
+    return '"' + s.replace('\\', '\\\\').replace('"', '\\"') + '"'
@@ -0,0 +1,204 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+from . import codec
+from . import exceptions
+from . import secrets
+from . import utils
+from .config import DEFAULT_PULUMI_CONFIG_PASSPHRASE
+from os import PathLike
+from pathlib import Path
+from typing import Any, Dict, Iterable, Match, Pattern, Union
+import gzip
+import json
+import re
+
+
+# the keys of the secrets provider in the checkpoint, which differs between versions of pitfall and Pulumi
+SECRETS_PROVIDER_KEYS = ('secrets_providers', 'secrets_provider')
+
+# the stack and project names generated by pitfall, and the name of their root stack resource. Only these are unique
+# enough to be replaced in resource properties, where a name such as `dev` is as likely to be an unrelated value
+GENERATED_NAME = re.compile(r'pitf-project-[0-9a-f]{16}(-pitf-stack-[0-9a-f]{16})?|pitf-stack-[0-9a-f]{16}')
+
+
+class PulumiStateFixture:
+    """
+    A checkpoint saved from a deployed stack, used to initialize the state of a new test so that
+    preview and up start from an existing deployment instead of an empty stack.
+
+    The stack and project names of the checkpoint are replaced with those of the test, in the URNs
+    of resources and, if `rename_values` is set and they were generated by pitfall, wherever else they
+    appear as a name in resource inputs and outputs, eg. in tags. Secrets are decrypted with the passphrase of the saved stack
+    and encrypted again with the encryption key of the test.
+
+    :type path: Path
+    :param path: the path of the checkpoint, a JSON file which may be compressed with gzip
+
+    :type passphrase: str
+    :param passphrase: the passphrase of the stack the checkpoint was saved from
+
+    :type rename_values: bool
+    :param rename_values: replace the stack and project names in strings other than URNs, if they were generated by pitfall
+    """
+    def __init__(self, path: Union[str, PathLike], passphrase: str = DEFAULT_PULUMI_CONFIG_PASSPHRASE, rename_values: bool = True) -> None:
+        self.path          = Path(path).absolute()
+        self.passphrase    = passphrase
+        self.rename_values = rename_values
+
+        self._checkpoint: Union[dict, None] = None
+        self._encryption_key: Union[bytes, None] = None
+
+    def __repr__(self):
+        return f"PulumiStateFixture(path={str(self.path)!r})"
+
+    @classmethod
+    def save(cls, checkpoint: dict, path: Union[str, PathLike], passphrase: str = DEFAULT_PULUMI_CONFIG_PASSPHRASE) -> PulumiStateFixture:
+        """ saves a checkpoint, eg. `PulumiState.current` after the baseline was deployed, as a fixture. It is compressed if the path ends in .gz """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        contents = json.dumps(checkpoint, indent=4)
+
+        if path.suffix == '.gz':
+            with gzip.open(path, 'wt') as f:
+                f.write(contents)
+        else:
+            path.write_text(contents)
+
+        return cls(path=path, passphrase=passphrase)
+
+    @property
+    def checkpoint(self) -> dict:
+        """ returns the saved checkpoint, which is read once and must not be modified in place """
+        if self._checkpoint is None:
+            self._checkpoint = codec.load_file(self.path)
+        return self._checkpoint
+
+    @property
+    def latest(self) -> dict:
+        return self.checkpoint["checkpoint"].get("latest") or {}
+
+    @property
+    def stack(self) -> str:
+        """ returns the name of the stack the checkpoint was saved from """
+        return self.checkpoint["checkpoint"]["stack"]
+
+    @property
+    def project(self) -> Union[str, None]:
+        """ returns the name of the project the checkpoint was saved from, parsed from the URN of its first resource """
+        for resource in self.latest.get("resources") or []:
+            return resource["urn"].split("::")[1]
+        return None
+
+    @property
+    def encryptionsalt(self) -> Union[str, None]:
+        """ returns the encryptionsalt of the stack the checkpoint was saved from """
+        for key in SECRETS_PROVIDER_KEYS:
+            provider = self.latest.get(key)
+            if provider is not None:
+                return provider.get("state", {}).get("salt")
+        return None
+
+    @property
+    def encryption_key(self) -> bytes:
+        """ returns the encryption key of the secrets in the checkpoint. Derived on first use, as it is slow by design """
+        if self._encryption_key is None:
+            encryptionsalt = self.encryptionsalt
+            if encryptionsalt is None:
+                raise exceptions.PulumiFixtureError(f'The checkpoint of {self.path} has secrets but no encryptionsalt to decrypt them with')
+            self._encryption_key = utils.get_encryption_key(self.passphrase, encryptionsalt)
+        return self._encryption_key
+
+    def rebase(self, stack: str, project: str, encryptionsalt: str, encryption_key: bytes) -> dict:
+        """ returns a copy of the checkpoint for the stack and project of a test, with its secrets encrypted with the test's encryption key """
+        return _Rebase(fixture=self, stack=stack, project=project, encryption_key=encryption_key).checkpoint(encryptionsalt)
+
+
+class _Rebase:
+    """ rewrites a copy of the checkpoint of a fixture for another stack """
+    def __init__(self, fixture: PulumiStateFixture, stack: str, project: str, encryption_key: bytes) -> None:
+        self.fixture        = fixture
+        self.encryption_key = encryption_key
+
+        old_project = fixture.project or project
+
+        self.old_urn_prefix = f'urn:pulumi:{fixture.stack}::{old_project}::'
+        self.new_urn_prefix = f'urn:pulumi:{stack}::{project}::'
+
+        # the name of the root stack resource is <project>-<stack>
+        self.names = {f'{old_project}-{fixture.stack}': f'{project}-{stack}', fixture.stack: stack, old_project: project}
+        self.names = {k: v for k, v in self.names.items() if k != v}
+
+        self.pattern       = self._compile(self.names)
+        self.value_pattern = self._compile([i for i in self.names if GENERATED_NAME.fullmatch(i)])
+
+        self.ciphertexts: Dict[str, str] = {}  # re-encrypted secrets by their original ciphertext
+
+        self.stack = stack
+
+    def checkpoint(self, encryptionsalt: str) -> dict:
+        checkpoint = self.rewrite(self.fixture.checkpoint)
+        checkpoint["checkpoint"]["stack"] = self.stack
+
+        latest = checkpoint["checkpoint"].get("latest") or {}
+        for key in SECRETS_PROVIDER_KEYS:
+            if key in latest:
+                latest[key] = {"type": "passphrase", "state": {"salt": encryptionsalt}}
+
+        return checkpoint
+
+    def rewrite(self, value: Any) -> Any:
+        if secrets.is_secret(value):
+            return dict(value, ciphertext=self.reencrypt(value["ciphertext"]))
+        elif isinstance(value, dict):
+            return {k: self.rewrite(v) for k, v in value.items()}
+        elif isinstance(value, list):
+            return [self.rewrite(i) for i in value]
+        elif isinstance(value, str):
+            return self.rename(value)
+        return value
+
+    def rename(self, value: str) -> str:
+        if value.startswith(self.old_urn_prefix):
+            rest = value[len(self.old_urn_prefix):]
+            if rest.startswith('pulumi:pulumi:Stack::'):
+                rest = self._sub(self.pattern, rest)
+            elif self.fixture.rename_values:
+                rest = self._sub(self.value_pattern, rest)
+            return self.new_urn_prefix + rest
+
+        if self.fixture.rename_values:
+            return self._sub(self.value_pattern, value)
+
+        return value
+
+    @staticmethod
+    def _compile(names: Iterable[str]) -> Union[Pattern, None]:
+        """ returns a pattern that matches any of the names as a whole word, or None if there are none """
+        alternatives = '|'.join(re.escape(i) for i in sorted(names, key=len, reverse=True))
+        return re.compile(rf'(?<![A-Za-z0-9])({alternatives})(?![A-Za-z0-9])') if alternatives else None
+
+    def _sub(self, pattern: Union[Pattern, None], value: str) -> str:
+        return value if pattern is None else pattern.sub(self._replace, value)
+
+    def _replace(self, match: Match) -> str:
+        return self.names[match.group(1)]
+
+    def reencrypt(self, ciphertext: str) -> str:
+        if ciphertext not in self.ciphertexts:
+            plaintext = utils.get_decrypted_secret(ciphertext, self.fixture.encryption_key)
+            self.ciphertexts[ciphertext] = utils.get_encrypted_secret(plaintext, self.encryption_key)
+        return self.ciphertexts[ciphertext]
@@ -0,0 +1,149 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+from . import exceptions
+from collections import deque
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class PulumiDependencyGraph:
+    """
+    The dependency graph of the resources in the Pulumi state. A resource depends on
+    the resources listed in its `dependencies` and `propertyDependencies` in the state
+    file. Edges to resources that are not in the graph are ignored.
+
+    :type durations: dict
+    :param durations: optional mapping of resource URN to the measured duration of its operation in seconds
+    """
+    def __init__(self, durations: Dict[str, float] = None) -> None:
+        self.durations = durations or {}
+
+        self.dependencies: Dict[str, List[str]] = {}  # urn -> the urns it depends on
+        self.dependents: Dict[str, List[str]]   = {}  # urn -> the urns that depend on it
+
+    def __len__(self) -> int:
+        return len(self.dependencies)
+
+    def __contains__(self, urn: str) -> bool:
+        return urn in self.dependencies
+
+    @classmethod
+    def from_resources(cls, resources: Iterable[Any], durations: Dict[str, float] = None) -> PulumiDependencyGraph:
+        """ builds the dependency graph of an iterable of PulumiResource objects in O(V+E) """
+        graph = cls(durations=durations)
+
+        edges: Dict[str, List[str]] = {}
+
+        for i in resources:
+            graph.add_node(i.urn)
+
+            urns = list(i.depends_on or [])
+            for v in (i.dependencies or {}).values():
+                urns.extend(v or [])
+            edges[i.urn] = urns
+
+        for urn, urns in edges.items():
+            for dependency in dict.fromkeys(urns):  # removes duplicates while preserving order
+                if dependency in graph.dependencies and dependency != urn:
+                    graph.add_edge(urn, dependency)
+
+        return graph
+
+    def add_node(self, urn: str) -> None:
+        self.dependencies.setdefault(urn, [])
+        self.dependents.setdefault(urn, [])
+
+    def add_edge(self, urn: str, dependency: str) -> None:
+        """ records that the resource `urn` depends on the resource `dependency` """
+        self.add_node(urn)
+        self.add_node(dependency)
+        self.dependencies[urn].append(dependency)
+        self.dependents[dependency].append(urn)
+
+    @property
+    def fan_in(self) -> Dict[str, int]:
+        """ returns the number of resources each resource depends on """
+        return {k: len(v) for k, v in self.dependencies.items()}
+
+    @property
+    def fan_out(self) -> Dict[str, int]:
+        """ returns the number of resources that depend on each resource """
+        return {k: len(v) for k, v in self.dependents.items()}
+
+    def duration(self, urn: str) -> float:
+        """ returns the measured duration of the resource's operation. Resources without a measurement count as 1 """
+        return self.durations.get(urn, 1.0)
+
+    def topological_order(self) -> List[str]:
+        """ returns the URNs ordered so that every resource follows the resources it depends on (Kahn's algorithm) """
+        remaining = self.fan_in
+        queue     = deque(k for k, v in remaining.items() if v == 0)
+        order     = []
+
+        while queue:
+            urn = queue.popleft()
+            order.append(urn)
+
+            for dependent in self.dependents[urn]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    queue.append(dependent)
+
+        if len(order) != len(self.dependencies):
+            cycle = sorted(k for k, v in remaining.items() if v > 0)
+            raise exceptions.PulumiDependencyCycleError(f"The resources have a dependency cycle: {', '.join(cycle)}")
+
+        return order
+
+    def levels(self) -> List[List[str]]:
+        """ groups the resources into levels that could be deployed concurrently once the previous levels are deployed """
+        depth: Dict[str, int] = {}
+        levels: List[List[str]] = []
+
+        for urn in self.topological_order():
+            d = max((depth[i] + 1 for i in self.dependencies[urn]), default=0)
+            depth[urn] = d
+            if d == len(levels):
+                levels.append([])
+            levels[d].append(urn)
+
+        return levels
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        returns the longest dependency chain and its total duration. Chains are weighted
+        by the measured durations where they exist, otherwise by their number of resources
+        """
+        finish: Dict[str, float] = {}
+        previous: Dict[str, str] = {}
+        end, longest             = None, 0.0
+
+        for urn in self.topological_order():
+            start = 0.0
+            for dependency in self.dependencies[urn]:
+                if finish[dependency] > start:
+                    start = finish[dependency]
+                    previous[urn] = dependency
+
+            finish[urn] = start + self.duration(urn)
+            if end is None or finish[urn] > longest:
+                end, longest = urn, finish[urn]
+
+        path = []
+        while end is not None:
+            path.append(end)
+            end = previous.get(end)
+
+        return path[::-1], longest
@@ -0,0 +1,165 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+from pitfall.config import PulumiConfigurationKey
+from pitfall.helpers.aws.utils import DEFAULT_REGION
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+import boto3
+import botocore.config
+import json
+import os
+import socket
+import threading
+
+
+LOCALSTACK_ENDPOINT = 'http://localhost:4566'
+MOTO_ENDPOINT       = 'http://localhost:5000'
+
+# the services whose endpoints are set in the AWS provider's configuration
+DEFAULT_SERVICES = (
+    'acm', 'apigateway', 'cloudformation', 'cloudwatch', 'cloudwatchevents', 'cloudwatchlogs', 'dynamodb', 'ec2',
+    'ecr', 'ecs', 'eks', 'elasticache', 'es', 'firehose', 'iam', 'kinesis', 'kms', 'lambda', 'rds', 'redshift',
+    'route53', 's3', 'secretsmanager', 'ses', 'sns', 'sqs', 'ssm', 'stepfunctions', 'sts'
+)
+
+# boto3 clients shared by all emulators with the same endpoint, region and credentials
+_clients: Dict[Tuple[str, ...], Any] = {}
+_clients_lock = threading.Lock()
+
+
+class AWSEmulator:
+    """
+    A profile for running tests against a local AWS emulator, such as LocalStack or moto's server mode,
+    instead of AWS. It provides the AWS provider configuration that points every service endpoint at the
+    emulator, and boto3 clients for the same endpoint that are pooled across tests.
+
+    :type endpoint: str
+    :param endpoint: the URL of the emulator
+
+    :type region: str
+    :param region: the AWS region
+
+    :type services: Tuple[str]
+    :param services: the services whose endpoints are set in the provider configuration
+
+    :type endpoints: Dict[str, str]
+    :param endpoints: per-service endpoints that override `endpoint`, eg. {"s3": "http://localhost:4572"} for legacy LocalStack ports
+
+    :type access_key: str
+    :param access_key: the fake AWS Access Key
+
+    :type secret_key: str
+    :param secret_key: the fake AWS Secret Key
+    """
+    def __init__(
+        self, endpoint: str = LOCALSTACK_ENDPOINT, region: str = DEFAULT_REGION, services: Tuple[str, ...] = DEFAULT_SERVICES,
+        endpoints: Dict[str, str] = None, access_key: str = 'integration-testing', secret_key: str = 'integration-testing'
+    ) -> None:
+        self.endpoint   = endpoint.rstrip('/')
+        self.region     = region
+        self.services   = tuple(services)
+        self.endpoints  = dict(endpoints or {})
+        self.access_key = access_key
+        self.secret_key = secret_key
+
+    def __repr__(self):
+        return "AWSEmulator(endpoint=%r, region=%r)" % (self.endpoint, self.region)
+
+    @classmethod
+    def localstack(cls, endpoint: str = None, **kwargs: Any) -> AWSEmulator:
+        """ returns the profile of LocalStack, at the LOCALSTACK_ENDPOINT environment variable or http://localhost:4566 """
+        return cls(endpoint=endpoint or os.environ.get('LOCALSTACK_ENDPOINT', LOCALSTACK_ENDPOINT), **kwargs)
+
+    @classmethod
+    def moto(cls, endpoint: str = None, **kwargs: Any) -> AWSEmulator:
+        """ returns the profile of moto's server mode, at the MOTO_ENDPOINT environment variable or http://localhost:5000 """
+        return cls(endpoint=endpoint or os.environ.get('MOTO_ENDPOINT', MOTO_ENDPOINT), **kwargs)
+
+    def endpoint_url(self, service: str) -> str:
+        """ returns the endpoint of a service """
+        return self.endpoints.get(service, self.endpoint)
+
+    @property
+    def config(self) -> List[PulumiConfigurationKey]:
+        """ returns the configuration of the AWS provider that directs all requests to the emulator """
+        services  = self.services + tuple(i for i in self.endpoints if i not in self.services)
+        endpoints = [{i: self.endpoint_url(i) for i in services}]
+
+        return [
+            PulumiConfigurationKey(name='aws:region', value=self.region),
+            PulumiConfigurationKey(name='aws:accessKey', value=self.access_key),
+            PulumiConfigurationKey(name='aws:secretKey', value=self.secret_key.encode('utf-8'), encrypted=True),
+            PulumiConfigurationKey(name='aws:endpoints', value=json.dumps(endpoints)),
+            PulumiConfigurationKey(name='aws:s3ForcePathStyle', value=True),
+            PulumiConfigurationKey(name='aws:skipCredentialsValidation', value=True),
+            PulumiConfigurationKey(name='aws:skipGetEc2Platforms', value=True),
+            PulumiConfigurationKey(name='aws:skipMetadataApiCheck', value=True),
+            PulumiConfigurationKey(name='aws:skipRegionValidation', value=True),
+            PulumiConfigurationKey(name='aws:skipRequestingAccountId', value=True)
+        ]
+
+    @property
+    def environment(self) -> Dict[str, str]:
+        """ returns environment variables with the fake credentials, for programs and tools that read them instead of the provider configuration """
+        return {
+            'AWS_ACCESS_KEY_ID': self.access_key,
+            'AWS_SECRET_ACCESS_KEY': self.secret_key,
+            'AWS_DEFAULT_REGION': self.region
+        }
+
+    def client(self, service: str) -> Any:
+        """ returns a boto3 client for a service of the emulator, shared by all tests using the same emulator """
+        return self.__pooled('client', service)
+
+    def resource(self, service: str) -> Any:
+        """ returns a boto3 resource for a service of the emulator, shared by all tests using the same emulator """
+        return self.__pooled('resource', service)
+
+    def __pooled(self, kind: str, service: str) -> Any:
+        key = (kind, service, self.endpoint_url(service), self.region, self.access_key, self.secret_key)
+
+        with _clients_lock:
+            pooled = _clients.get(key)
+            if pooled is None:
+                session = boto3.session.Session(aws_access_key_id=self.access_key, aws_secret_access_key=self.secret_key, region_name=self.region)
+                factory = session.client if kind == 'client' else session.resource
+                pooled  = factory(service_name=service, endpoint_url=self.endpoint_url(service), config=self.botocore_config)
+                _clients[key] = pooled
+
+        return pooled
+
+    @property
+    def botocore_config(self) -> botocore.config.Config:
+        """ returns the configuration of boto3 clients for the emulator """
+        return botocore.config.Config(
+            region_name=self.region,
+            connect_timeout=5,
+            read_timeout=30,
+            retries={"max_attempts": 1},
+            s3={"addressing_style": "path"},
+            max_pool_connections=50
+        )
+
+    def is_available(self, timeout: float = 1.0) -> bool:
+        """ returns True if the emulator accepts connections, eg. to skip tests when it is not running """
+        parts = urlsplit(self.endpoint)
+        port  = parts.port or (443 if parts.scheme == 'https' else 80)
+
+        try:
+            with socket.create_connection((parts.hostname, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
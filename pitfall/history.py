@@ -0,0 +1,250 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+from . import codec
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple, Union
+import bisect
+import gzip
+import os
+import re
+import shutil
+import time
+
+
+# the coarsest resolution in seconds of directory modification times, eg. 1s on HFS+ and 2s on FAT
+MTIME_RESOLUTION = 2.0
+
+
+@dataclass(frozen=True)
+class CheckpointBackup:
+    """ a backup of the Pulumi state file. Pulumi names backups `<stack>.<unix time in nanoseconds>.json`, with `.gz` appended if compressed """
+    path: Path
+    timestamp: int
+    size: int
+
+    @property
+    def time(self) -> datetime:
+        """ returns the time the backup was taken """
+        return datetime.fromtimestamp(self.timestamp / 1e9, tz=timezone.utc)
+
+    @property
+    def compressed(self) -> bool:
+        return self.path.suffix == '.gz'
+
+    def read(self) -> dict:
+        """ returns the contents of the backup """
+        return codec.load_file(self.path)
+
+    def compress(self) -> CheckpointBackup:
+        """ replaces the backup with a gzip compressed copy and returns it """
+        path = self.path.with_name(self.path.name + '.gz')
+        tmp  = path.with_name(path.name + '.tmp')
+
+        with self.path.open('rb') as src, gzip.open(tmp, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+        tmp.replace(path)
+        self.path.unlink()
+
+        return CheckpointBackup(path=path, timestamp=self.timestamp, size=path.stat().st_size)
+
+
+class CheckpointHistory:
+    """
+    An index of the backups of a stack's state file in `.pulumi/backups/<stack>`. The directory
+    is only rescanned when it is modified, and only new backups are examined. As a directory can be
+    modified again within the resolution of its modification time, it is rescanned on every refresh
+    until it was last modified more than MTIME_RESOLUTION seconds before a scan. Indexing and iteration
+    are from the newest to the oldest backup, so the newest backup is the current state and
+    index 1 is the previous state. Recently loaded backups are cached.
+
+    :type directory: Path
+    :param directory: the directory containing the backups of the stack
+
+    :type stack: str
+    :param stack: the name of the stack
+
+    :type cache_size: int
+    :param cache_size: the number of loaded backups to keep in memory
+    """
+    def __init__(self, directory: Path, stack: str, cache_size: int = 8) -> None:
+        self.directory  = Path(directory)
+        self.stack      = stack
+        self.cache_size = cache_size
+
+        self._pattern = re.compile(r'^' + re.escape(stack) + r'\.(\d+)\.json(\.gz)?$')
+
+        self._backups: List[CheckpointBackup] = []  # oldest first
+        self._timestamps: List[int] = []
+        self._names: Dict[str, CheckpointBackup] = {}
+        self._scanned: Union[Tuple[int, int], None] = None
+        self._cache: OrderedDict = OrderedDict()
+
+    def refresh(self) -> None:
+        """ updates the index with the backups created or removed since the directory was last scanned """
+        now = time.time()
+
+        try:
+            st = self.directory.stat()
+        except FileNotFoundError:
+            self._backups, self._timestamps, self._names, self._scanned = [], [], {}, None
+            self._cache.clear()
+            return
+
+        key = (st.st_ino, st.st_mtime_ns)
+        if key == self._scanned:
+            return
+
+        names = set()
+
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                names.add(entry.name)
+                if entry.name in self._names:
+                    continue
+
+                match = self._pattern.match(entry.name)
+                if match is None:
+                    continue
+
+                backup = CheckpointBackup(path=Path(entry.path), timestamp=int(match.group(1)), size=entry.stat().st_size)
+                self._names[entry.name] = backup
+
+                index = bisect.bisect_right(self._timestamps, backup.timestamp)
+                self._backups.insert(index, backup)
+                self._timestamps.insert(index, backup.timestamp)
+
+        removed = self._names.keys() - names
+        if removed:
+            for name in removed:
+                self._cache.pop(self._names.pop(name).path, None)
+            self._backups    = [i for i in self._backups if i.path.name not in removed]
+            self._timestamps = [i.timestamp for i in self._backups]
+
+        # a modification in the same tick as the last one would not change the modification time
+        self._scanned = key if now - st.st_mtime_ns / 1e9 > MTIME_RESOLUTION else None
+
+    @property
+    def backups(self) -> List[CheckpointBackup]:
+        """ returns the backups from the newest to the oldest """
+        self.refresh()
+        return self._backups[::-1]
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._backups)
+
+    def __iter__(self) -> Iterator[dict]:
+        """ yields the contents of the backups from the newest to the oldest, loading each one as it is reached """
+        for i in self.backups:
+            yield self.load(i)
+
+    def __getitem__(self, index: int) -> dict:
+        """ returns the contents of the backup at `index`, where 0 is the newest backup """
+        self.refresh()
+
+        count = len(self._backups)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('checkpoint history index out of range')
+
+        return self.load(self._backups[count - 1 - index])
+
+    def load(self, backup: CheckpointBackup) -> dict:
+        """ returns the contents of the backup, caching the most recently loaded ones """
+        if backup.path in self._cache:
+            self._cache.move_to_end(backup.path)
+            return self._cache[backup.path]
+
+        contents = backup.read()
+
+        self._cache[backup.path] = contents
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return contents
+
+    def find(self, time: Union[datetime, int]) -> Union[CheckpointBackup, None]:
+        """ returns the newest backup taken at or before `time`, a datetime or a unix timestamp in nanoseconds """
+        if isinstance(time, datetime):
+            time = round(time.timestamp() * 1e6) * 1000
+
+        self.refresh()
+
+        index = bisect.bisect_right(self._timestamps, time)
+        if index == 0:
+            return None
+        return self._backups[index - 1]
+
+    def at(self, time: Union[datetime, int]) -> Union[dict, None]:
+        """ returns the state of the stack at `time` or None if it predates all of the backups """
+        backup = self.find(time)
+        if backup is None:
+            return None
+        return self.load(backup)
+
+
+@dataclass
+class CheckpointRetention:
+    """
+    A retention policy for the backups of the state file, which Pulumi writes on every
+    update. Backups beyond the newest `keep_last` or older than `max_age` are deleted,
+    though the newest backup is always kept. The remaining backups, except for the newest
+    `keep_uncompressed`, are compressed with gzip and remain readable through CheckpointHistory.
+
+    :type keep_last: int
+    :param keep_last: the number of backups to keep. All backups are kept if None
+
+    :type max_age: timedelta
+    :param max_age: the age after which backups are deleted. Backups are kept regardless of age if None
+
+    :type compress: bool
+    :param compress: compress the backups that are kept
+
+    :type keep_uncompressed: int
+    :param keep_uncompressed: the number of the newest backups that are not compressed, which keeps the current and previous state quick to read
+    """
+    keep_last: int = None
+    max_age: timedelta = None
+    compress: bool = True
+    keep_uncompressed: int = 2
+
+    def apply(self, history: CheckpointHistory) -> Tuple[int, int]:
+        """ applies the policy to the backups in history and returns the number of backups deleted and compressed """
+        deleted, compressed = 0, 0
+
+        now = time.time_ns()
+
+        for n, backup in enumerate(history.backups):
+            too_many = self.keep_last is not None and n >= self.keep_last
+            too_old  = self.max_age is not None and now - backup.timestamp > self.max_age.total_seconds() * 1e9
+            expired  = n > 0 and (too_many or too_old)
+
+            try:
+                if expired:
+                    backup.path.unlink()
+                    deleted += 1
+                elif self.compress and n >= self.keep_uncompressed and not backup.compressed:
+                    backup.compress()
+                    compressed += 1
+            except FileNotFoundError:  # removed by another process
+                continue
+
+        return deleted, compressed
@@ -0,0 +1,316 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" runs Pulumi programs in-process against mock providers with Pulumi's runtime mocks. Requires a version of the Pulumi SDK with `pulumi.runtime.set_mocks` """
+
+from __future__ import annotations
+from .actions import PulumiAction
+from .state import PulumiResources
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
+import asyncio
+import json
+import runpy
+import sys
+import threading
+
+try:
+    import pulumi
+    import pulumi.runtime
+    from pulumi.runtime import rpc
+except ImportError:  # pragma: no cover
+    pulumi = None
+    rpc    = None
+
+
+@dataclass(frozen=True)
+class PulumiMockResource:
+    """ a resource registered by the Pulumi program, passed to the `new_resource` handler """
+    type: str
+    name: str
+    inputs: dict
+    provider: Union[str, None] = None
+    id: Union[str, None] = None  # set when the program reads an existing resource
+
+
+@dataclass(frozen=True)
+class PulumiMockCall:
+    """ a call to a provider function by the Pulumi program, eg. aws:ec2/getAmi:getAmi, passed to the `call` handler """
+    token: str
+    args: dict
+    provider: Union[str, None] = None
+
+
+class PulumiMocks:
+    """
+    The mock providers of a Pulumi program. Either subclass and override `new_resource()` and `call()`,
+    or pass the handlers as arguments.
+
+    :type new_resource: Callable[[PulumiMockResource], Tuple[str, dict]]
+    :param new_resource: returns the id and output properties of a new resource. Defaults to '<name>_id' and its inputs
+
+    :type call: Callable[[PulumiMockCall], dict]
+    :param call: returns the result of a provider function. Defaults to an empty dictionary
+    """
+    def __init__(
+        self, new_resource: Callable[[PulumiMockResource], Tuple[str, dict]] = None, call: Callable[[PulumiMockCall], dict] = None
+    ) -> None:
+        self._new_resource = new_resource
+        self._call         = call
+
+    def new_resource(self, resource: PulumiMockResource) -> Tuple[str, dict]:
+        if self._new_resource is not None:
+            return self._new_resource(resource)
+        return resource.id or f'{resource.name}_id', dict(resource.inputs)
+
+    def call(self, call: PulumiMockCall) -> dict:
+        if self._call is not None:
+            return self._call(call)
+        return {}
+
+
+def _plain(value: Any) -> Any:
+    """ returns value with anything that is not JSON serializable, such as unknowns, converted to a string """
+    return json.loads(json.dumps(value, default=str))
+
+
+class PulumiMockRecorder:
+    """ records the resources registered by the Pulumi program in the format of the Pulumi state file """
+    def __init__(self) -> None:
+        self.resources: List[dict]    = []
+        self._by_urn: Dict[str, dict] = {}
+
+    def register(
+        self, urn: str, rtype: str, custom: bool, rid: str = None, parent: str = None, provider: str = None,
+        inputs: dict = None, outputs: dict = None, dependencies: List[str] = None, property_dependencies: Dict[str, List[str]] = None
+    ) -> dict:
+        resource = self._by_urn.get(urn)
+        if resource is None:
+            resource = {}
+            self._by_urn[urn] = resource
+            self.resources.append(resource)
+        else:
+            resource.clear()  # the stack is registered again when the program runs
+
+        resource.update({"urn": urn, "custom": custom, "type": rtype})
+        if rid:
+            resource["id"] = rid
+        resource["inputs"]  = _plain(inputs or {})
+        resource["outputs"] = _plain(outputs or {})
+        if parent:
+            resource["parent"] = parent
+        if provider:
+            resource["provider"] = provider
+        if dependencies:
+            resource["dependencies"] = list(dependencies)
+        if property_dependencies:
+            resource["propertyDependencies"] = {k: list(v) for k, v in property_dependencies.items()}
+
+        return resource
+
+    def register_outputs(self, urn: str, outputs: dict) -> None:
+        """ records the outputs of a component resource or the stack, ie. the values exported with pulumi.export """
+        resource = self._by_urn.get(urn)
+        if resource is not None:
+            resource["outputs"] = _plain(outputs or {})
+
+
+def _require_mocks() -> None:
+    if pulumi is None:
+        raise ImportError("The Pulumi SDK is required for mock mode. Install it with: pip install pulumi")
+    if not hasattr(pulumi.runtime, 'set_mocks'):
+        raise ImportError("Mock mode requires a version of the Pulumi SDK with pulumi.runtime.set_mocks. Upgrade it with: pip install -U pulumi")
+
+
+def _recording_monitor(mocks: Any, recorder: PulumiMockRecorder) -> Any:
+    """ returns a MockMonitor that records the requests and responses of the registered resources """
+    from pulumi.runtime.mocks import MockMonitor
+
+    lock = threading.Lock()  # the runtime calls the monitor from a thread pool
+
+    class RecordingMonitor(MockMonitor):
+        def Invoke(self, request):
+            with lock:
+                return super().Invoke(request)
+
+        def ReadResource(self, request):
+            with lock:
+                return super().ReadResource(request)
+
+        def RegisterResource(self, request):
+            with lock:
+                response = super().RegisterResource(request)
+
+            property_dependencies = {k: list(v.urns) for k, v in request.propertyDependencies.items()}
+
+            recorder.register(
+                urn=response.urn, rtype=request.type, custom=request.custom, rid=response.id,
+                parent=request.parent or None, provider=request.provider or None,
+                inputs=rpc.deserialize_properties(request.object), outputs=rpc.deserialize_properties(response.object),
+                dependencies=list(request.dependencies), property_dependencies=property_dependencies
+            )
+            return response
+
+        def RegisterResourceOutputs(self, request):
+            recorder.register_outputs(request.urn, rpc.deserialize_properties(request.outputs))
+            return super().RegisterResourceOutputs(request)
+
+    return RecordingMonitor(mocks)
+
+
+@contextmanager
+def _isolated_runtime() -> Iterator[None]:
+    """ restores the event loop of the current thread and the global state of the Pulumi runtime that running a program with mocks replaces """
+    from pulumi.runtime import config, mocks, settings
+
+    try:
+        event_loop = asyncio.get_event_loop()
+    except RuntimeError:  # the current thread has no event loop
+        event_loop = None
+
+    mocks_loop = mocks.loop
+    saved      = settings.SETTINGS
+    root       = settings.ROOT
+    values     = dict(config.CONFIG)
+
+    try:
+        yield
+    finally:
+        asyncio.set_event_loop(event_loop)
+        setattr(mocks, 'loop', mocks_loop)
+        settings.configure(saved)
+        settings.ROOT = root
+        config.CONFIG.clear()
+        config.CONFIG.update(values)
+
+
+def _set_mocks(mocks: Any, project: str, stack: str, monitor: Any) -> asyncio.AbstractEventLoop:
+    """
+    configures the runtime with mocks and a monitor, which set_mocks does not accept as an argument.
+    Returns the event loop created for the MockMonitor, to be closed by the caller
+    """
+    from pulumi.runtime import mocks as runtime_mocks
+
+    pulumi.runtime.set_mocks(mocks, project=project, stack=stack, preview=False)
+    pulumi.runtime.settings.SETTINGS.monitor = monitor
+
+    # the MockMonitor serializes properties on the loop set_mocks found, pumping it from the thread pool while the
+    # program runs on it. A loop of its own is only ever run by one call of the monitor at a time
+    loop = asyncio.new_event_loop()
+    setattr(runtime_mocks, 'loop', loop)  # declared as None
+    return loop
+
+
+def _set_config(config: Dict[str, str]) -> None:
+    """ replaces the configuration of the runtime """
+    from pulumi.runtime import config as runtime_config
+
+    runtime_config.CONFIG.clear()  # the configuration of a previous run
+    for key, value in config.items():
+        pulumi.runtime.set_config(key, value)
+
+
+def _mocks_adapter(mocks: PulumiMocks) -> Any:
+    """ adapts PulumiMocks to pulumi.runtime.Mocks """
+    class Adapter(pulumi.runtime.Mocks):
+        def new_resource(self, type_, name, inputs, provider, id_):
+            return mocks.new_resource(PulumiMockResource(type=type_, name=name, inputs=inputs, provider=provider or None, id=id_ or None))
+
+        def call(self, token, args, provider):
+            return mocks.call(PulumiMockCall(token=token, args=args, provider=provider or None))
+
+    return Adapter()
+
+
+class PulumiMockRun(PulumiAction):
+    """
+    Runs the Pulumi program in the current directory in-process, with its resources created by mock providers
+    instead of the Pulumi engine. The registered resources are written to the state file, so they are available
+    through `PulumiState.resources` and the stack outputs through `PulumiState.outputs`.
+
+    :type mocks: PulumiMocks
+    :param mocks: the mock providers
+
+    :type project: str
+    :param project: the name of the Pulumi project
+
+    :type stack: str
+    :param stack: the name of the stack
+
+    :type config: dict
+    :param config: the stack's configuration as plaintext values keyed by namespaced name, eg. aws:region
+    """
+    def __init__(self, mocks: PulumiMocks, project: str, stack: str, config: Dict[str, str] = None, verbose=False, state=None) -> None:
+        super().__init__(verbose=verbose, state=state)
+
+        self.mocks   = mocks
+        self.project = project
+        self.stack   = stack
+        self.config  = config or {}
+
+        self.resources = PulumiResources()
+
+    def execute(self, directory: Union[Path, str] = None) -> PulumiResources:
+        """ runs the program in `directory`, by default the current directory, and returns the registered resources """
+        _require_mocks()
+
+        directory = Path.cwd() if directory is None else Path(directory)
+        recorder  = PulumiMockRecorder()
+
+        with _isolated_runtime():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+
+            adapter      = _mocks_adapter(self.mocks)
+            monitor_loop = _set_mocks(adapter, project=self.project, stack=self.stack, monitor=_recording_monitor(adapter, recorder))
+            _set_config(self.config)
+
+            modules = set(sys.modules)
+            try:
+                from pulumi.runtime import settings
+                from pulumi.runtime.stack import run_in_stack
+
+                # the root stack resource of a previous run is replaced so that the program's exports become the stack's outputs
+                settings.ROOT = None
+                loop.run_until_complete(run_in_stack(lambda: runpy.run_path(str(directory), run_name='__main__')))
+            finally:
+                loop.close()
+                monitor_loop.close()
+                self.__unload_modules(directory, modules)
+
+        self._stdout = f'{len(recorder.resources)} resources registered\n'
+        self._stderr = ''
+
+        if self.state is not None:
+            checkpoint = json.loads(json.dumps(self.state.new))
+            checkpoint["checkpoint"]["latest"]["resources"] = recorder.resources
+            self.state.write(checkpoint)
+            self._update_state()
+
+        self.resources = PulumiResources.from_iterable(recorder.resources)
+
+        if self.verbose:
+            print(f'Ran Pulumi program with mocks: {self._stdout}')
+
+        return self.resources
+
+    @staticmethod
+    def __unload_modules(directory: Path, modules: set) -> None:
+        """ removes the modules of the program from sys.modules, so that programs in other directories can import modules of the same name """
+        for name in set(sys.modules) - modules:
+            filename = getattr(sys.modules[name], '__file__', None) or ''
+            if filename.startswith(str(directory)):
+                del sys.modules[name]
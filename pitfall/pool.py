@@ -0,0 +1,329 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+from . import exceptions
+from . import utils
+from .config import PulumiConfigurationKey, DEFAULT_PULUMI_CONFIG_PASSPHRASE
+from .core import PulumiIntegrationTest, PulumiIntegrationTestOptions
+from .plugins import PulumiPlugin
+from dataclasses import replace
+from pathlib import Path
+from typing import IO, List, Tuple, Union
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import time
+
+
+class PulumiStackPool:
+    """
+    A pool of stacks of a Pulumi program that are deployed with a baseline configuration and leased to
+    tests, so that tests of changes to the configuration do not have to deploy the program from scratch.
+
+    Each stack has its own workspace under `root`. Leases are recorded with file locks, so the pool can
+    be shared by several test processes on the same host that create it with the same arguments.
+    Returned stacks are reset to the baseline with `pulumi up`, and destroyed if the reset fails.
+
+    :type directory: Path
+    :param directory: the directory of the Pulumi program
+
+    :type size: int
+    :param size: the number of stacks in the pool
+
+    :type config: List[PulumiConfigurationKey]
+    :param config: the baseline configuration of the stacks
+
+    :type plugins: List[PulumiPlugin]
+    :param plugins: the plugins installed before a stack is first deployed
+
+    :type opts: PulumiIntegrationTestOptions
+    :param opts: the options of leased stacks. The cleanup and destroy options are ignored
+
+    :type root: Path
+    :param root: the directory of the workspaces and locks of the pool, by default in the system's temporary directory
+
+    :type poll_interval: float
+    :param poll_interval: the number of seconds to wait between attempts to lease a stack when none is available
+    """
+    def __init__(
+        self, directory: Union[str, Path], size: int = 2, config: List[PulumiConfigurationKey] = None, plugins: List[PulumiPlugin] = None,
+        opts: PulumiIntegrationTestOptions = PulumiIntegrationTestOptions(), root: Union[str, Path] = None, poll_interval: float = 0.1
+    ) -> None:
+        if size < 1:
+            raise ValueError("the size of the pool must be at least 1")
+
+        self.directory     = utils.get_directory_abspath(Path(directory))
+        self.size          = size
+        self.config        = list(config or [])
+        self.plugins       = list(plugins or [])
+        self.opts          = replace(opts, cleanup=False, destroy=False)
+        self.poll_interval = poll_interval
+
+        if root is None:
+            program_sha1sum = utils.sha1sum(bytes(self.directory))[:16]
+            root = Path(tempfile.gettempdir()).joinpath(f'pitfall-pool-{program_sha1sum}')
+        self.root = Path(root).absolute()
+
+        self._encryption: Union[Tuple[bytes, str], None] = None
+
+    def __repr__(self):
+        return f"PulumiStackPool(directory={str(self.directory)!r}, size={self.size}, root={str(self.root)!r})"
+
+    def lease(self, config: List[PulumiConfigurationKey] = None, timeout: float = None) -> PulumiStackLease:
+        """
+        Leases a stack of the pool, waiting up to `timeout` seconds, or indefinitely, for one to be returned.
+        The stack is configured with the baseline configuration updated with `config` when the lease is entered.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            for slot in range(self.size):
+                lock = self._try_lock(slot)
+                if lock is not None:
+                    return PulumiStackLease(pool=self, slot=slot, lock=lock, config=config)
+
+            if deadline is not None and time.monotonic() >= deadline:
+                raise exceptions.PulumiStackPoolTimeoutError(f"No stack of the pool became available within {timeout}s")
+
+            time.sleep(self.poll_interval)
+
+    def warm(self) -> int:
+        """
+        Deploys the baseline to each stack of the pool that is neither leased nor deployed, and returns the number of stacks deployed.
+        Stacks are deployed one at a time, as tests change the working directory of the process; run it in several processes to deploy in parallel.
+        """
+        deployed = 0
+
+        for slot in range(self.size):
+            lock = self._try_lock(slot)
+            if lock is None:
+                continue
+
+            with PulumiStackLease(pool=self, slot=slot, lock=lock, opts=self._maintenance_opts) as lease:
+                if not lease.deployed:
+                    lease.up.execute()
+                    lease.baseline_deployed()
+                    deployed += 1
+
+        return deployed
+
+    def destroy(self) -> None:
+        """ destroys every stack of the pool, waiting for leased stacks to be returned, and deletes the workspaces of the pool """
+        for slot in range(self.size):
+            lock = self._lock(slot)
+
+            try:
+                if self.workspace(slot).joinpath('Pulumi.yaml').exists():
+                    lease = PulumiStackLease(pool=self, slot=slot, lock=lock, opts=self._maintenance_opts)
+                    lease.setup()
+                    try:
+                        if lease.deployed:
+                            lease.destroy.execute()
+
+                        try:
+                            lease.workspace.unlink()  # the path of the workspace file depends on the working directory
+                        except FileNotFoundError:
+                            pass
+                    finally:
+                        lease._change_directory('old')
+
+                shutil.rmtree(self.workspace(slot), ignore_errors=True)
+
+                metadata = self._metadata_path(slot)
+                if metadata.exists():
+                    metadata.unlink()
+            finally:
+                lock.close()
+
+    @property
+    def _maintenance_opts(self) -> PulumiIntegrationTestOptions:
+        """ returns the options of the leases used to deploy and destroy stacks of the pool """
+        return replace(self.opts, preview=False, up=False, proxy=None)
+
+    def workspace(self, slot: int) -> Path:
+        """ returns the directory of the workspace of a stack of the pool """
+        return self.root.joinpath(f'stack-{slot}')
+
+    def _metadata_path(self, slot: int) -> Path:
+        return self.root.joinpath(f'stack-{slot}.json')
+
+    def _lock(self, slot: int) -> IO[str]:
+        """ locks a stack of the pool, waiting for it to be returned if it is leased, and returns the open lock file """
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        f = self.root.joinpath(f'stack-{slot}.lock').open('a')
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    def _try_lock(self, slot: int) -> Union[IO[str], None]:
+        """ locks a stack of the pool, returning the open lock file, or None if it is leased """
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        f = self.root.joinpath(f'stack-{slot}.lock').open('a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+
+        return f
+
+    def _names(self, slot: int) -> Tuple[str, str]:
+        """ returns the names of the project and stack of a slot, which are generated when it is first leased. Must be called while the slot is locked """
+        path = self._metadata_path(slot)
+
+        if path.exists():
+            metadata = json.loads(path.read_text())
+        else:
+            metadata = {"project": utils.generate_project_name(), "stack": utils.generate_stack_name()}
+            path.write_text(json.dumps(metadata))
+
+        return metadata["project"], metadata["stack"]
+
+    def encryption(self, passphrase: str = None) -> Tuple[bytes, str]:
+        """ returns the encryption key and encryptionsalt shared by the stacks of the pool, which are generated by the first process to use the pool """
+        if self._encryption is None:
+            if passphrase is None:
+                passphrase = os.environ.get('PULUMI_CONFIG_PASSPHRASE', DEFAULT_PULUMI_CONFIG_PASSPHRASE)
+
+            self.root.mkdir(parents=True, exist_ok=True)
+            path = self.root.joinpath('pool.json')
+
+            with self.root.joinpath('pool.lock').open('a') as lock:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+
+                if path.exists():
+                    encryptionsalt = json.loads(path.read_text())["encryptionsalt"]
+                    self._encryption = (utils.get_encryption_key(passphrase, encryptionsalt), encryptionsalt)
+                else:
+                    self._encryption = utils.generate_encryptionsalt(passphrase)
+                    path.write_text(json.dumps({"encryptionsalt": self._encryption[1]}))
+
+        return self._encryption
+
+
+class PulumiStackLease(PulumiIntegrationTest):
+    """
+    A stack leased from a PulumiStackPool, used like a PulumiIntegrationTest. When it is exited,
+    or deleted, a stack whose state was modified is reset to the baseline and returned to the pool.
+
+    :type pool: PulumiStackPool
+    :param pool: the pool the stack is leased from
+
+    :type slot: int
+    :param slot: the index of the stack in the pool
+
+    :type lock: IO[str]
+    :param lock: the open lock file of the stack, which is closed when the stack is returned
+
+    :type config: List[PulumiConfigurationKey]
+    :param config: configuration keys that override the baseline
+
+    :type opts: PulumiIntegrationTestOptions
+    :param opts: the options of the lease, by default those of the pool
+    """
+    def __init__(
+        self, pool: PulumiStackPool, slot: int, lock: IO[str], config: List[PulumiConfigurationKey] = None, opts: PulumiIntegrationTestOptions = None
+    ) -> None:
+        self.pool = pool
+        self.slot = slot
+        self.lock = lock
+
+        try:
+            super().__init__(directory=pool.directory, config=pool.config + list(config or []), plugins=pool.plugins, opts=opts or pool.opts)
+        except BaseException:
+            self.lock.close()
+            raise
+
+        self.baseline = pool.config
+        if self.emulator is not None:
+            self.baseline = self.emulator.config + self.baseline
+
+        self._baseline_state: Union[str, None] = None  # the digest of the state file when the baseline was deployed
+
+    def __repr__(self):
+        return f"PulumiStackLease(slot={self.slot}, stack={self.stack.name!r})"
+
+    def _generate_test_directory(self) -> Path:
+        """ returns the workspace of the leased stack """
+        path = self.pool.workspace(self.slot)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _generate_names(self) -> Tuple[str, str]:
+        return self.pool._names(self.slot)
+
+    def _generate_encryptionsalt(self) -> Tuple[bytes, str]:
+        return self.pool.encryption(self.pulumi_config_passphrase)
+
+    @property
+    def deployed(self) -> bool:
+        """ returns True if the stack has resources in its state """
+        return any(True for _ in self.state.iter_resources())
+
+    def setup(self) -> None:
+        """ prepares the workspace of the leased stack, keeping the state of a stack that was leased before """
+        if not self.tmp_directory.joinpath('Pulumi.yaml').exists():
+            super().setup()  # first lease of this stack
+        else:
+            self._copy_pulumi_code()
+            self._change_directory('test')
+            if self.opts.precompile:
+                self._compile_pulumi_code()
+            self.stack.write()  # apply the configuration of the test
+            self._select_current_stack()
+            if self.opts.proxy is not None:
+                self._start_proxy()
+
+        self.baseline_deployed()
+
+    def baseline_deployed(self) -> None:
+        """ records that the current state of the stack is the baseline, so that it is not reset unless the state is modified """
+        self._baseline_state = self.state.digest
+
+    def delete(self) -> None:
+        """ resets the stack to the baseline if its state was modified, and returns it to the pool """
+        try:
+            super().delete()
+
+            if self.lock.closed:
+                return
+
+            if self._baseline_state is not None and self.state.digest != self._baseline_state:
+                self.reset()
+        finally:
+            self.lock.close()
+
+    def reset(self) -> None:
+        """
+        deploys the baseline configuration with `pulumi up`, and destroys the stack if that fails, leaving it
+        to be deployed again by the next lease or `PulumiStackPool.warm()`
+        """
+        self.config = self.baseline
+        self.stack  = replace(self.stack, config=self._encrypt_and_format_config())
+        self.stack.write()
+
+        try:
+            self.up.execute()
+        except Exception as e:
+            if self.opts.verbose:
+                print(f"Failed to reset stack {self.stack.name} to the baseline, destroying it: {e}")
+            self._baseline_state = None  # the stack is no longer deployed with the baseline
+            self.destroy.execute()
+            return
+
+        self.baseline_deployed()
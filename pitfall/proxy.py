@@ -0,0 +1,428 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" a local HTTP proxy that records the API traffic of a test run to a cassette and replays it in later runs """
+
+from __future__ import annotations
+from . import exceptions
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import PathLike
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import base64
+import hashlib
+import http.client
+import json
+import os
+import re
+import threading
+
+
+# set to `record` or `replay` to override the mode of all proxies, eg. to re-record cassettes
+PROXY_MODE_ENV = 'PITFALL_PROXY_MODE'
+
+MODES = ('auto', 'record', 'replay')
+
+# the hosts that bypass the proxy, such as the engine's gRPC endpoint the Pulumi language host connects to
+NO_PROXY = 'localhost,127.0.0.1,::1'
+
+# query parameters that differ on every request, such as those of AWS request signatures
+IGNORED_QUERY_PARAMETERS = (
+    'X-Amz-Date', 'X-Amz-Signature', 'X-Amz-Credential', 'X-Amz-Security-Token', 'X-Amz-Expires',
+    'Signature', 'SignatureNonce', 'Timestamp', 'Expires', 'AWSAccessKeyId'
+)
+
+# fields of JSON and form encoded request bodies that differ on every request, such as idempotency tokens
+IGNORED_BODY_FIELDS = ('ClientToken', 'ClientRequestToken', 'IdempotencyToken', 'CallerReference', 'Timestamp')
+
+VOLATILE_PATTERNS = [
+    re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'),
+    re.compile(r'\b\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?'),
+    re.compile(r'\b\d{8}T\d{6}Z\b'),
+]
+
+HOP_BY_HOP_HEADERS = frozenset((
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'proxy-connection',
+    'te', 'trailers', 'transfer-encoding', 'upgrade'
+))
+
+
+def _normalize_string(s: str) -> str:
+    for regex in VOLATILE_PATTERNS:
+        s = regex.sub('*', s)
+    return s
+
+
+def _strip_fields(value: Any, ignored: frozenset) -> Any:
+    """ returns a copy of a decoded JSON value without the ignored keys and with volatile strings masked """
+    if isinstance(value, dict):
+        return {k: _strip_fields(v, ignored) for k, v in value.items() if k not in ignored}
+    elif isinstance(value, list):
+        return [_strip_fields(i, ignored) for i in value]
+    elif isinstance(value, str):
+        return _normalize_string(value)
+    return value
+
+
+def request_key(
+    method: str, url: str, body: bytes = b'', content_type: str = '',
+    ignore_query: Iterable[str] = IGNORED_QUERY_PARAMETERS, ignore_fields: Iterable[str] = IGNORED_BODY_FIELDS
+) -> str:
+    """
+    returns the key used to match a request with a recorded interaction. The scheme, signature query
+    parameters, ignored body fields, UUIDs and timestamps are excluded, and query and form parameters are sorted
+    """
+    ignored_query  = frozenset(i.lower() for i in ignore_query)
+    ignored_fields = frozenset(ignore_fields)
+
+    parts = urlsplit(url)
+    query = sorted((k, _normalize_string(v)) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in ignored_query)
+
+    content_type = (content_type or '').split(';')[0].strip().lower()
+
+    if not body:
+        normalized = ''
+    elif content_type == 'application/x-www-form-urlencoded':
+        params     = parse_qsl(body.decode('utf-8', errors='replace'), keep_blank_values=True)
+        normalized = urlencode(sorted((k, _normalize_string(v)) for k, v in params if k not in ignored_fields))
+    elif content_type.endswith('json') or body[:1] in (b'{', b'['):
+        try:
+            normalized = json.dumps(_strip_fields(json.loads(body), ignored_fields), sort_keys=True)
+        except ValueError:
+            normalized = hashlib.sha256(body).hexdigest()
+    else:
+        normalized = hashlib.sha256(body).hexdigest()
+
+    canonical = f'{method.upper()} {parts.netloc.lower()}{parts.path or "/"}?{urlencode(query)}\n{normalized}'
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """
+    The interactions recorded by the proxy, stored as a JSON file. Requests that occur several times,
+    such as polling for a resource to become available, are replayed in the order they were recorded,
+    and the last response is repeated once they are exhausted.
+
+    :type path: PathLike
+    :param path: the path of the cassette file
+    """
+    def __init__(self, path: Union[PathLike, str]) -> None:
+        self.path = Path(path).expanduser().absolute()
+
+        self.interactions: List[dict]          = []
+        self._responses: Dict[str, List[dict]] = {}
+        self._cursors: Dict[str, int]          = {}
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> Cassette:
+        contents = json.loads(self.path.read_text())
+
+        self.interactions, self._responses, self._cursors = [], {}, {}
+        for i in contents["interactions"]:
+            self.append(i)
+        return self
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps({"version": 1, "interactions": self.interactions}, indent=2))
+
+    def append(self, interaction: dict) -> None:
+        self.interactions.append(interaction)
+        self._responses.setdefault(interaction["key"], []).append(interaction["response"])
+
+    def play(self, key: str) -> Union[dict, None]:
+        """ returns the next recorded response for the request key or None if it was never recorded """
+        responses = self._responses.get(key)
+        if not responses:
+            return None
+
+        cursor = self._cursors.get(key, 0)
+        self._cursors[key] = cursor + 1
+        return responses[min(cursor, len(responses) - 1)]
+
+
+def _encode_body(body: bytes) -> dict:
+    """ returns the body as text when it is UTF-8, otherwise base64 encoded """
+    try:
+        return {"body": body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {"body_base64": base64.b64encode(body).decode('ascii')}
+
+
+def _decode_body(message: dict) -> bytes:
+    if "body_base64" in message:
+        return base64.b64decode(message["body_base64"])
+    return message.get("body", "").encode('utf-8')
+
+
+class PulumiRecordingProxy:
+    """
+    A local HTTP proxy that records the API traffic of a test run to a cassette and replays it
+    deterministically in later runs, without any network access.
+
+    Clients either use it as a forward proxy by setting HTTP_PROXY (see `environment`) and sending requests
+    to http:// endpoints, or point an endpoint directly at `url` when `target` is set. TLS is not intercepted,
+    so provider endpoints must be configured with http:// URLs; HTTPS_PROXY is set as well so that https://
+    requests are rejected by the proxy instead of silently bypassing it. Set `upgrade_https` to have recorded requests
+    forwarded upstream over HTTPS; AWS request signatures remain valid as they do not cover the scheme.
+
+    :type cassette: PathLike
+    :param cassette: the path of the cassette file
+
+    :type mode: str
+    :param mode: record, replay, or auto which replays if the cassette exists and records otherwise. Overridden by PITFALL_PROXY_MODE
+
+    :type target: str
+    :param target: the upstream URL of requests sent to the proxy's own URL, eg. http://localhost:4566
+
+    :type upgrade_https: bool
+    :param upgrade_https: forward requests for http:// URLs upstream over HTTPS when recording
+
+    :type ignore_query: Iterable[str]
+    :param ignore_query: the query parameters excluded when matching requests
+
+    :type ignore_fields: Iterable[str]
+    :param ignore_fields: the fields of JSON and form encoded request bodies excluded when matching requests
+    """
+    def __init__(
+        self, cassette: Union[PathLike, str], mode: str = 'auto', target: str = None, upgrade_https: bool = False,
+        ignore_query: Iterable[str] = IGNORED_QUERY_PARAMETERS, ignore_fields: Iterable[str] = IGNORED_BODY_FIELDS,
+        host: str = '127.0.0.1', port: int = 0
+    ) -> None:
+        mode = os.environ.get(PROXY_MODE_ENV, mode)
+        if mode not in MODES:
+            raise ValueError(f"Unsupported proxy mode: {mode!r}. Supported: {', '.join(MODES)}")
+
+        self.cassette      = Cassette(cassette)
+        self.mode          = mode
+        self.target        = target.rstrip('/') if target else None
+        self.upgrade_https = upgrade_https
+        self.ignore_query  = tuple(ignore_query)
+        self.ignore_fields = tuple(ignore_fields)
+        self.host          = host
+        self.port          = port
+
+        self.hits: int         = 0
+        self.misses: List[str] = []  # the method and URL of requests that were not recorded, including rejected TLS tunnels
+
+        self._lock                                     = threading.Lock()
+        self._server: Union[ThreadingHTTPServer, None] = None
+        self._thread: Union[threading.Thread, None]    = None
+
+    def __enter__(self) -> PulumiRecordingProxy:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.stop()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def url(self) -> str:
+        """ returns the URL of the proxy """
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def environment(self) -> Dict[str, str]:
+        """
+        returns the environment variables that route the HTTP requests of the Pulumi CLI, providers and boto3 through the proxy.
+        HTTPS requests are routed through it too, where they fail as TLS is not intercepted. Loopback addresses bypass it,
+        as gRPC honours https_proxy for the connections of the language host and providers to the engine
+        """
+        return {
+            'HTTP_PROXY': self.url, 'http_proxy': self.url, 'HTTPS_PROXY': self.url, 'https_proxy': self.url,
+            'NO_PROXY': NO_PROXY, 'no_proxy': NO_PROXY
+        }
+
+    def start(self) -> None:
+        """ starts serving in a background thread """
+        if self.mode == 'auto':
+            self.mode = 'replay' if self.cassette.exists() else 'record'
+
+        if self.mode == 'replay':
+            self.cassette.load()
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _handler(self))
+        self._server.daemon_threads = True
+
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, name='pitfall-proxy', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ stops serving and saves the cassette if recording. Raises PulumiProxyRecordingError if nothing was recorded """
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server, self._thread = None, None
+
+        if not self.recording:
+            return
+
+        if len(self.cassette) == 0:
+            # an empty cassette would be replayed by later runs, failing every request
+            message = f'No interactions were recorded to {self.cassette.path}. Check that the HTTP requests of the test are sent to the proxy'
+            if self.misses:
+                message += '. Rejected: ' + ', '.join(self.misses)
+            raise exceptions.PulumiProxyRecordingError(message)
+
+        self.cassette.save()
+
+    def key(self, method: str, url: str, body: bytes, content_type: str) -> str:
+        return request_key(method, url, body, content_type, ignore_query=self.ignore_query, ignore_fields=self.ignore_fields)
+
+    def upstream_url(self, path: str) -> Union[str, None]:
+        """ returns the upstream URL of a request line's target: an absolute URL when used as a forward proxy, otherwise a path relative to `target` """
+        if path.startswith(('http://', 'https://')):
+            if self.upgrade_https and path.startswith('http://'):
+                return 'https://' + path[len('http://'):]
+            return path
+        if self.target is None:
+            return None
+        return self.target + path
+
+    def handle(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """ returns the status, headers and body of the response to a request, recorded or replayed """
+        url = self.upstream_url(path)
+        if url is None:
+            return 400, [('Content-Type', 'text/plain')], b'pitfall proxy: no target is configured for requests to relative URLs'
+
+        key = self.key(method, url, body, headers.get('content-type', ''))
+
+        if not self.recording:
+            with self._lock:
+                response = self.cassette.play(key)
+                if response is None:
+                    self.misses.append(f'{method} {url}')
+                else:
+                    self.hits += 1
+
+            if response is None:
+                return 502, [('Content-Type', 'text/plain')], f'pitfall proxy: no recorded interaction for {method} {url}'.encode('utf-8')
+            return response["status"], [tuple(i) for i in response["headers"]], _decode_body(response)
+
+        status, response_headers, response_body = self.forward(method, url, headers, body)
+
+        interaction = {
+            "key": key,
+            "request": dict(method=method, url=url, **_encode_body(body)),
+            "response": dict(status=status, headers=response_headers, **_encode_body(response_body))
+        }
+        with self._lock:
+            self.cassette.append(interaction)
+
+        return status, [tuple(i) for i in response_headers], response_body
+
+    def forward(self, method: str, url: str, headers: Dict[str, str], body: bytes) -> Tuple[int, List[List[str]], bytes]:
+        """ sends the request upstream and returns the status, headers and body of the response """
+        parts = urlsplit(url)
+
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        connection       = connection_class(parts.netloc, timeout=60)
+
+        request_headers = {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        if self.target is not None and not headers.get('host'):
+            request_headers['Host'] = parts.netloc
+        request_headers['Content-Length'] = str(len(body))
+
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+
+        try:
+            connection.request(method, target, body=body, headers=request_headers)
+            response = connection.getresponse()
+            response_body = response.read()
+        finally:
+            connection.close()
+
+        response_headers = [[k, v] for k, v in response.getheaders() if k.lower() not in HOP_BY_HOP_HEADERS]
+        return response.status, response_headers, response_body
+
+
+def _handler(proxy: PulumiRecordingProxy) -> type:
+    """ returns a request handler class bound to the proxy """
+    class ProxyRequestHandler(BaseHTTPRequestHandler):
+        protocol_version        = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # the headers and body are written separately, which would otherwise be delayed by ~40ms
+
+        def log_message(self, format, *args):
+            pass
+
+        def _read_body(self) -> bytes:
+            if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+                return b''.join(chunks)
+
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _handle(self) -> None:
+            body    = self._read_body()
+            headers = {k.lower(): v for k, v in self.headers.items()}
+
+            if proxy.target is not None and not self.path.startswith(('http://', 'https://')):
+                headers.pop('host', None)  # requests sent directly to the proxy are addressed to the target
+
+            try:
+                status, response_headers, response_body = proxy.handle(self.command, self.path, headers, body)
+            except OSError as e:
+                status, response_headers, response_body = 502, [('Content-Type', 'text/plain')], f'pitfall proxy: {e}'.encode('utf-8')
+
+            self.send_response(status)
+            for k, v in response_headers:
+                if k.lower() != 'content-length':
+                    self.send_header(k, v)
+                elif self.command == 'HEAD':
+                    self.send_header(k, v)  # the length of the body that a GET would return
+            if self.command != 'HEAD':
+                self.send_header('Content-Length', str(len(response_body)))
+            self.end_headers()
+
+            if self.command != 'HEAD':
+                self.wfile.write(response_body)
+
+        do_GET     = _handle
+        do_HEAD    = _handle
+        do_POST    = _handle
+        do_PUT     = _handle
+        do_PATCH   = _handle
+        do_DELETE  = _handle
+        do_OPTIONS = _handle
+
+        def do_CONNECT(self) -> None:
+            with proxy._lock:
+                proxy.misses.append(f'CONNECT {self.path}')
+            self.send_error(501, 'pitfall proxy does not intercept TLS. Configure the endpoints with http:// URLs')
+
+    return ProxyRequestHandler
@@ -0,0 +1,278 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+from . import exceptions
+from .config import PulumiConfigurationKey
+from .core import PulumiIntegrationTestOptions
+from .plugins import PulumiPlugin
+from .pool import PulumiStackPool
+from .shared import to_configuration_key
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Set, Tuple, Union
+import shutil
+import tempfile
+import time
+
+
+@dataclass
+class StackGraphNode:
+    """
+    A Pulumi program in a StackGraph.
+
+    :type name: str
+    :param name: the name of the stack in the graph
+
+    :type directory: Path
+    :param directory: the directory of the Pulumi program
+
+    :type config: List[PulumiConfigurationKey]
+    :param config: the configuration of the stack, to which the outputs of its dependencies are added
+
+    :type plugins: List[PulumiPlugin]
+    :param plugins: the plugins required by the stack
+
+    :type opts: PulumiIntegrationTestOptions
+    :param opts: the options of the stack. The preview, up, cleanup and destroy options are ignored
+
+    :type depends_on: Dict[str, Dict[str, str]]
+    :param depends_on: the names of the stacks this stack depends on, each mapped to the names of the outputs it
+        requires and the configuration keys they are passed as, or to None to pass every output under its own name
+    """
+    name: str
+    directory: Path
+    config: List[PulumiConfigurationKey] = field(default_factory=list)
+    plugins: List[PulumiPlugin] = field(default_factory=list)
+    opts: PulumiIntegrationTestOptions = field(default_factory=PulumiIntegrationTestOptions)
+    depends_on: Dict[str, Union[Dict[str, str], None]] = field(default_factory=dict)
+
+
+@dataclass
+class StackGraphResult:
+    """ the outcome of deploying or destroying the stacks of a StackGraph """
+    outputs: Dict[str, dict] = field(default_factory=dict)  # the outputs of each deployed stack
+    errors: Dict[str, BaseException] = field(default_factory=dict)  # the error raised by each stack that failed
+    skipped: List[str] = field(default_factory=list)  # the stacks not attempted because a stack they depend on failed
+    durations: Dict[str, float] = field(default_factory=dict)  # the number of seconds taken by each attempted stack
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.errors and not self.skipped
+
+    def raise_for_errors(self) -> None:
+        """ raises PulumiStackGraphError if any stack failed or was skipped """
+        if not self.succeeded:
+            raise exceptions.PulumiStackGraphError(errors=self.errors, skipped=self.skipped)
+
+
+class StackGraph:
+    """
+    A system of Pulumi programs that depend on the outputs of each other, eg. network -> cluster -> app.
+    Stacks are deployed in topological order and destroyed in reverse, each as soon as the stacks it waits
+    for are done, running independent stacks in parallel. A stack that fails only stops the stacks that
+    depend on it, when deploying, or that it depends on, when destroying.
+
+    Stacks are deployed and destroyed in separate processes, as each changes the working directory and
+    environment of its process. An executor can be passed to `deploy` and `destroy`, eg. a
+    ProcessPoolExecutor with a particular multiprocessing context, but not a ThreadPoolExecutor.
+
+    :type root: Path
+    :param root: the directory of the workspaces of the stacks, by default a new temporary directory
+
+    :type max_workers: int
+    :param max_workers: the maximum number of stacks deployed or destroyed at once by the default executor
+
+    :type verbose: bool
+    :param verbose: print when each stack is deployed or destroyed
+    """
+    def __init__(self, root: Union[str, Path] = None, max_workers: int = None, verbose: bool = False) -> None:
+        self.nodes: Dict[str, StackGraphNode] = {}
+
+        self.root        = None if root is None else Path(root).absolute()
+        self.max_workers = max_workers
+        self.verbose     = verbose
+
+        self._temporary_root = root is None  # deleted once every stack is destroyed
+
+        self.outputs: Dict[str, dict] = {}  # the outputs of the deployed stacks
+
+    def __repr__(self):
+        return f"StackGraph(nodes={list(self.nodes)!r})"
+
+    def __enter__(self) -> StackGraph:
+        """ deploys the stacks, destroying them and raising PulumiStackGraphError if any fails """
+        result = self.deploy()
+        if not result.succeeded:
+            self.destroy()
+            result.raise_for_errors()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.destroy().raise_for_errors()
+
+    def add(
+        self, name: str, directory: Union[str, Path], config: List[PulumiConfigurationKey] = None, plugins: List[PulumiPlugin] = None,
+        opts: PulumiIntegrationTestOptions = PulumiIntegrationTestOptions(), depends_on: Dict[str, Union[Dict[str, str], None]] = None
+    ) -> StackGraphNode:
+        """ adds a stack to the graph. The stacks it depends on can be added before or after it """
+        if name in self.nodes:
+            raise ValueError(f"A stack named {name!r} is already in the graph")
+
+        node = StackGraphNode(
+            name=name, directory=Path(directory), config=list(config or []), plugins=list(plugins or []), opts=opts, depends_on=dict(depends_on or {})
+        )
+        self.nodes[name] = node
+        return node
+
+    def dependencies(self, name: str) -> List[str]:
+        """ returns the names of the stacks a stack depends on """
+        return list(self.nodes[name].depends_on)
+
+    def dependents(self, name: str) -> List[str]:
+        """ returns the names of the stacks that depend on a stack """
+        return [i.name for i in self.nodes.values() if name in i.depends_on]
+
+    def order(self) -> List[List[str]]:
+        """ returns the names of the stacks in topological order, grouped in levels of stacks that are independent of each other """
+        for node in self.nodes.values():
+            for dependency in node.depends_on:
+                if dependency not in self.nodes:
+                    raise ValueError(f"Stack {node.name!r} depends on {dependency!r}, which is not in the graph")
+
+        remaining = {name: len(node.depends_on) for name, node in self.nodes.items()}
+        levels: List[List[str]] = []
+
+        level = [name for name, count in remaining.items() if count == 0]
+        while level:
+            levels.append(level)
+            for name in level:
+                remaining.pop(name)
+
+            following: List[str] = []
+            for name in level:
+                for dependent in self.dependents(name):
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        following.append(dependent)
+            level = following
+
+        if remaining:
+            raise exceptions.PulumiDependencyCycleError(f"The dependencies between stacks form a cycle: {', '.join(sorted(remaining))}")
+
+        return levels
+
+    def pool(self, name: str) -> PulumiStackPool:
+        """ returns the single-stack pool of the workspace of a stack, configured with the outputs of the stacks it depends on """
+        node   = self.nodes[name]
+        config = list(node.config)
+
+        for dependency, keys in node.depends_on.items():
+            outputs = self.outputs.get(dependency, {})  # not deployed when the stack is only destroyed
+            if keys is None:
+                keys = {i: i for i in outputs}
+            config.extend(to_configuration_key(name=key, value=outputs[output]) for output, key in keys.items() if output in outputs)
+
+        if self.root is None:
+            self.root = Path(tempfile.mkdtemp(prefix='pitfall-graph-'))
+
+        opts = replace(node.opts, preview=False, up=False)
+        return PulumiStackPool(directory=node.directory, size=1, config=config, plugins=node.plugins, opts=opts, root=self.root.joinpath(name))
+
+    def deploy(self, executor: Executor = None) -> StackGraphResult:
+        """ deploys the stacks in topological order, running independent stacks in parallel """
+        return self._run(action='deploy', waits_for=self.dependencies, executor=executor)
+
+    def destroy(self, executor: Executor = None) -> StackGraphResult:
+        """ destroys the stacks in reverse topological order, running independent stacks in parallel """
+        result = self._run(action='destroy', waits_for=self.dependents, executor=executor)
+        for name in self.nodes:
+            if name not in result.errors and name not in result.skipped:
+                self.outputs.pop(name, None)
+
+        if result.succeeded and self._temporary_root and self.root is not None:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.root = None
+
+        return result
+
+    def _run(self, action: str, waits_for: Callable[[str], List[str]], executor: Executor = None) -> StackGraphResult:
+        """ runs the action on each stack once the stacks it waits for have succeeded, skipping it if any of them failed """
+        result = StackGraphResult()
+
+        self.order()  # the graph must be valid for every stack to be run or skipped
+
+        worker = _deploy if action == 'deploy' else _destroy
+
+        owned: Union[ProcessPoolExecutor, None] = None  # the default executor, shut down once the stacks have run
+        if executor is None:
+            executor = owned = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        pending: Set[str] = set(self.nodes)
+        done: Set[str] = set()
+        running: Dict[Future, Tuple[str, float]] = {}
+
+        try:
+            while pending or running:
+                for name in sorted(pending):
+                    if any(i in result.errors or i in result.skipped for i in waits_for(name)):
+                        pending.discard(name)
+                        result.skipped.append(name)
+                        if self.verbose:
+                            print(f"Skipped stack {name}")
+                    elif all(i in done for i in waits_for(name)):
+                        pending.discard(name)
+                        running[executor.submit(worker, self.pool(name))] = (name, time.monotonic())
+
+                if not running:
+                    continue  # skipping stacks may have made others skippable
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    name, start = running.pop(future)
+                    result.durations[name] = time.monotonic() - start
+
+                    error = future.exception()
+                    if error is not None:
+                        result.errors[name] = error
+                        if self.verbose:
+                            print(f"Failed to {action} stack {name}: {error}")
+                        continue
+
+                    done.add(name)
+                    if action == 'deploy':
+                        result.outputs[name] = self.outputs[name] = future.result()  # passed to the stacks that depend on it
+
+                    if self.verbose:
+                        print(f"{action.capitalize()}ed stack {name} in {result.durations[name]:.1f}s")
+        finally:
+            if owned is not None:
+                owned.shutdown(wait=True)
+
+        return result
+
+
+def _deploy(pool: PulumiStackPool) -> Dict[str, Any]:
+    """ deploys the stack of a pool, or updates it if it is already deployed, and returns its outputs """
+    with pool.lease() as stack:
+        stack.up.execute()
+        stack.baseline_deployed()
+        return stack.get_stack_outputs()
+
+
+def _destroy(pool: PulumiStackPool) -> None:
+    """ destroys the stack of a pool and deletes its workspace """
+    pool.destroy()
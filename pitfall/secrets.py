@@ -0,0 +1,163 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from . import exceptions
+from . import utils
+from typing import Any, Dict, Iterable, List
+import json
+
+
+# Pulumi marks secret values in the state file with this signature
+SECRET_SIGNATURE_KEY = '4dabf18193072939515e22adb298388d'
+SECRET_SIGNATURE     = '1b47061264138c4ac30d75fd1eb44270'
+
+
+def is_secret(value: Any) -> bool:
+    """ returns True if the value is an encrypted Pulumi secret """
+    return isinstance(value, dict) and value.get(SECRET_SIGNATURE_KEY) == SECRET_SIGNATURE
+
+
+class PulumiSecretsDecryptor:
+    """
+    Decrypts the secrets in the Pulumi state file using the encryption key of the stack's
+    secrets provider. Plaintext values are cached by ciphertext, so each secret is only
+    decrypted once.
+
+    :type key: bytes
+    :param key: the encryption key used by the stack's secrets provider
+    """
+    def __init__(self, key: bytes = None) -> None:
+        self.key = key
+        self._plaintexts: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._plaintexts)
+
+    def decrypt(self, ciphertext: str) -> Any:
+        """ returns the decrypted value of a single secret """
+        if ciphertext not in self._plaintexts:
+            self.decrypt_all([ciphertext])
+        return self._plaintexts[ciphertext]
+
+    def decrypt_all(self, ciphertexts: Iterable[str]) -> None:
+        """ decrypts a batch of secrets and caches their plaintext values """
+        pending = {i for i in ciphertexts if i not in self._plaintexts}
+        if not pending:
+            return
+
+        if self.key is None:
+            raise exceptions.PulumiSecretDecryptionError("No encryption key is available to decrypt the Pulumi secret")
+
+        for ciphertext in pending:
+            plaintext = utils.get_decrypted_secret(ciphertext, self.key)
+            try:
+                self._plaintexts[ciphertext] = json.loads(plaintext)
+            except ValueError as e:
+                raise exceptions.PulumiSecretDecryptionError(f"Decrypted Pulumi secret is not valid JSON: {e}") from e
+
+    def reveal(self, value: Any) -> Any:
+        """ returns a copy of value with every secret replaced by its decrypted value """
+        self.decrypt_all(find_ciphertexts(value))
+        return self._substitute(value)
+
+    def reveal_resource(self, resource: Any) -> Dict[str, Any]:
+        """ returns the decrypted inputs and outputs of a resource """
+        return self.reveal_resources([resource])[resource.urn]
+
+    def reveal_resources(self, resources: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        """ returns the decrypted inputs and outputs of each resource by URN, decrypting all of their secrets in one batch """
+        resources = list(resources)
+
+        ciphertexts: List[str] = []
+        for i in resources:
+            ciphertexts.extend(find_ciphertexts(i.inputs))
+            ciphertexts.extend(find_ciphertexts(i.outputs))
+
+        self.decrypt_all(ciphertexts)
+
+        return {i.urn: {"inputs": self._substitute(i.inputs), "outputs": self._substitute(i.outputs)} for i in resources}
+
+    def _substitute(self, value: Any) -> Any:
+        if is_secret(value):
+            return self._plaintexts[value["ciphertext"]]
+        elif isinstance(value, PulumiSecret):
+            return self._plaintexts[value.ciphertext]
+        elif isinstance(value, dict):
+            return {k: self._substitute(v) for k, v in value.items()}
+        elif isinstance(value, list):
+            return [self._substitute(i) for i in value]
+        return value
+
+
+class PulumiSecret:
+    """
+    A secret value from the Pulumi state file. The ciphertext is only decrypted
+    when the value is first accessed.
+
+    :type ciphertext: str
+    :param ciphertext: the base64 formatted encrypted secret, eg. v1:<nonce>:<message>
+
+    :type decryptor: PulumiSecretsDecryptor
+    :param decryptor: the decryptor holding the encryption key used by the stack's secrets provider
+    """
+    def __init__(self, ciphertext: str, decryptor: PulumiSecretsDecryptor = None) -> None:
+        self.ciphertext = ciphertext
+        self.decryptor  = PulumiSecretsDecryptor() if decryptor is None else decryptor
+
+    def __repr__(self) -> str:
+        return "PulumiSecret('[secret]')"
+
+    def __eq__(self, other: Any) -> bool:
+        """ secrets are equal if they have the same ciphertext, without decrypting them """
+        if not isinstance(other, PulumiSecret):
+            return NotImplemented
+        return self.ciphertext == other.ciphertext
+
+    def __hash__(self) -> int:
+        return hash(self.ciphertext)
+
+    @property
+    def value(self) -> Any:
+        """ returns the decrypted value of the secret """
+        return self.decryptor.decrypt(self.ciphertext)
+
+
+def find_ciphertexts(value: Any) -> List[str]:
+    """ returns the ciphertext of every secret in value """
+    ciphertexts: List[str] = []
+
+    stack = [value]
+    while stack:
+        i = stack.pop()
+        if is_secret(i):
+            ciphertexts.append(i["ciphertext"])
+        elif isinstance(i, PulumiSecret):
+            ciphertexts.append(i.ciphertext)
+        elif isinstance(i, dict):
+            stack.extend(i.values())
+        elif isinstance(i, list):
+            stack.extend(i)
+
+    return ciphertexts
+
+
+def wrap_secrets(value: Any, decryptor: PulumiSecretsDecryptor = None) -> Any:
+    """ returns a copy of value with each encrypted Pulumi secret replaced by a PulumiSecret """
+    if is_secret(value):
+        return PulumiSecret(ciphertext=value["ciphertext"], decryptor=decryptor)
+    elif isinstance(value, dict):
+        return {k: wrap_secrets(v, decryptor) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [wrap_secrets(i, decryptor) for i in value]
+    return value
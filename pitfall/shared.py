@@ -0,0 +1,202 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+from . import secrets
+from . import utils
+from .config import PulumiConfigurationKey
+from .core import PulumiIntegrationTestOptions
+from .plugins import PulumiPlugin
+from .pool import PulumiStackPool
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, List, Union
+import fcntl
+import json
+import os
+import tempfile
+import uuid
+
+
+class PulumiSharedStack:
+    """
+    A base stack, such as a VPC, that is deployed once and shared by the tests of a session, and by
+    the sessions of other test processes on the same host, eg. pytest-xdist workers. Its outputs are
+    passed to dependent tests as configuration keys. It is destroyed when the last user releases it.
+
+    :type directory: Path
+    :param directory: the directory of the Pulumi program of the base stack
+
+    :type config: List[PulumiConfigurationKey]
+    :param config: the configuration of the base stack
+
+    :type plugins: List[PulumiPlugin]
+    :param plugins: the plugins required by the base stack
+
+    :type opts: PulumiIntegrationTestOptions
+    :param opts: the options of the base stack. The preview, up, cleanup and destroy options are ignored
+
+    :type root: Path
+    :param root: the directory of the workspace and the users of the base stack, by default in the system's temporary directory
+    """
+    def __init__(
+        self, directory: Union[str, Path], config: List[PulumiConfigurationKey] = None, plugins: List[PulumiPlugin] = None,
+        opts: PulumiIntegrationTestOptions = PulumiIntegrationTestOptions(), root: Union[str, Path] = None
+    ) -> None:
+        directory = utils.get_directory_abspath(Path(directory))
+
+        if root is None:
+            program_sha1sum = utils.sha1sum(bytes(directory))[:16]
+            root = Path(tempfile.gettempdir()).joinpath(f'pitfall-shared-{program_sha1sum}')
+        self.root = Path(root).absolute()
+
+        self.pool = PulumiStackPool(directory=directory, size=1, config=config, plugins=plugins, opts=replace(opts, preview=False, up=False), root=self.root)
+
+        self.token = uuid.uuid4().hex  # identifies this user of the base stack
+        self._outputs: Union[Dict[str, Any], None] = None
+
+    def __repr__(self):
+        return f"PulumiSharedStack(directory={str(self.pool.directory)!r}, root={str(self.root)!r})"
+
+    def __enter__(self) -> PulumiSharedStack:
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.release()
+
+    @property
+    def users_filepath(self) -> Path:
+        return self.root.joinpath('users.json')
+
+    @property
+    def acquired(self) -> bool:
+        return self._outputs is not None
+
+    def acquire(self) -> Dict[str, Any]:
+        """ registers this user of the base stack, deploys it unless it is already deployed, and returns its outputs """
+        if self._outputs is not None:
+            return self._outputs
+
+        with self._users() as users:
+            users[self.token] = os.getpid()
+
+        try:
+            # the lock of the stack is held while it is deployed, so the users that arrive meanwhile wait for its outputs
+            with self.pool.lease() as stack:
+                if not stack.deployed:
+                    stack.up.execute()
+                    stack.baseline_deployed()
+                self._outputs = stack.get_stack_outputs()
+        except BaseException:
+            self.release()
+            raise
+
+        return self._outputs
+
+    def release(self) -> bool:
+        """ unregisters this user of the base stack, and destroys it if no other users remain. Returns True if it was destroyed """
+        with self._users() as users:
+            self._outputs = None
+            if users.pop(self.token, None) is None:
+                return False  # not a user of the base stack
+
+            # users whose process has exited without releasing the base stack are removed
+            for token, pid in list(users.items()):
+                if not _process_exists(pid):
+                    users.pop(token)
+
+            if users:
+                return False
+
+            # the users file remains locked while the base stack is destroyed, so new users wait to deploy it again
+            self.pool.destroy()
+            return True
+
+    @property
+    def outputs(self) -> Dict[str, Any]:
+        """ returns the outputs of the base stack, acquiring it if necessary """
+        return self.acquire()
+
+    def config(self, keys: Dict[str, str] = None) -> List[PulumiConfigurationKey]:
+        """
+        Returns outputs of the base stack as configuration keys of a dependent test. By default, every output is
+        passed under its own name, otherwise `keys` maps the names of outputs to the names of configuration keys.
+        Lists and dictionaries are passed as JSON, to be read with `require_object()`, and secrets are encrypted.
+        """
+        outputs = self.outputs
+
+        if keys is None:
+            keys = {i: i for i in outputs}
+
+        return [to_configuration_key(name=name, value=outputs[output]) for output, name in keys.items()]
+
+    def _users(self) -> _UsersFile:
+        return _UsersFile(self.users_filepath)
+
+
+class _UsersFile:
+    """ the locked file of the users of a base stack, mapping their tokens to their process IDs """
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def __enter__(self) -> Dict[str, int]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.lock = self.path.with_suffix('.lock').open('a')
+        fcntl.flock(self.lock.fileno(), fcntl.LOCK_EX)
+
+        self.users = json.loads(self.path.read_text()) if self.path.exists() else {}
+        return self.users
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        try:
+            self.path.write_text(json.dumps(self.users))
+        finally:
+            self.lock.close()
+
+
+def to_configuration_key(name: str, value: Any) -> PulumiConfigurationKey:
+    """ returns a stack output as a configuration key, encrypting it if it is or contains a secret """
+    encrypted = len(secrets.find_ciphertexts(value)) > 0
+    value     = _reveal(value)
+
+    if isinstance(value, (dict, list)) or value is None:
+        value = json.dumps(value)
+
+    if encrypted:
+        value = value.encode('utf-8') if isinstance(value, str) else json.dumps(value).encode('utf-8')
+
+    return PulumiConfigurationKey(name=name, value=value, encrypted=encrypted)
+
+
+def _reveal(value: Any) -> Any:
+    """ returns a copy of a stack output with each PulumiSecret replaced by its value """
+    if isinstance(value, secrets.PulumiSecret):
+        return _reveal(value.value)
+    elif isinstance(value, dict):
+        return {k: _reveal(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_reveal(i) for i in value]
+    return value
+
+
+def _process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,221 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from . import exceptions
+from . import secrets
+from . import utils
+from .actions import PulumiPreview
+from .diff import diff_properties
+from .state import PulumiResources, PulumiState
+from os import PathLike
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Pattern, Sequence, Tuple, Union
+import json
+import os
+import re
+
+
+# set to `true` to overwrite snapshots that do not match instead of failing
+SNAPSHOT_UPDATE_ENV = 'PITFALL_UPDATE_SNAPSHOTS'
+
+# the keys whose values differ on every deployment
+VOLATILE_KEYS = ('id',)
+
+# the keys of the properties Pulumi auto-names by appending a random suffix to the resource name
+AUTONAMED_KEYS = ('name',)
+
+# the random suffix of an auto-named property, eg. logs-1a2b3c4
+AUTONAME_SUFFIX = re.compile(r'-[0-9a-f]{7}$')
+
+# patterns matching the parts of strings that differ on every deployment, and their replacements
+VOLATILE_PATTERNS: List[Tuple[Pattern, str]] = [
+    (re.compile(r'(urn:pulumi:)[^:]+(::)'), r'\1<stack>\2'),
+    (re.compile(r'\bpitf-(project|stack)-[0-9a-f]{16}\b'), r'pitf-\1-<random>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b'), '<uuid>'),
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?'), '<timestamp>'),
+]
+
+
+def normalize(
+    value: Any, volatile_keys: Iterable[str] = VOLATILE_KEYS, patterns: Sequence[Tuple[Pattern, str]] = None,
+    autonamed_keys: Iterable[str] = AUTONAMED_KEYS
+) -> Any:
+    """
+    returns a copy of value with the volatile parts replaced by placeholders: the values of
+    `volatile_keys` become '<id>' and secrets become '<secret>', and `patterns` are substituted
+    in all strings including dictionary keys. The random suffix of the string values of
+    `autonamed_keys` becomes '-<random>'; other strings ending in 7 hex digits are left as is
+    """
+    if patterns is None:
+        patterns = VOLATILE_PATTERNS
+    volatile_keys  = frozenset(volatile_keys)
+    autonamed_keys = frozenset(autonamed_keys)
+
+    def substitute(s: str) -> str:
+        for regex, replacement in patterns:
+            s = regex.sub(replacement, s)
+        return s
+
+    def walk(v: Any) -> Any:
+        if secrets.is_secret(v) or isinstance(v, secrets.PulumiSecret):
+            return '<secret>'
+        elif isinstance(v, dict):
+            return {substitute(k): walk_property(k, v[k]) for k in v}
+        elif isinstance(v, (list, tuple)):
+            return [walk(i) for i in v]
+        elif isinstance(v, str):
+            return substitute(v)
+        return v
+
+    def walk_property(k: str, v: Any) -> Any:
+        if k in volatile_keys and v is not None:
+            return f'<{k}>'
+        elif k in autonamed_keys and isinstance(v, str):
+            return AUTONAME_SUFFIX.sub('-<random>', substitute(v))
+        return walk(v)
+
+    return walk(value)
+
+
+def snapshot_resources(resources: Iterable[Any]) -> Dict[str, dict]:
+    """ returns the resources of a PulumiState or PulumiResources keyed by URN, in a form suitable for a snapshot """
+    snapshot = {}
+    for i in resources:
+        snapshot[i.urn] = {
+            "type": i.type,
+            "id": i.id,
+            "parent": None if i.parent is None else i.parent.urn,
+            "provider": i.provider,
+            "inputs": i.inputs,
+            "outputs": i.outputs
+        }
+    return snapshot
+
+
+def snapshot_steps(steps: Iterable[Any]) -> Dict[str, List[dict]]:
+    """ returns the steps of a PulumiPreview keyed by URN, in a form suitable for a snapshot. A replaced resource has several steps """
+    snapshot: Dict[str, List[dict]] = {}
+    for i in steps:
+        snapshot.setdefault(i.urn, []).append({
+            "op": i.op,
+            "type": i.new_state_type,
+            "parent": i.parent,
+            "provider": i.provider,
+            "inputs": i.new_state_inputs,
+            "diff_reasons": i.diff_reasons
+        })
+    return snapshot
+
+
+def serialize(value: Any) -> bytes:
+    """ returns the canonical serialization of value: JSON with sorted keys and a fixed indent """
+    return (json.dumps(value, sort_keys=True, indent=2, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+
+
+class PulumiSnapshots:
+    """
+    Compares the resources of a stack or the steps of a preview with snapshots stored as JSON files.
+    Values are normalized and serialized canonically, and their SHA256 hash is compared with that of the
+    snapshot file. The snapshot is only parsed and diffed when the hashes differ. A missing snapshot is recorded.
+
+    :type directory: PathLike
+    :param directory: the directory containing the snapshot files, eg. tests/snapshots
+
+    :type update: bool
+    :param update: overwrite snapshots that do not match. Defaults to the PITFALL_UPDATE_SNAPSHOTS environment variable
+
+    :type volatile_keys: Iterable[str]
+    :param volatile_keys: the keys whose values are replaced by a placeholder
+
+    :type patterns: Sequence[Tuple[Pattern, str]]
+    :param patterns: the regular expressions substituted in strings. Defaults to VOLATILE_PATTERNS
+
+    :type autonamed_keys: Iterable[str]
+    :param autonamed_keys: the keys of auto-named properties whose random suffix is replaced by a placeholder
+    """
+    def __init__(
+        self, directory: Union[PathLike, str], update: bool = None,
+        volatile_keys: Iterable[str] = VOLATILE_KEYS, patterns: Sequence[Tuple[Pattern, str]] = None,
+        autonamed_keys: Iterable[str] = AUTONAMED_KEYS
+    ) -> None:
+        if update is None:
+            update = os.environ.get(SNAPSHOT_UPDATE_ENV, '').lower() in ('1', 'true', 'yes')
+
+        self.directory      = Path(directory)
+        self.update         = update
+        self.volatile_keys  = tuple(volatile_keys)
+        self.patterns       = patterns
+        self.autonamed_keys = tuple(autonamed_keys)
+
+        self._hashes: Dict[Path, Tuple[int, int, str]] = {}  # path -> (size, mtime_ns, sha256) of the snapshot file
+
+    def path(self, name: str) -> Path:
+        return self.directory.joinpath(f'{name}.json')
+
+    def prepare(self, value: Any) -> Any:
+        """ returns the normalized snapshot of a PulumiPreview, PulumiState, PulumiResources or plain data """
+        if isinstance(value, PulumiPreview):
+            value = snapshot_steps(value.iter_steps())
+        elif isinstance(value, PulumiState):
+            value = snapshot_resources(value.resources)
+        elif isinstance(value, PulumiResources):
+            value = snapshot_resources(value)
+        return normalize(value, volatile_keys=self.volatile_keys, patterns=self.patterns, autonamed_keys=self.autonamed_keys)
+
+    def _file_hash(self, path: Path) -> Union[str, None]:
+        """ returns the SHA256 hash of a snapshot file, cached until the file is modified. Returns None if it does not exist """
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+
+        cached = self._hashes.get(path)
+        if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+            return cached[2]
+
+        digest = utils.sha256sum(path.read_bytes())
+        self._hashes[path] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def _write(self, path: Path, contents: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(contents)
+
+        st = path.stat()
+        self._hashes[path] = (st.st_size, st.st_mtime_ns, utils.sha256sum(contents))
+
+    def matches(self, name: str, value: Any) -> bool:
+        """ returns True if value matches the snapshot `name`, comparing hashes only """
+        contents = serialize(self.prepare(value))
+        return self._file_hash(self.path(name)) == utils.sha256sum(contents)
+
+    def assert_match(self, name: str, value: Any) -> None:
+        """
+        raises PulumiSnapshotMismatchError with the differences if value does not match the snapshot `name`.
+        The snapshot is written if it does not exist or if updating is enabled
+        """
+        path     = self.path(name)
+        prepared = self.prepare(value)
+        contents = serialize(prepared)
+
+        expected = self._file_hash(path)
+        if expected == utils.sha256sum(contents):
+            return
+
+        if expected is None or self.update:
+            self._write(path, contents)
+            return
+
+        changes = diff_properties(json.loads(path.read_text()), json.loads(contents))
+        raise exceptions.PulumiSnapshotMismatchError(name=name, changes=changes)
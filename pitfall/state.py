@@ -14,33 +14,219 @@
 
 from __future__ import annotations
 from . import utils
+from . import codec
+from . import diff
 from . import exceptions
-from anytree import NodeMixin, RenderTree, AbstractStyle, ContStyle, findall_by_attr
-from anytree.exporter import DotExporter
+from . import exporter
+from . import fixtures
+from . import graph
+from . import history
+from . import secrets
+from . import streaming
+from anytree import NodeMixin, AbstractStyle, ContStyle, LoopError, TreeError, findall_by_attr
 from dataclasses import dataclass, field
 from os import PathLike
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Union
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+import gzip
+import jmespath
 import json
 import subprocess
+import sys
+import zlib
+
+
+# the size in characters above which the properties of a resource are compressed in memory
+COMPRESSION_THRESHOLD = 256
+
+# the maximum size of the preset dictionary the properties of resources are compressed with, that of zlib's window
+PRESET_DICTIONARY_SIZE = 32768
+
+# the attributes of resources that PulumiResources builds hash indexes on
+INDEXED_ATTRIBUTES = ('type', 'provider', 'id', 'parent')
+
+MISSING = object()
+
+
+class PropertyCompressor:
+    """
+    Compresses the properties of the resources of a state file with a preset dictionary made of the properties
+    of the first resource of each type, so that resources of a type that was seen before, which mostly share
+    their keys and many of their values, only store how they differ from it.
+    """
+    def __init__(self) -> None:
+        self.dictionary: bytes = b''
+        self._types: set       = set()
+
+    def compress(self, rtype: str, payload: str) -> Tuple[Union[str, bytes], Union[bytes, None]]:
+        """ returns the payload, compressed if it is large, and the preset dictionary it was compressed with """
+        data = payload.encode('utf-8')
+
+        if rtype not in self._types and len(self.dictionary) + len(data) <= PRESET_DICTIONARY_SIZE:
+            self._types.add(rtype)
+            self.dictionary += data  # a new bytes object, so that resources keep the dictionary they were compressed with
+
+        if len(payload) <= COMPRESSION_THRESHOLD:
+            return payload, None
+
+        if not self.dictionary:
+            return zlib.compress(data, 1), None
+
+        compressor = zlib.compressobj(1, zdict=self.dictionary)
+        return compressor.compress(data) + compressor.flush(), self.dictionary
 
 
 class PulumiResource(NodeMixin):
+    """
+    A resource in the Pulumi state. Resources created from the state file with
+    `from_state()` store their inputs, outputs and dependencies as compact JSON,
+    compressed if it is large, which is only decoded when one of them is first accessed.
+
+    The links to the parent and children of the resource are held in its own slots rather
+    than by NodeMixin, and the list of children is only allocated for resources that have some.
+    """
+    # NodeMixin defines no __slots__, so resources still have a __dict__, but as every attribute is stored in a slot it is never allocated
+    __slots__ = ('urn', 'type', 'id', 'provider', '_properties', '_payload', '_dictionary', '_parent', '_children')
+
     def __init__(self,
-        urn: str, rtype: str, rid: str, provider: str = None,
+        urn: str, rtype: str, rid: Union[str, None], provider: str = None,
         inputs: dict = None, outputs: dict = None, dependencies: dict = None,
-        parent: Union['PulumiResource', None] = None
+        parent: Union['PulumiResource', None] = None, depends_on: List[str] = None
     ) -> None:
         super().__init__()
 
-        self.urn          = urn
-        self.type         = rtype
-        self.id           = rid
-        self.provider     = provider
-        self.inputs       = inputs
-        self.outputs      = outputs
-        self.dependencies = dependencies
-        self.parent       = parent
+        self.urn                                          = urn
+        self.type                                         = rtype
+        self.id                                           = rid
+        self.provider                                     = provider
+        self._payload: Union[str, bytes]                  = ''  # the encoded properties, until they are materialized
+        self._dictionary: Union[bytes, None]              = None  # the preset dictionary the payload was compressed with
+        self._properties: Union[list, None]               = [inputs, outputs, dependencies, depends_on]
+        self._parent: Union[PulumiResource, None]         = None
+        self._children: Union[List[PulumiResource], None] = None
+        self.parent                                       = parent
+
+    @classmethod
+    def from_state(cls, resource: dict, compressor: PropertyCompressor = None) -> PulumiResource:
+        """ creates a resource from its representation in the Pulumi state file. Pass the same compressor for all resources of a state file """
+        provider = resource.get("provider")
+        if provider is not None:
+            provider = sys.intern(provider)
+
+        obj = cls(urn=resource["urn"], rtype=sys.intern(resource["type"]), rid=resource.get("id"), provider=provider)
+
+        properties = [
+            resource.get("inputs", {}), resource.get("outputs", {}), resource.get("propertyDependencies", {}), resource.get("dependencies", [])
+        ]
+
+        compressor = PropertyCompressor() if compressor is None else compressor
+
+        obj._properties = None
+        obj._payload, obj._dictionary = compressor.compress(obj.type, codec.dumps(properties))
+        return obj
+
+    def _materialize(self) -> list:
+        """ decodes the inputs, outputs and dependencies of this resource on first access """
+        if self._properties is None:
+            payload = self._payload
+            if isinstance(payload, bytes):
+                if self._dictionary is None:
+                    payload = zlib.decompress(payload)
+                else:
+                    decompressor = zlib.decompressobj(zdict=self._dictionary)
+                    payload      = decompressor.decompress(payload) + decompressor.flush()
+
+            self._properties = codec.loads(payload)
+            self._payload    = ''
+            self._dictionary = None
+        return self._properties
+
+    @property
+    def inputs(self) -> Union[dict, None]:
+        return self._materialize()[0]
+
+    @inputs.setter
+    def inputs(self, value: Union[dict, None]) -> None:
+        self._materialize()[0] = value
+
+    @property
+    def outputs(self) -> Union[dict, None]:
+        return self._materialize()[1]
+
+    @outputs.setter
+    def outputs(self, value: Union[dict, None]) -> None:
+        self._materialize()[1] = value
+
+    @property
+    def dependencies(self) -> Union[dict, None]:
+        return self._materialize()[2]
+
+    @dependencies.setter
+    def dependencies(self, value: Union[dict, None]) -> None:
+        self._materialize()[2] = value
+
+    @property
+    def depends_on(self) -> Union[List[str], None]:
+        """ the URNs of the resources this resource depends on, ie. the `dependencies` of the resource in the state file """
+        return self._materialize()[3]
+
+    @depends_on.setter
+    def depends_on(self, value: Union[List[str], None]) -> None:
+        self._materialize()[3] = value
+
+    @property
+    def parent(self) -> Union[PulumiResource, None]:
+        return self._parent
+
+    @parent.setter
+    def parent(self, value: Union[PulumiResource, None]) -> None:
+        """ moves the resource under `value`. Unlike NodeMixin, attaching is O(1) in the number of siblings """
+        if value is self._parent:
+            return
+
+        if value is not None:
+            if not isinstance(value, PulumiResource):
+                raise TreeError(f"Parent node {value!r} is not of type 'PulumiResource'")
+            if any(i is self for i in value.iter_path_reverse()):
+                raise LoopError(f"Cannot set parent. {self!r} is an ancestor of {value!r}")
+
+        if self._parent is not None:
+            siblings = self._parent._children or []
+            del siblings[next(n for n, i in enumerate(siblings) if i is self)]
+
+        if value is not None:
+            if value._children is None:
+                value._children = []
+            value._children.append(self)
+
+        self._parent = value
+
+    @property
+    def children(self) -> Tuple[PulumiResource, ...]:
+        return () if self._children is None else tuple(self._children)
+
+    @children.setter
+    def children(self, children: Iterable[PulumiResource]) -> None:
+        """ replaces the children of the resource, restoring the previous children if any of them cannot be attached """
+        children = tuple(children)
+        if len(set(map(id, children))) != len(children):
+            raise TreeError("Cannot add a node multiple times as child")
+
+        old_children = self.children
+        del self.children
+        try:
+            for child in children:
+                if not isinstance(child, PulumiResource):
+                    raise TreeError(f"Child node {child!r} is not of type 'PulumiResource'")
+                child.parent = self
+        except Exception:
+            self.children = old_children
+            raise
+
+    @children.deleter
+    def children(self) -> None:
+        for child in self.children:
+            child.parent = None
 
     def __repr__(self):
         s = "PulumiResource(urn=%r, rtype=%r, rid=%r, provider=%r, inputs=%r, outputs=%r, dependencies=%r, parent=%r)" % (self.urn, self.type, self.id, self.provider, self.inputs, self.outputs, self.dependencies, self.parent)
@@ -55,6 +241,9 @@ class PulumiResources:
     def __post_init__(self):
         self._providers = {}
         self._types     = {}
+        self._urns: Dict[str, PulumiResource] = {i.urn: i for i in self.items}
+        self._indexes: Dict[str, Dict[Any, List[PulumiResource]]] = {}
+        self._expressions: Dict[str, Any] = {}
 
     def __len__(self) -> int:
         return len(self.items)
@@ -62,53 +251,223 @@ class PulumiResources:
     def __getitem__(self, index):
         return self.items[index]
 
-    def __iter__(self):
-        self.n = 0
-        return self
-
-    def __next__(self):
-        if self.n < len(self):
-            i = self.items[self.n]
-            self.n += 1
-            return i
-        else:
-            raise StopIteration
+    def __iter__(self) -> Iterator[PulumiResource]:
+        return iter(self.items)
 
     def append(self, obj) -> None:
         self.items.append(obj)
+        self._urns[obj.urn] = obj
+
+        for key, index in self._indexes.items():
+            index.setdefault(self.__index_key(obj, key), []).append(obj)
+
+        self._providers = {}
+        self._types     = {}
+
+    @staticmethod
+    def __index_key(resource: PulumiResource, key: str) -> Any:
+        if key == "parent":
+            return None if resource.parent is None else resource.parent.urn
+        return getattr(resource, key)
+
+    def index(self, key: str) -> Dict[Any, List[PulumiResource]]:
+        """ returns the hash index of resources by `key` (ie. type, provider, id, parent), building it on first use """
+        if key not in INDEXED_ATTRIBUTES:
+            raise ValueError(f"Resources are not indexed by {key!r}. Supported: {', '.join(INDEXED_ATTRIBUTES)}")
+
+        if key not in self._indexes:
+            index: Dict[Any, List[PulumiResource]] = {}
+            for i in self.items:
+                index.setdefault(self.__index_key(i, key), []).append(i)
+            self._indexes[key] = index
+
+        return self._indexes[key]
+
+    def get(self, urn: str) -> Union[PulumiResource, None]:
+        """ returns the resource with the URN `urn` or None if it does not exist """
+        return self._urns.get(urn)
 
     def lookup(self, key: str, value: Any) -> Union[Tuple[PulumiResource, ...], Tuple[()]]:
-        """ lookup resources by searching using a key (ie. id, urn, provider, type) and value """
+        """ lookup resources by searching using a key (ie. id, urn, provider, type, parent) and value """
+        if isinstance(value, PulumiResource) and (key == "urn" or key in INDEXED_ATTRIBUTES):
+            value = value.urn  # the indexes are keyed by URN, eg. the parent index by the URN of the parent
+
+        if key == "urn":
+            resource = self._urns.get(value)
+            return () if resource is None else (resource,)
+        elif key in INDEXED_ATTRIBUTES:
+            return tuple(self.index(key).get(value, ()))
+
         return findall_by_attr(self.items[0], name=key, value=value)
 
+    def where(self, expression: str = None, **criteria: Any) -> Tuple[PulumiResource, ...]:
+        """
+        returns the resources matching all of the criteria. Criteria on the indexed attributes (ie. urn, type,
+        provider, id, parent) are served by hash indexes. Nested inputs, outputs and dependencies are matched by
+        joining keys with double underscores, eg. outputs__tags__Environment="test". If the value of a criterion
+        is callable, it is used as a predicate on the attribute's value instead. `expression` is an optional
+        JMESPath expression evaluated on each candidate, eg. "outputs.tags.Environment == 'test'"
+        """
+        indexed: List[Tuple[str, Any]] = []
+        remaining: List[Tuple[List[str], Any]] = []
+
+        for name, value in criteria.items():
+            if name in ('urn',) + INDEXED_ATTRIBUTES and not callable(value):
+                if isinstance(value, PulumiResource):
+                    value = value.urn
+                indexed.append((name, value))
+            else:
+                remaining.append((name.split('__'), value))
+
+        candidates: Union[List[PulumiResource], Tuple[PulumiResource, ...]] = self.items
+
+        if indexed:
+            # the smallest set of candidates from the indexes is filtered by the remaining criteria
+            matches  = [self.lookup(key=key, value=value) for key, value in indexed]
+            smallest = min(range(len(matches)), key=lambda x: len(matches[x]))
+
+            candidates = matches[smallest]
+            remaining.extend(([key], value) for n, (key, value) in enumerate(indexed) if n != smallest)
+
+        compiled = None
+        if expression is not None:
+            compiled = self._expressions.get(expression)
+            if compiled is None:
+                compiled = self._expressions[expression] = jmespath.compile(expression)
+
+        results = []
+
+        for i in candidates:
+            if all(self.__matches(i, path, value) for path, value in remaining):
+                if compiled is None or compiled.search(self.__to_dict(i)):
+                    results.append(i)
+
+        return tuple(results)
+
+    @classmethod
+    def __matches(cls, resource: PulumiResource, path: List[str], value: Any) -> bool:
+        """ returns True if the attribute of the resource at `path` equals value or satisfies it if value is callable """
+        if path == ["parent"]:
+            actual: Any = None if resource.parent is None else resource.parent.urn
+            if isinstance(value, PulumiResource):
+                value = value.urn
+        else:
+            actual = getattr(resource, path[0], MISSING)
+
+            for key in path[1:]:
+                if isinstance(actual, dict):
+                    actual = actual.get(key, MISSING)
+                elif isinstance(actual, list) and key.isdigit() and int(key) < len(actual):
+                    actual = actual[int(key)]
+                else:
+                    actual = MISSING
+
+                if actual is MISSING:
+                    break
+
+            if actual is MISSING:
+                return False
+
+        if callable(value):
+            return bool(value(actual))
+        return actual == value
+
+    @staticmethod
+    def __to_dict(resource: PulumiResource) -> dict:
+        return {
+            "urn": resource.urn,
+            "type": resource.type,
+            "id": resource.id,
+            "provider": resource.provider,
+            "parent": None if resource.parent is None else resource.parent.urn,
+            "inputs": resource.inputs,
+            "outputs": resource.outputs,
+            "dependencies": resource.dependencies
+        }
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint: dict) -> PulumiResources:
+        """ builds the resources tree from the contents of a Pulumi state file in a single pass """
+        return cls.from_iterable(checkpoint["checkpoint"].get("latest", {}).get("resources", []))
+
+    @classmethod
+    def from_iterable(cls, state_resources: Iterable[dict]) -> PulumiResources:
+        """ builds the resources tree in a single pass from an iterable of resources in the format of the Pulumi state file """
+        pulumi_resources = cls()
+
+        orphans: List[Tuple[PulumiResource, str]] = []
+        compressor = PropertyCompressor()
+
+        for i in state_resources:
+            parent_urn = i.get("parent")
+
+            pulumi_resource = PulumiResource.from_state(i, compressor)
+
+            if parent_urn is not None:
+                parent = pulumi_resources.get(parent_urn)
+                if parent is None:
+                    orphans.append((pulumi_resource, parent_urn))  # parent is listed after its child
+                else:
+                    pulumi_resource.parent = parent
+
+            pulumi_resources.append(pulumi_resource)
+
+        for pulumi_resource, parent_urn in orphans:
+            pulumi_resource.parent = pulumi_resources.get(parent_urn)  # checks for loops
+
+        return pulumi_resources
+
     def __find_root_node(self, node: PulumiResource):
         """ returns the root node of the resources tree """
-        if node.is_root:
-            return node
-        else:
-            return self.__find_root_node(node.parent)
+        while node.parent is not None:
+            node = node.parent
+        return node
 
     def __format_node_name(self, node: PulumiResource) -> str:
         """ formats the node name to 'node.type (node.id)' """
-        s = node.type
-        if node.id:
-            s += f" ({node.id})"
-        return s
+        return exporter.format_node_name(node)
 
-    def render_tree(self, style: AbstractStyle = ContStyle) -> None:
-        """ renders the resources tree in the style set by `style`. Defaults to anytree's ContStyle """
+    def render_tree(self, style: AbstractStyle = ContStyle, file: IO[str] = None) -> None:
+        """ renders the resources tree in the style set by `style` line by line to `file`. Defaults to anytree's ContStyle and stdout """
+        if file is None:
+            file = sys.stdout
         root = self.__find_root_node(self.items[0])
-        print(RenderTree(root, style=ContStyle).by_attr(self.__format_node_name))
+        exporter.render_tree([root], file, style=style, nodenamefunc=self.__format_node_name)
 
-    def export_dotfile(self, filename: PathLike = None) -> None:
+    def export_dotfile(self, filename: PathLike = None, dependencies: bool = False, collapse: Iterable[str] = None) -> None:
         """ exports the resources tree as a DOT file to the file specified by `filename`. Defaults to graph.dot in the local directory otherwise """
         if filename is None:
             filename = Path.cwd().joinpath('graph.dot')
-        else:
-            filename = Path(filename).expanduser().absolute()
+        self.export_graph(filename, fmt='dot', dependencies=dependencies, collapse=collapse)
+
+    def export_graph(self, filename: PathLike, fmt: str = None, dependencies: bool = False, collapse: Iterable[str] = None) -> None:
+        """
+        streams the resources tree to `filename` as a graph in the DOT, GraphML or JSON format, which is
+        inferred from the file extension if `fmt` is not set. Set `dependencies` to also draw the dependencies
+        between resources, and `collapse` to the types of resources whose descendants are collapsed into them
+        """
+        filename = Path(filename).expanduser().absolute()
+
+        if fmt is None:
+            fmt = filename.suffix.lstrip('.').lower()
+            if fmt == 'gv':
+                fmt = 'dot'
+
+        if fmt not in exporter.FORMATS:
+            raise ValueError(f"Unsupported graph format: {fmt!r}. Supported: {', '.join(exporter.FORMATS)}")
 
         root = self.__find_root_node(self.items[0])
-        DotExporter(root, nodenamefunc=self.__format_node_name).to_dotfile(filename)
+
+        graph_exporter = exporter.PulumiGraphExporter(
+            self, dependencies=dependencies, collapse=collapse, nodenamefunc=self.__format_node_name, roots=[root]
+        )
+
+        with filename.open('w') as f:
+            graph_exporter.write(f, fmt=fmt)
+
+    def dependency_graph(self, durations: Dict[str, float] = None) -> graph.PulumiDependencyGraph:
+        """ returns the dependency graph of the resources, optionally weighted by the measured `durations` of their operations by URN """
+        return graph.PulumiDependencyGraph.from_resources(self.items, durations=durations)
 
     @property
     def types(self) -> Dict[str, int]:
@@ -116,8 +475,7 @@ class PulumiResources:
         if len(self._types):
             return self._types
 
-        for i in self.items:
-            self._types[i.type] = self._types.setdefault(i.type, 0) + 1
+        self._types = {k: len(v) for k, v in self.index("type").items()}
 
         return self._types
 
@@ -127,10 +485,10 @@ class PulumiResources:
         if len(self._providers):
             return self._providers
 
-        for i in self.items:
-            if i.provider:
-                provider = i.provider.split("::")[2]
-                self._providers[provider] = self._providers.setdefault(provider, 0) + 1
+        for k, v in self.index("provider").items():
+            if k:
+                provider = k.split("::")[2]
+                self._providers[provider] = self._providers.setdefault(provider, 0) + len(v)
 
         return self._providers
 
@@ -141,10 +499,19 @@ class PulumiState:
     stack: str
     encryptionsalt: str
     version: int = 3
+    encryption_key: bytes = field(default=None, repr=False)
+    retention: history.CheckpointRetention = field(default=None, repr=False)
+    compressed: bool = False  # write the state file compressed with gzip, as Pulumi does when PULUMI_SELF_MANAGED_STATE_GZIP is set
 
     def __post_init__(self) -> None:
         timestamp = utils.get_current_timestamp()
 
+        self.invalidate()
+
+        self._history: Union[history.CheckpointHistory, None] = None
+
+        self.decryptor = secrets.PulumiSecretsDecryptor(key=self.encryption_key)
+
         self.new = {
             'version': self.version,
             'checkpoint': {
@@ -165,20 +532,95 @@ class PulumiState:
             }
         }
 
-    def to_json(self) -> str:
-        return json.dumps(self.current, indent=4)
+    def invalidate(self) -> None:
+        """ clears the cached contents of the state file. Called by actions that modify the state """
+        self._cache: Dict[str, Tuple[Any, Any]] = {}
 
-    def write(self) -> None:
-        self.filepath.parent.mkdir(parents=True, exist_ok=True)
-        self.filepath.write_text(self.to_json())
+    def apply_retention(self) -> None:
+        """ applies the retention policy, if any, to the backups of the state file. Called by actions that modify the state """
+        if self.retention is not None:
+            self.retention.apply(self.history)
+
+    def _cached(self, name: str, key: Any, func: Callable[[], Any]) -> Any:
+        """ returns the value cached under `name` if it was computed for `key`, otherwise computes and caches it with `func` """
+        cached_key, value = self._cache.get(name, (None, None))
+        if key is None or cached_key != key:
+            value = func()
+            self._cache[name] = (key, value)
+        return value
+
+    @property
+    def _cache_key(self) -> Union[Tuple[int, int, int], None]:
+        """ returns the inode, size and modification time of the state file, which change whenever pulumi writes it """
+        try:
+            st = self.filepath.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    @property
+    def digest(self) -> Union[str, None]:
+        """ returns the SHA256 hash of the state file, which unlike its size and modification time changes with every change to its contents """
+        try:
+            return utils.sha256sum(self.filepath.read_bytes())
+        except FileNotFoundError:
+            return None
+
+    def to_json(self, checkpoint: dict = None) -> str:
+        return json.dumps(self.current if checkpoint is None else checkpoint, indent=4)
+
+    def write(self, checkpoint: dict = None) -> None:
+        """ writes the checkpoint, by default the current state, to the state file """
+        contents = self.to_json(checkpoint)
+        filepath = self._stack_filepaths[0]
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+
+        if self.compressed:
+            with gzip.open(filepath, 'wt') as f:
+                f.write(contents)
+        else:
+            filepath.write_text(contents)
+
+        # like Pulumi, remove the state file in the other format so that it is not read instead
+        try:
+            self._stack_filepaths[1].unlink()
+        except FileNotFoundError:
+            pass
+
+    def seed(self, fixture: fixtures.PulumiStateFixture, project: str) -> None:
+        """ writes the checkpoint of a fixture, rewritten for this stack and the project, to the state file """
+        checkpoint = fixture.rebase(stack=self.stack, project=project, encryptionsalt=self.encryptionsalt, encryption_key=self.encryption_key)
+        checkpoint["checkpoint"].setdefault("latest", {})["manifest"] = self.new["checkpoint"]["latest"]["manifest"]
+
+        self.write(checkpoint)
+
+    def _open(self, path: Path) -> IO[bytes]:
+        """ opens the state file at `path` for reading bytes, decompressing it on the fly if it is gzipped """
+        if path.suffix == '.gz':
+            return gzip.open(path, 'rb')
+        return path.open('rb')
 
     @property
     def dirpath(self) -> Path:
         return Path.cwd().joinpath('.pulumi')
 
+    @property
+    def _stack_filepaths(self) -> Tuple[Path, Path]:
+        """ returns the paths of the state file in the preferred and the other format """
+        plain      = self.dirpath.joinpath(f'stacks/{self.stack}.json')
+        compressed = plain.with_name(plain.name + '.gz')
+
+        if self.compressed:
+            return compressed, plain
+        return plain, compressed
+
     @property
     def filepath(self) -> Path:
-        return self.dirpath.joinpath(f'stacks/{self.stack}.json')
+        """ returns the path of the state file, which is `<stack>.json.gz` if it is compressed """
+        preferred, other = self._stack_filepaths
+        if not preferred.exists() and other.exists():
+            return other
+        return preferred
 
     @property
     def pulumi_version(self) -> str:
@@ -203,57 +645,63 @@ class PulumiState:
 
     @property
     def resources(self) -> PulumiResources:
-        pulumi_resources = PulumiResources()
-
-        state_resources = self.current["checkpoint"]["latest"].get("resources", [])
-
-        for i in state_resources:
-            urn        = i["urn"]
-            rtype      = i["type"]
-            provider   = i.get("provider")
-            parent_urn = i.get("parent")
-
-            pulumi_resource = PulumiResource(
-                urn          = urn,
-                rtype        = rtype,
-                rid          = i.get("id"),
-                inputs       = i.get("inputs", {}),
-                outputs      = i.get("outputs", {}),
-                provider     = provider,
-                dependencies = i.get("propertyDependencies", {})
-            )
+        """ retrieve the resources in the current state file. Cached until the state file is modified """
+        return self._cached('resources', self._cache_key, lambda: PulumiResources.from_iterable(self.iter_resources()))
 
-            if parent_urn is not None:
-                results = pulumi_resources.lookup(key="urn", value=parent_urn)
-                if results:
-                    pulumi_resource.parent = results[0]
+    def iter_resources(self) -> Iterator[dict]:
+        """ yields the resources in the current state file one at a time without loading the entire file into memory """
+        try:
+            with self._open(self.filepath) as f:
+                yield from streaming.iter_items(f, ('checkpoint', 'latest', 'resources'))
+        except FileNotFoundError:
+            return
 
-            pulumi_resources.append(pulumi_resource)
-
-        return pulumi_resources
+    @property
+    def outputs(self) -> Union[dict, None]:
+        """ retrieve the stack's outputs from the current state file. Returns None if the stack has no outputs in the state file """
+        key = self._cache_key
+        if key is None:
+            return None
+        return self._cached('outputs', key, self._load_outputs)
+
+    def _load_outputs(self) -> Union[dict, None]:
+        for i in self.iter_resources():
+            if i["type"] == "pulumi:pulumi:Stack":
+                return secrets.wrap_secrets(i.get("outputs", {}), decryptor=self.decryptor)
+        return None
 
     @property
     def current(self) -> dict:
-        """ retrieve the current state from the file """
-        contents = self.new
+        """ retrieve the current state from the file. Cached until the state file is modified, so it must not be modified in place """
+        key = self._cache_key
+        if key is None:
+            return self.new
+        return self._cached('current', key, self._load_current)
 
-        if self.filepath.exists():
-            contents = json.loads(self.filepath.read_text())
-
-        return contents
+    def _load_current(self) -> dict:
+        return codec.load_file(self.filepath)
 
     @property
-    def previous(self) -> dict:
-        """ retrieve the previous state from the file """
+    def history(self) -> history.CheckpointHistory:
+        """ retrieve the index of the backups of the state file, newest first """
         backups_directory = self.dirpath.joinpath(f'backups/{self.stack}')
 
-        state_files = sorted(list(backups_directory.glob('*.json')))
-
-        if len(state_files) > 1:
-            previous_state_file, _  = state_files[-2:]
+        if self._history is None or self._history.directory != backups_directory:
+            self._history = history.CheckpointHistory(directory=backups_directory, stack=self.stack)
 
-            contents = json.loads(previous_state_file.read_text())
-        else:
-            contents = self.new
+        return self._history
 
-        return contents
+    @property
+    def previous(self) -> dict:
+        """ retrieve the previous state from the backups of the state file """
+        if len(self.history) > 1:
+            return self.history[1]
+        return self.new
+
+    def diff(self, old: dict = None, new: dict = None) -> diff.PulumiCheckpointDiff:
+        """ compares two checkpoints by resource URN. Defaults to the changes from the previous to the current state """
+        if old is None:
+            old = self.previous
+        if new is None:
+            new = self.current
+        return diff.diff_checkpoints(old, new)
@@ -0,0 +1,203 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, IO, Iterator, Sequence
+import codecs
+import json
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover
+    ijson = None
+
+
+CHUNK_SIZE = 65536
+
+WHITESPACE = ' \t\n\r'
+
+
+def iter_items(fp: IO, path: Sequence[str], chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """
+    This function yields the items of the JSON array found at `path` in a JSON document
+    one at a time, without loading the entire document into memory. ijson is used if
+    it is installed and fp is opened in binary mode, as ijson reads bytes.
+
+    :param fp: a file object or pipe opened in binary or text mode. Binary input must be UTF-8 encoded
+    :param path: the object keys leading to the array, eg. ('checkpoint', 'latest', 'resources')
+    :param int chunk_size: the number of characters to read from fp at a time
+    :returns: an iterator of the items in the array. Nothing is yielded if the array does not exist
+    """
+    if isinstance(fp.read(0), bytes):
+        if ijson is not None:
+            prefix = '.'.join(list(path) + ['item'])
+            return ijson.items(fp, prefix, use_float=True)
+        fp = codecs.getreader('utf-8')(fp)
+    return JSONStreamReader(fp, chunk_size).iter_items(path)
+
+
+class JSONStreamReader:
+    """ an incremental reader of a JSON document which decodes only the values that are requested """
+    def __init__(self, fp: IO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.fp         = fp
+        self.chunk_size = chunk_size
+        self.decoder    = json.JSONDecoder()
+        self.buffer     = ''
+        self.pos        = 0
+        self.eof        = False
+
+    def iter_items(self, path: Sequence[str]) -> Iterator[Any]:
+        if not self._seek(path) or self._next_char() != '[':
+            return
+
+        self.pos += 1
+
+        if self._next_char() == ']':
+            return
+
+        while True:
+            yield self._decode_value()
+
+            c = self._next_char()
+            self.pos += 1
+            if c == ']':
+                return
+            elif c != ',':
+                raise self._error(f"Expected ',' or ']' but found {c!r}")
+
+    def _seek(self, path: Sequence[str]) -> bool:
+        """ moves to the value found by following the object keys in path """
+        for key in path:
+            if self._next_char() != '{':
+                return False
+            self.pos += 1
+
+            while True:
+                c = self._next_char()
+                if c == '}':
+                    return False
+
+                name = self._decode_value()
+
+                if self._next_char() != ':':
+                    raise self._error("Expected ':' after object key")
+                self.pos += 1
+
+                if name == key:
+                    break
+
+                self._skip_value()
+
+                c = self._next_char()
+                self.pos += 1
+                if c == '}':
+                    return False
+                elif c != ',':
+                    raise self._error(f"Expected ',' or '}}' but found {c!r}")
+
+        return True
+
+    def _fill(self, size: int = None) -> bool:
+        """ reads the next chunk into the buffer, discarding what has been consumed. Returns False at the end of the document """
+        if self.eof:
+            return False
+
+        chunk = self.fp.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos    = 0
+        return True
+
+    def _next_char(self) -> str:
+        """ skips whitespace and returns the next character without consuming it """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self._fill():
+                raise self._error("Unexpected end of JSON document")
+
+    def _decode_value(self) -> Any:
+        """ decodes and consumes the next value, reading more of the document until it is complete """
+        self._next_char()
+
+        size = self.chunk_size
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # double the size of each read so that large values are decoded in O(log n) attempts
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+
+            self.pos = end
+            return value
+
+    def _skip_value(self) -> None:
+        """ consumes the next value without decoding it """
+        depth     = 0
+        in_string = False
+        escaped   = False
+
+        self._next_char()
+
+        while True:
+            if self.pos >= len(self.buffer):
+                if not self._fill():
+                    if depth == 0 and not in_string:
+                        return
+                    raise self._error("Unexpected end of JSON document")
+
+            c = self.buffer[self.pos]
+
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif c == '\\':
+                    escaped = True
+                elif c == '"':
+                    in_string = False
+                    if depth == 0:
+                        self.pos += 1
+                        return
+            elif c == '"':
+                in_string = True
+            elif c in '{[':
+                depth += 1
+            elif c in '}]':
+                if depth == 0:
+                    return  # end of a scalar value inside an object or array
+                depth -= 1
+                if depth == 0:
+                    self.pos += 1
+                    return
+            elif depth == 0 and (c == ',' or c in WHITESPACE):
+                return
+
+            self.pos += 1
+
+    def _error(self, msg: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(msg, self.buffer, self.pos)
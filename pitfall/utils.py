@@ -21,7 +21,12 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, Tuple
 import base64
+import binascii
 import distutils.spawn
+import functools
+import re
+import subprocess
+import sys
 import uuid
 
 
@@ -118,6 +123,17 @@ def generate_encryptionsalt(password: str) -> Tuple[bytes, str]:
     return key, encryptionsalt
 
 
+def get_encryption_key(password: str, encryptionsalt: str) -> bytes:
+    """ derives the encryption key of a stack from its password and the encryptionsalt field of its Pulumi stack file """
+    version, salt_b64 = encryptionsalt.split(':')[:2]
+
+    if version != 'v1':
+        raise exceptions.PulumiSecretDecryptionError(f"Unsupported Pulumi encryption salt version: {version}")
+
+    key, _ = generate_aes_encryption_key(password, base64.b64decode(salt_b64))
+    return key
+
+
 def get_encrypted_secret(plaintext: bytes, key: bytes) -> str:
     """ returns a base64 formatted encrypted Pulumi secret """
     nonce, ciphertext, mac  = encrypt_with_aes_gcm(key, plaintext)
@@ -133,6 +149,33 @@ def get_encrypted_secret(plaintext: bytes, key: bytes) -> str:
     return encrypted_secret
 
 
+def get_decrypted_secret(ciphertext: str, key: bytes) -> bytes:
+    """ returns the plaintext of a base64 formatted encrypted Pulumi secret """
+    try:
+        version, nonce_b64, message_b64 = ciphertext.split(':')
+    except (AttributeError, ValueError) as e:
+        raise exceptions.PulumiSecretDecryptionError("Malformed Pulumi secret, expected v1:<nonce>:<message>") from e
+
+    if version != 'v1':
+        raise exceptions.PulumiSecretDecryptionError(f"Unsupported Pulumi secret version: {version}")
+
+    try:
+        nonce   = base64.b64decode(nonce_b64, validate=True)
+        message = base64.b64decode(message_b64, validate=True)
+    except binascii.Error as e:
+        raise exceptions.PulumiSecretDecryptionError(f"Malformed Pulumi secret: {e}") from e
+
+    # 16-byte MAC tag is appended to the ciphertext
+    index = len(message) - 16
+
+    try:
+        plaintext = decrypt_with_aes_gcm(key, nonce, message[:index], message[index:])
+    except ValueError as e:
+        raise exceptions.PulumiSecretDecryptionError(f"Failed to decrypt Pulumi secret: {e}") from e
+
+    return plaintext
+
+
 def get_current_timestamp() -> str:
     """ returns the current date and time in ISO 8601 format """
     return datetime.now().astimezone().isoformat()
@@ -167,3 +210,55 @@ def find_pulumi_binary() -> str:
     if location is None:
         raise exceptions.PulumiBinaryNotFoundError("Could not find the pulumi binary on the system")
     return location
+
+
+def find_python_binary() -> str:
+    """ returns the Python interpreter used by the Pulumi language host, falling back to the current interpreter """
+    location = distutils.spawn.find_executable('python3')
+    if location is None:
+        location = sys.executable
+    return location
+
+
+@functools.lru_cache()
+def get_python_version(python_binary: str) -> Tuple[int, int]:
+    """ returns the major and minor version of a Python interpreter """
+    cmd = [python_binary, '-c', 'import sys; print("%d.%d" % sys.version_info[:2])']
+
+    try:
+        process = subprocess.run(cmd, capture_output=True)
+    except OSError as e:
+        raise exceptions.PythonVersionExecError(f"Failed to run {python_binary}: {e}") from e
+
+    if process.returncode != 0:
+        raise exceptions.PythonVersionExecError(f"Failed to get the version of {python_binary}: {decode_utf8(process.stderr)}")
+
+    major, minor = decode_utf8(process.stdout).strip().split('.')
+    return int(major), int(minor)
+
+
+def parse_import_times(stderr: str) -> Dict[str, int]:
+    """
+    This function parses the output of `python -X importtime` and returns the
+    cumulative import time in microseconds of each top-level module.
+
+    :param str stderr: the stderr of a Python interpreter run with `-X importtime`
+    :returns: dictionary of top-level module names and their cumulative import time
+    :rtype: dict
+    """
+    regex = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)$')
+
+    import_times: Dict[str, int] = {}
+
+    for line in stderr.splitlines():
+        m = regex.match(line)
+        if m is None:
+            continue
+
+        _, cumulative, indent, module = m.groups()
+
+        # nested imports are indented by two spaces for each level
+        if len(indent) == 1:
+            import_times[module] = int(cumulative)
+
+    return import_times
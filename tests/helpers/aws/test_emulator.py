@@ -0,0 +1,78 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pitfall.helpers.aws.emulator import AWSEmulator
+from unittest.mock import patch
+import json
+import os
+import socket
+import unittest
+
+
+class TestAWSEmulator(unittest.TestCase):
+    def test_profiles(self):
+        self.assertEqual(AWSEmulator().endpoint, 'http://localhost:4566')
+        self.assertEqual(AWSEmulator.moto().endpoint, 'http://localhost:5000')
+        self.assertEqual(AWSEmulator.localstack('http://localstack:4566/').endpoint, 'http://localstack:4566')
+
+        with patch.dict(os.environ, {'LOCALSTACK_ENDPOINT': 'http://127.0.0.1:4567', 'MOTO_ENDPOINT': 'http://127.0.0.1:5001'}):
+            self.assertEqual(AWSEmulator.localstack().endpoint, 'http://127.0.0.1:4567')
+            self.assertEqual(AWSEmulator.moto(region='eu-west-1').endpoint, 'http://127.0.0.1:5001')
+
+    def test_config(self):
+        emulator = AWSEmulator(services=('s3', 'sqs'), endpoints={'s3': 'http://localhost:4572', 'kinesis': 'http://localhost:4568'})
+        config   = {i.name: i for i in emulator.config}
+
+        self.assertEqual(config['aws:region'].value, 'us-east-1')
+        self.assertTrue(config['aws:secretKey'].encrypted)
+        self.assertIsInstance(config['aws:secretKey'].value, bytes)
+        self.assertFalse(config['aws:accessKey'].encrypted)
+
+        for name in ('aws:skipCredentialsValidation', 'aws:skipMetadataApiCheck', 'aws:skipRequestingAccountId', 'aws:s3ForcePathStyle'):
+            self.assertIs(config[name].value, True)
+
+        expected = [{'s3': 'http://localhost:4572', 'sqs': 'http://localhost:4566', 'kinesis': 'http://localhost:4568'}]
+        self.assertEqual(json.loads(config['aws:endpoints'].value), expected)
+
+    def test_environment(self):
+        emulator = AWSEmulator(region='eu-west-1', access_key='a', secret_key='b')
+        self.assertEqual(emulator.environment, {'AWS_ACCESS_KEY_ID': 'a', 'AWS_SECRET_ACCESS_KEY': 'b', 'AWS_DEFAULT_REGION': 'eu-west-1'})
+
+    def test_client(self):
+        emulator = AWSEmulator(endpoint='http://localhost:4599', endpoints={'s3': 'http://localhost:4572'})
+
+        s3 = emulator.client('s3')
+        self.assertEqual(s3.meta.endpoint_url, 'http://localhost:4572')
+        self.assertEqual(s3.meta.region_name, 'us-east-1')
+        self.assertEqual(s3.meta.config.s3['addressing_style'], 'path')
+        self.assertEqual(emulator.client('sqs').meta.endpoint_url, 'http://localhost:4599')
+
+        # clients are pooled across emulators with the same endpoint, region and credentials
+        self.assertIs(s3, emulator.client('s3'))
+        self.assertIs(s3, AWSEmulator(endpoint='http://localhost:4599', endpoints={'s3': 'http://localhost:4572'}).client('s3'))
+        self.assertIsNot(s3, AWSEmulator(endpoint='http://localhost:4572', region='eu-west-1').client('s3'))
+
+        bucket = emulator.resource('s3').Bucket('test')
+        self.assertEqual(bucket.meta.client.meta.endpoint_url, 'http://localhost:4572')
+        self.assertIs(emulator.resource('s3'), emulator.resource('s3'))
+
+    def test_is_available(self):
+        with socket.socket() as listener:
+            listener.bind(('127.0.0.1', 0))
+            listener.listen(1)
+            port = listener.getsockname()[1]
+
+            self.assertTrue(AWSEmulator(endpoint=f'http://127.0.0.1:{port}').is_available())
+
+        self.assertFalse(AWSEmulator(endpoint=f'http://127.0.0.1:{port}').is_available(timeout=0.1))
@@ -19,6 +19,7 @@ from pitfall import exceptions
 from pitfall import utils
 from pathlib import Path
 from unittest.mock import patch, MagicMock
+import gc
 import json
 import subprocess
 import unittest
@@ -141,6 +142,55 @@ class TestPulumiPreview(unittest.TestCase):
         self.assertEqual("pitfall-1174b83f846341908354ffc0-c4f911a.s3.amazonaws.com", pulumi_step.old_state_outputs["bucketDomainName"])
         self.assertEqual("tags", pulumi_step.diff_reasons[0])
 
+    def test_steps_streamed_from_file(self):
+        stdout = Path(__file__).parent.joinpath('test_data/preview.json').read_bytes()
+
+        def run(cmd, stdout=None, stderr=None):
+            stdout.write(Path(__file__).parent.joinpath('test_data/preview.json').read_bytes())
+            stdout.flush()
+            return subprocess.CompletedProcess(args=cmd, returncode=0, stdout=None, stderr=b'')
+
+        with patch('subprocess.run', MagicMock(side_effect=run)):
+            self.pulumi_preview.execute()
+
+        # the output remains on disk until the whole document is requested
+        self.assertIsNone(self.pulumi_preview._stdout)
+
+        steps = list(self.pulumi_preview.iter_steps())
+        self.assertEqual(1, len(steps))
+        self.assertEqual("aws:s3/bucket:Bucket", steps[0].new_state_type)
+        self.assertIsNone(self.pulumi_preview._stdout)
+
+        self.assertDictEqual(json.loads(stdout), self.pulumi_preview.stdout)
+        self.assertEqual(steps, self.pulumi_preview.steps)
+
+        # the temporary file is deleted when the preview is executed again
+        path = Path(self.pulumi_preview._stdout_path)
+        with patch('subprocess.run', MagicMock(side_effect=run)):
+            self.pulumi_preview.execute()
+        self.assertFalse(path.exists())
+
+        # and when the preview is garbage collected
+        path = Path(self.pulumi_preview._stdout_path)
+        self.assertTrue(path.exists())
+        self.pulumi_preview = None
+        gc.collect()
+        self.assertFalse(path.exists())
+
+    def test_stdout_file_is_closed(self):
+        files = []
+
+        def run(cmd, stdout=None, stderr=None):
+            files.append(stdout)
+            stdout.write(b'{"steps": []}')
+            return subprocess.CompletedProcess(args=cmd, returncode=0, stdout=None, stderr=b'')
+
+        with patch('subprocess.run', MagicMock(side_effect=run)):
+            self.pulumi_preview.execute()
+
+        self.assertTrue(files[0].closed)
+        self.assertEqual([], self.pulumi_preview.steps)
+
     def test_change_summary(self):
         create = 1
         same   = 2
@@ -203,6 +253,18 @@ Permalink: file:///Users/aliibrahim/Devel/local/pit/pit-cocobiek/.pulumi/stacks/
         self.assertIsInstance(self.pulumi_up.stderr, str)
         self.assertEqual(expected, self.pulumi_up.stderr)
 
+    def test_execute_invalidates_state(self):
+        self.pulumi_up.state = MagicMock()
+
+        completed_process = subprocess.CompletedProcess(args=self.args, returncode=255, stdout=b'', stderr=b'error: update failed')
+
+        with patch('subprocess.run', MagicMock(return_value=completed_process)):
+            with self.assertRaises(exceptions.PulumiUpExecError):
+                self.pulumi_up.execute()
+
+        self.pulumi_up.state.invalidate.assert_called_once()
+        self.pulumi_up.state.apply_retention.assert_called_once()
+
     def test_execute_with_verbosity(self):
         self.pulumi_up.verbose = True
 
@@ -319,6 +381,17 @@ If you want to remove the stack completely, run 'pulumi stack rm pit-stack-f6822
         self.assertIsInstance(self.pulumi_destroy.stderr, str)
         self.assertEqual(expected, self.pulumi_destroy.stderr)
 
+    def test_execute_invalidates_state(self):
+        self.pulumi_destroy.state = MagicMock()
+
+        completed_process = subprocess.CompletedProcess(args=self.args, returncode=0, stdout=b'', stderr=b'')
+
+        with patch('subprocess.run', MagicMock(return_value=completed_process)):
+            self.pulumi_destroy.execute()
+
+        self.pulumi_destroy.state.invalidate.assert_called_once()
+        self.pulumi_destroy.state.apply_retention.assert_called_once()
+
     def test_execute_with_verbosity(self):
         self.pulumi_destroy.verbose = True
 
@@ -0,0 +1,86 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall import codec
+from unittest.mock import patch
+import gzip
+import json
+import tempfile
+import unittest
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir   = tempfile.TemporaryDirectory()
+        self.previous = codec.get_backend()
+
+        self.document = {"checkpoint": {"latest": {"resources": [{"urn": "urn:pulumi:test::unit::aws:s3/bucket:Bucket::b", "id": "b-é", "outputs": {"size": 10}}]}}}
+
+    def tearDown(self):
+        codec.set_backend(self.previous)
+        self.tmpdir.cleanup()
+
+    def test_available_backends(self):
+        backends = codec.available_backends()
+        self.assertEqual(backends[-1], 'json')
+        self.assertEqual(len(backends), len(set(backends)))
+
+    def test_set_backend(self):
+        self.assertEqual(codec.set_backend('json'), 'json')
+        self.assertEqual(codec.get_backend(), 'json')
+
+        self.assertEqual(codec.set_backend(), codec.available_backends()[0])
+
+        with self.assertRaises(ValueError):
+            codec.set_backend('ujson')
+
+    def test_loads(self):
+        raw = json.dumps(self.document)
+
+        for backend in codec.available_backends():
+            codec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(codec.loads(raw), self.document)
+                self.assertEqual(codec.loads(raw.encode('utf-8')), self.document)
+                self.assertEqual(codec.loads(memoryview(raw.encode('utf-8'))), self.document)
+
+    def test_dumps(self):
+        for backend in codec.available_backends():
+            codec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(json.loads(codec.dumps(self.document)), self.document)
+                self.assertNotIn(' ', codec.dumps({"a": [1, 2]}))
+                self.assertEqual(codec.dumps(self.document, indent=4), json.dumps(self.document, indent=4))
+                self.assertEqual(json.loads(codec.dumps(self.document, indent=2)), self.document)
+
+    def test_load_file(self):
+        plain      = Path(self.tmpdir.name).joinpath('dev.json')
+        compressed = Path(self.tmpdir.name).joinpath('dev.json.gz')
+
+        plain.write_text(json.dumps(self.document, indent=4))
+        with gzip.open(compressed, 'wt') as f:
+            json.dump(self.document, f)
+
+        for backend in codec.available_backends():
+            codec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(codec.load_file(plain), self.document)
+                self.assertEqual(codec.load_file(compressed), self.document)
+
+                with patch('pitfall.codec.MMAP_THRESHOLD', 0):
+                    self.assertEqual(codec.load_file(str(plain)), self.document)
+
+        with self.assertRaises(FileNotFoundError):
+            codec.load_file(Path(self.tmpdir.name).joinpath('missing.json'))
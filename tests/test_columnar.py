@@ -0,0 +1,104 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall import columnar
+from pitfall.actions import PulumiStep
+from pitfall.columnar import DictionaryColumn, PulumiTable, resources_table, steps_table
+from pitfall.state import PulumiResources
+import json
+import tempfile
+import unittest
+
+
+@unittest.skipIf(columnar.np is None, "NumPy is not installed")
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        state_file      = Path(__file__).parent.joinpath('test_data/state.json')
+        self.checkpoint = json.loads(state_file.read_text())
+        self.resources  = PulumiResources.from_checkpoint(self.checkpoint)
+
+    def test_dictionary_column(self):
+        column = DictionaryColumn.encode(["a", "b", None, "a"])
+        self.assertListEqual([0, 1, -1, 0], column.codes.tolist())
+        self.assertListEqual(["a", "b"], column.categories)
+        self.assertListEqual(["a", "b", None, "a"], column.to_list())
+        self.assertDictEqual({"a": 2, "b": 1}, column.value_counts())
+
+    def test_resources_table(self):
+        table = resources_table(self.resources, stack="unit-test", run=7)
+
+        self.assertEqual(13, len(table))
+        self.assertListEqual(["run", "stack", "urn", "type", "provider", "id", "parent"], table.column_names)
+        self.assertListEqual([7] * 13, table["run"].tolist())
+        self.assertEqual("unit-test", table["stack"][12])
+        self.assertIsInstance(table["type"], DictionaryColumn)
+
+        # the vectorized counts match those of PulumiResources
+        self.assertDictEqual(self.resources.types, table.value_counts("type"))
+        self.assertDictEqual(self.resources.providers, table.value_counts("provider"))
+
+        # resources in the format of the state file
+        table = resources_table(self.checkpoint["checkpoint"]["latest"]["resources"])
+        self.assertDictEqual(self.resources.types, table.value_counts("type"))
+        self.assertIsNone(table["stack"][0])
+        self.assertIsNone(table["parent"][0])
+
+    def test_steps_table(self):
+        preview = json.loads(Path(__file__).parent.joinpath('test_data/preview.json').read_text())
+
+        steps = [
+            PulumiStep(op=i["op"], urn=i["urn"], parent=None, provider=i.get("provider"), new_state=i["newState"], old_state={}, detailed_diff={}, diff_reasons=[])
+            for i in preview["steps"]
+        ]
+
+        table = steps_table(steps, run=1)
+        self.assertEqual(len(steps), len(table))
+        self.assertDictEqual({"update": 1, "same": len(steps) - 1}, table.value_counts("op"))
+
+    def test_concat_and_crosstab(self):
+        first  = resources_table(self.resources, stack="first", run=1)
+        second = resources_table(list(self.resources)[:5], stack="second", run=2)
+        empty  = resources_table([], run=3)
+
+        table = PulumiTable.concat([first, second, empty])
+        self.assertEqual(18, len(table))
+        self.assertListEqual(["first", "second"], table["stack"].categories)
+        self.assertDictEqual({"first": 13, "second": 5}, table.value_counts("stack"))
+
+        runs, types, counts = table.crosstab("run", "type")
+        self.assertListEqual([1, 2], runs)
+        self.assertEqual((2, len(types)), counts.shape)
+
+        for n, rtype in enumerate(types):
+            self.assertEqual(self.resources.types[rtype], counts[0][n])
+        self.assertEqual(5, counts[1].sum())
+
+        self.assertEqual(0, len(PulumiTable.concat([])))
+
+    @unittest.skipIf(columnar.pa is None, "pyarrow is not installed")
+    def test_to_arrow(self):
+        table = resources_table(self.resources, stack="unit-test").to_arrow()
+
+        self.assertEqual(13, table.num_rows)
+        self.assertTrue(str(table.schema.field("type").type).startswith("dictionary"))
+        self.assertEqual(self.resources[0].urn, table.column("urn")[0].as_py())
+        self.assertIsNone(table.column("provider")[0].as_py())
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = Path(tmpdir).joinpath('resources.parquet')
+            resources_table(self.resources).write_parquet(filename)
+
+            table = columnar.pq.read_table(str(filename))
+            self.assertEqual(13, table.num_rows)
@@ -17,6 +17,8 @@ from io import StringIO
 from pathlib import Path
 from pitfall.core import PulumiIntegrationTest, PulumiIntegrationTestOptions
 from pitfall.config import PulumiConfigurationKey, DEFAULT_PULUMI_CONFIG_PASSPHRASE, DEFAULT_PULUMI_HOME
+from pitfall.helpers.aws.emulator import AWSEmulator
+from pitfall.mocks import PulumiMocks
 from pitfall.plugins import PulumiPlugin
 from pitfall import exceptions
 from pitfall import utils
@@ -44,6 +46,44 @@ class TestPulumiIntegrationTest(unittest.TestCase):
             if i in os.environ:
                 os.environ.pop(i)
 
+    def test_format_mock_config(self):
+        self.integration_test.config = [
+            PulumiConfigurationKey(name='aws:region', value='us-east-1'),
+            PulumiConfigurationKey(name='environment', value='testing'),
+            PulumiConfigurationKey(name='dbpassword', value=b'qwertyuiop', encrypted=True),
+            PulumiConfigurationKey(name='tags', value={'team': 'platform'})
+        ]
+
+        namespace = self.integration_test.project.name
+
+        expected = {
+            'aws:region': 'us-east-1',
+            f'{namespace}:environment': 'testing',
+            f'{namespace}:dbpassword': 'qwertyuiop',
+            f'{namespace}:tags': '{"team": "platform"}'
+        }
+        self.assertDictEqual(expected, self.integration_test._format_mock_config())
+
+    def test_emulator_config(self):
+        config = [
+            PulumiConfigurationKey(name='aws:region', value='eu-west-1'),
+            PulumiConfigurationKey(name='environment', value='testing')
+        ]
+        opts = PulumiIntegrationTestOptions(cleanup=True, preview=False, emulator=AWSEmulator(endpoint='http://localhost:4566'))
+
+        integration_test = PulumiIntegrationTest(config=config, opts=opts)
+        self.addCleanup(integration_test.delete)
+
+        stack_config = integration_test.stack.config
+
+        self.assertEqual(stack_config['aws:region'], 'eu-west-1')  # keys set by the test take precedence
+        self.assertEqual(stack_config[f'{integration_test.project.name}:environment'], 'testing')
+        self.assertTrue(stack_config['aws:skipCredentialsValidation'])
+        self.assertEqual(json.loads(stack_config['aws:endpoints'])[0]['s3'], 'http://localhost:4566')
+
+        ciphertext = stack_config['aws:secretKey']['secure']
+        self.assertEqual(utils.get_decrypted_secret(ciphertext, integration_test.encryption_key), b'integration-testing')
+
     def test_encrypt_and_format_config(self):
         secret_config_key = 'dbpassword'
         secret_config_value = b'qwertyuiop'
@@ -234,6 +274,89 @@ class TestPulumiIntegrationTest(unittest.TestCase):
 
         self.assertIsNone(os.environ.get(environment_variable))
 
+    def test_set_pulumi_envvars_with_precompile(self):
+        self.integration_test.opts.precompile = True
+
+        with patch('pitfall.utils.get_python_version', MagicMock(return_value=(3, 8))):
+            self.integration_test._set_pulumi_envvars()
+
+        expected = str(Path(DEFAULT_PULUMI_HOME).joinpath('pycache'))
+        self.assertEqual(expected, os.environ.pop('PYTHONPYCACHEPREFIX'))
+
+        # PYTHONPYCACHEPREFIX is not supported before Python 3.8
+        with patch('pitfall.utils.get_python_version', MagicMock(return_value=(3, 7))):
+            self.integration_test._set_pulumi_envvars()
+
+        self.assertNotIn('PYTHONPYCACHEPREFIX', os.environ)
+        self.assertNotIn('PYTHONPYCACHEPREFIX', self.integration_test.pulumi_environment_variables)
+
+    def test_set_pulumi_envvars_with_compress_state(self):
+        self.integration_test.opts.compress_state = True
+
+        with patch.dict(os.environ, {}):
+            os.environ.pop('PULUMI_SELF_MANAGED_STATE_GZIP', None)
+
+            self.integration_test._set_pulumi_envvars()
+
+            self.assertTrue(self.integration_test.state_compressed)
+            self.assertEqual('true', os.environ['PULUMI_SELF_MANAGED_STATE_GZIP'])
+
+            # the variable only applies to this test
+            self.integration_test._restore_environment()
+            self.assertNotIn('PULUMI_SELF_MANAGED_STATE_GZIP', os.environ)
+
+            self.integration_test.opts.compress_state = False
+            self.assertFalse(self.integration_test.state_compressed)
+
+    def test_context_manager_with_compress_state(self):
+        opts = PulumiIntegrationTestOptions(cleanup=True, preview=False, compress_state=True)
+
+        with patch.dict(os.environ, {}):
+            os.environ.pop('PULUMI_SELF_MANAGED_STATE_GZIP', None)
+
+            with PulumiIntegrationTest(opts=opts) as t:
+                self.assertEqual('true', os.environ['PULUMI_SELF_MANAGED_STATE_GZIP'])
+                self.assertTrue(t.state.filepath.name.endswith('.json.gz'))
+
+            self.assertNotIn('PULUMI_SELF_MANAGED_STATE_GZIP', os.environ)
+
+            # a later test in the same process writes a plain state file
+            with PulumiIntegrationTest(opts=PulumiIntegrationTestOptions(cleanup=True, preview=False)) as t:
+                self.assertNotIn('PULUMI_SELF_MANAGED_STATE_GZIP', os.environ)
+                self.assertTrue(t.state.filepath.name.endswith('.json'))
+
+    def test_compile_pulumi_code(self):
+        self.integration_test.tmp_directory.joinpath('__main__.py').write_text('import json\n')
+
+        elapsed = self.integration_test._compile_pulumi_code()
+        self.assertIsInstance(elapsed, float)
+        self.assertEqual(elapsed, self.integration_test.compile_time)
+
+        pycache = self.integration_test.tmp_directory.joinpath('__pycache__')
+        self.assertTrue(any(pycache.glob('__main__.*.pyc')))
+
+    def test_compile_pulumi_code_raises_exception(self):
+        self.integration_test.tmp_directory.joinpath('__main__.py').write_text('import json\ndef\n')
+
+        with self.assertRaises(exceptions.PulumiProgramCompileError):
+            self.integration_test._compile_pulumi_code()
+
+    def test_get_import_times(self):
+        program = 'from os import path\nimport json\nimport json.decoder\n'
+        self.integration_test.tmp_directory.joinpath('__main__.py').write_text(program)
+
+        import_times = self.integration_test.get_import_times()
+
+        self.assertIn('json', import_times)
+        self.assertIsInstance(import_times['json'], int)
+        self.assertNotIn('json.decoder', import_times)
+
+    def test_get_import_times_raises_exception(self):
+        self.integration_test.tmp_directory.joinpath('__main__.py').write_text('import pitfall_does_not_exist\n')
+
+        with self.assertRaises(exceptions.PulumiProgramImportError):
+            self.integration_test.get_import_times()
+
     def test_workspace(self):
         self.assertTrue(self.integration_test.workspace.name.startswith(self.integration_test.project.name))
         self.assertTrue(self.integration_test.workspace.name.endswith('workspace.json'))
@@ -268,6 +391,21 @@ class TestPulumiIntegrationTest(unittest.TestCase):
             self.assertIsInstance(outputs, dict)
             self.assertDictEqual(json_stdout, outputs)
 
+    def test_get_stack_outputs_from_state(self):
+        self.integration_test._change_directory(choice='test')
+
+        contents = json.loads(Path(__file__).parent.joinpath('test_data/state.json').read_text())
+        contents["checkpoint"]["latest"]["resources"][0]["outputs"] = {"s3_bucket_name": "pitfall-test-bucket"}
+
+        self.integration_test.state.filepath.parent.mkdir(parents=True)
+        self.integration_test.state.filepath.write_text(json.dumps(contents))
+
+        with patch('subprocess.run') as mock_run:
+            outputs = self.integration_test.get_stack_outputs()
+            mock_run.assert_not_called()
+
+        self.assertDictEqual({"s3_bucket_name": "pitfall-test-bucket"}, outputs)
+
     def test_get_stack_outputs_raises_exception(self):
         stdout = b'error: no Pulumi.yaml project file found'
 
@@ -357,3 +495,67 @@ class TestPulumiIntegrationTestWithContextManager(unittest.TestCase):
                 self.assertIsInstance(t, PulumiIntegrationTest)
 
             mock_destroy.return_value.execute.assert_called()
+
+    def test_context_manager_with_proxy(self):
+        proxy = MagicMock()
+        proxy.environment = {'HTTP_PROXY': 'http://127.0.0.1:8123', 'http_proxy': 'http://127.0.0.1:8123', 'NO_PROXY': 'localhost,127.0.0.1,::1'}
+
+        opts = PulumiIntegrationTestOptions(cleanup=True, preview=False, proxy=proxy)
+
+        with patch.dict(os.environ, {'HTTP_PROXY': 'http://corporate:3128', 'NO_PROXY': '.internal'}):
+            os.environ.pop('http_proxy', None)
+
+            with PulumiIntegrationTest(opts=opts):
+                proxy.start.assert_called_once()
+                self.assertEqual(os.environ['HTTP_PROXY'], 'http://127.0.0.1:8123')
+                self.assertEqual(os.environ['http_proxy'], 'http://127.0.0.1:8123')
+                self.assertEqual(os.environ['NO_PROXY'], 'localhost,127.0.0.1,::1')
+
+            proxy.stop.assert_called_once()
+            self.assertEqual(os.environ['HTTP_PROXY'], 'http://corporate:3128')
+            self.assertEqual(os.environ['NO_PROXY'], '.internal')
+            self.assertNotIn('http_proxy', os.environ)
+
+    def test_context_manager_with_proxy_stop_error(self):
+        proxy = MagicMock()
+        proxy.environment      = {'HTTPS_PROXY': 'http://127.0.0.1:8123'}
+        proxy.stop.side_effect = exceptions.PulumiProxyRecordingError("No interactions were recorded")
+
+        opts = PulumiIntegrationTestOptions(cleanup=True, preview=False, proxy=proxy)
+
+        with patch.dict(os.environ, {}):
+            os.environ.pop('HTTPS_PROXY', None)
+
+            with self.assertRaises(exceptions.PulumiProxyRecordingError):
+                with PulumiIntegrationTest(opts=opts) as t:
+                    pass
+
+            self.assertNotIn('HTTPS_PROXY', os.environ)
+            self.assertFalse(t.tmp_directory.exists())
+
+    def test_context_manager_with_fixture(self):
+        fixture = MagicMock()
+        opts    = PulumiIntegrationTestOptions(cleanup=True, preview=False, fixture=fixture)
+
+        with patch('pitfall.core.PulumiState', autospec=True) as mock_state:
+            with PulumiIntegrationTest(opts=opts) as t:
+                mock_state.return_value.seed.assert_called_once_with(fixture, project=t.project.name)
+                mock_state.return_value.write.assert_not_called()
+
+    def test_context_manager_with_mocks(self):
+        opts = PulumiIntegrationTestOptions(cleanup=True, preview=True, up=True, destroy=True, mocks=PulumiMocks())
+
+        with patch('pitfall.core.PulumiMockRun', autospec=True) as mock_run, \
+                patch('pitfall.core.PulumiPreview', autospec=True) as mock_preview, \
+                patch('pitfall.core.PulumiUp', autospec=True) as mock_up, \
+                patch('pitfall.core.PulumiDestroy', autospec=True) as mock_destroy, \
+                patch.object(PulumiIntegrationTest, '_install_pulumi_plugins') as mock_install:
+
+            with PulumiIntegrationTest(opts=opts) as t:
+                self.assertIs(t.mock, mock_run.return_value)
+
+            mock_run.return_value.execute.assert_called_once()
+            mock_preview.return_value.execute.assert_not_called()
+            mock_up.return_value.execute.assert_not_called()
+            mock_destroy.return_value.execute.assert_not_called()
+            mock_install.assert_not_called()
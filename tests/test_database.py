@@ -0,0 +1,173 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall.database import PulumiResourceRow, PulumiStateDatabase, get_field, resource_key
+from pitfall.state import PulumiResources
+from unittest.mock import MagicMock, patch
+import json
+import tempfile
+import unittest
+
+
+def rebase(resources: list, stack: str, project: str) -> list:
+    """ returns a copy of the resources of the test state file as if they were deployed by another test, with its own stack and project names """
+    text = json.dumps(resources)
+    text = text.replace('pitf-stack-388ef76614da4d71', stack).replace('pitf-project-f90c97ba86734aed', project)
+    return json.loads(text)
+
+
+class TestPulumiStateDatabase(unittest.TestCase):
+    def setUp(self):
+        state_file      = Path(__file__).parent.joinpath('test_data/state.json')
+        self.checkpoint = json.loads(state_file.read_text())
+        self.resources  = self.checkpoint["checkpoint"]["latest"]["resources"]
+
+        self.database = PulumiStateDatabase()
+
+    def tearDown(self):
+        self.database.close()
+
+    def test_get_field(self):
+        outputs = {"arn": "arn:aws:s3:::test", "tags": {"Name": "test"}}
+        self.assertEqual("arn:aws:s3:::test", get_field(outputs, "arn"))
+        self.assertEqual("test", get_field(outputs, "tags.Name"))
+        self.assertIsNone(get_field(outputs, "tags.Owner"))
+        self.assertIsNone(get_field(outputs, "arn.Name"))
+
+    def test_export(self):
+        run = self.database.export(self.resources, name="first", stack="unit-test", fields=["arn", "tags.Environment"])
+        self.assertEqual(1, run)
+
+        runs = self.database.runs()
+        self.assertEqual(1, len(runs))
+        self.assertEqual("first", runs[0]["name"])
+        self.assertEqual("unit-test", runs[0]["stack"])
+
+        rows = self.database.query()
+        self.assertEqual(13, len(rows))
+
+        bucket = self.database.query(type="aws:s3/bucket:Bucket")[0]
+        self.assertIsInstance(bucket, PulumiResourceRow)
+        self.assertEqual("pitfall-14add43", bucket.id)
+        self.assertEqual(self.resources[0]["urn"], bucket.parent)
+
+        expected = next(i for i in self.resources if i["type"] == "aws:s3/bucket:Bucket")
+        self.assertDictEqual(expected["outputs"], bucket.outputs)
+        self.assertDictEqual(expected["inputs"], bucket.inputs)
+        self.assertDictEqual(expected["propertyDependencies"], bucket.dependencies)
+
+        self.assertEqual("aws:s3/bucket:Bucket::pitfall", bucket.key)
+
+        values = self.database.values("arn")
+        self.assertDictEqual({1: expected["outputs"]["arn"]}, values["aws:s3/bucket:Bucket::pitfall"])
+
+        dependencies = sum(len(i.get("dependencies", [])) for i in self.resources)
+        count        = self.database.connection.execute("SELECT COUNT(*) FROM dependencies").fetchone()[0]
+        self.assertEqual(dependencies, count)
+
+    def test_export_in_batches(self):
+        with patch('pitfall.database.BATCH_SIZE', 5):
+            run = self.database.export(self.resources, fields=["arn"])
+
+        self.assertEqual(13, len(self.database.query(run=run)))
+        self.assertEqual(13, sum(self.database.counts().values()))
+
+    def test_export_pulumi_resources(self):
+        resources = PulumiResources.from_checkpoint(self.checkpoint)
+        run       = self.database.export(resources)
+
+        rows = self.database.query(run=run)
+        self.assertListEqual([i.urn for i in resources], [i.urn for i in rows])
+        self.assertListEqual([None if i.parent is None else i.parent.urn for i in resources], [i.parent for i in rows])
+
+    def test_export_state(self):
+        state = MagicMock(stack="unit-test")
+        state.iter_resources.return_value = iter(self.resources)
+
+        run = self.database.export_state(state, name="test")
+        self.assertEqual("unit-test", self.database.runs()[0]["stack"])
+        self.assertEqual(13, len(self.database.query(run=run)))
+
+    def test_query(self):
+        self.database.export(self.resources)
+
+        rows = self.database.query("id LIKE ?", ["subnet-%"], type="aws:ec2/subnet:Subnet")
+        self.assertEqual(2, len(rows))
+
+        self.assertListEqual([], self.database.query(urn="unknown"))
+
+        with self.assertRaises(ValueError):
+            self.database.query(outputs="{}")
+
+    def test_resource_key(self):
+        bucket = 'urn:pulumi:pitf-stack-1::pitf-project-1::aws:s3/bucket:Bucket::pitfall'
+        self.assertEqual('aws:s3/bucket:Bucket::pitfall', resource_key(bucket))
+        self.assertEqual('aws:s3/bucket:Bucket::pitfall', resource_key('aws:s3/bucket:Bucket::pitfall'))
+
+        subnet = 'urn:pulumi:dev::vpc::ComponentResource:VpcWithPublicSubnets$aws:ec2/subnet:Subnet::public-1::a'
+        self.assertEqual('ComponentResource:VpcWithPublicSubnets$aws:ec2/subnet:Subnet::public-1::a', resource_key(subnet))
+
+        self.assertEqual('pulumi:pulumi:Stack', resource_key(self.resources[0]["urn"]))
+
+    def test_counts_and_replacements(self):
+        first = self.database.export(rebase(self.resources, 'pitf-stack-1', 'pitf-project-1'), fields=["tags.Environment"])
+
+        # each test run deploys the program in a stack and project with generated names
+        resources = rebase(self.resources, 'pitf-stack-2', 'pitf-project-2')
+        bucket    = next(i for i in resources if i["type"] == "aws:s3/bucket:Bucket")
+        bucket["id"] = "pitfall-replaced"
+        bucket["outputs"]["tags"]["Environment"] = "drifted"
+        resources.pop()
+
+        second = self.database.export(resources, fields=["tags.Environment"])
+
+        self.assertEqual(2, self.database.counts(run=first)["aws:ec2/subnet:Subnet"])
+        self.assertEqual(1, self.database.counts(run=first)["aws:ec2/route:Route"])
+        self.assertNotIn("aws:ec2/route:Route", self.database.counts(run=second))
+        self.assertEqual(2, self.database.counts()["aws:s3/bucket:Bucket"])
+
+        key = "aws:s3/bucket:Bucket::pitfall"
+        self.assertEqual(key, resource_key(bucket["urn"]))
+
+        replacements = self.database.replacements(rtype="aws:s3/bucket:Bucket")
+        self.assertDictEqual({key: 1}, replacements)
+        self.assertDictEqual({}, self.database.replacements(rtype="aws:ec2/vpc:Vpc"))
+
+        values = self.database.values("tags.Environment", key=key)
+        self.assertEqual("drifted", values[key][second])
+        self.assertNotEqual("drifted", values[key][first])
+
+        # a URN from any run selects the same resource
+        self.assertDictEqual(values, self.database.values("tags.Environment", key=bucket["urn"]))
+
+    def test_replacements_counts_each_change(self):
+        for n, rid in enumerate(["pitfall-a", "pitfall-b", "pitfall-a", "pitfall-a"]):
+            resources = rebase(self.resources, f'pitf-stack-{n}', f'pitf-project-{n}')
+            next(i for i in resources if i["type"] == "aws:s3/bucket:Bucket")["id"] = rid
+            self.database.export(resources)
+
+        # A -> B -> A is two replacements, although the resource only had two distinct ids
+        self.assertDictEqual({"aws:s3/bucket:Bucket::pitfall": 2}, self.database.replacements(rtype="aws:s3/bucket:Bucket"))
+
+    def test_database_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir).joinpath('state.db')
+
+            with PulumiStateDatabase(path) as database:
+                database.export(self.resources)
+
+            with PulumiStateDatabase(path) as database:
+                self.assertEqual(1, len(database.runs()))
+                self.assertEqual(13, len(database.query()))
@@ -0,0 +1,104 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall.diff import PulumiPropertyChange, diff_checkpoints, diff_properties
+import copy
+import json
+import unittest
+
+
+class TestDiffProperties(unittest.TestCase):
+    def test_diff_properties(self):
+        old = {"bucket": "test", "tags": {"Name": "test", "Owner": "ops"}, "rules": [{"days": 30}, {"days": 60}], "acl": "private"}
+        new = {"bucket": "test", "tags": {"Name": "prod", "Team": "ops"}, "rules": [{"days": 90}], "versioning": True}
+
+        expected = [
+            PulumiPropertyChange(path="acl", old="private", kind="delete"),
+            PulumiPropertyChange(path="rules[0].days", old=30, new=90),
+            PulumiPropertyChange(path="rules[1]", old={"days": 60}, kind="delete"),
+            PulumiPropertyChange(path="tags.Name", old="test", new="prod"),
+            PulumiPropertyChange(path="tags.Owner", old="ops", kind="delete"),
+            PulumiPropertyChange(path="tags.Team", new="ops", kind="add"),
+            PulumiPropertyChange(path="versioning", new=True, kind="add")
+        ]
+        self.assertListEqual(expected, diff_properties(old, new))
+
+    def test_diff_properties_type_change(self):
+        expected = [PulumiPropertyChange(path="tags", old=None, new={"Name": "test"})]
+        self.assertListEqual(expected, diff_properties({"tags": None}, {"tags": {"Name": "test"}}))
+
+    def test_diff_properties_unchanged(self):
+        self.assertListEqual([], diff_properties({"tags": {"Name": "test"}}, {"tags": {"Name": "test"}}))
+
+
+class TestDiffCheckpoints(unittest.TestCase):
+    def setUp(self):
+        state_file = Path(__file__).parent.joinpath('test_data/state.json')
+        self.old   = json.loads(state_file.read_text())
+        self.new   = copy.deepcopy(self.old)
+
+        self.resources = self.new["checkpoint"]["latest"]["resources"]
+
+    def find(self, rtype: str) -> dict:
+        return next(i for i in self.resources if i["type"] == rtype)
+
+    def test_no_changes(self):
+        result = diff_checkpoints(self.old, self.new)
+        self.assertFalse(result)
+        self.assertEqual(0, len(result))
+        self.assertEqual(13, result.unchanged)
+
+    def test_changes(self):
+        bucket = self.find("aws:s3/bucket:Bucket")
+        bucket["outputs"]["tags"]["Environment"] = "prod"
+
+        vpc = self.find("aws:ec2/vpc:Vpc")
+        vpc["id"] = "vpc-123"
+
+        route = self.find("aws:ec2/route:Route")
+        self.resources.remove(route)
+
+        added = {"urn": "urn:pulumi:test::test::aws:sqs/queue:Queue::queue", "type": "aws:sqs/queue:Queue", "id": "queue"}
+        self.resources.append(added)
+
+        result = diff_checkpoints(self.old, self.new)
+        self.assertTrue(result)
+        self.assertEqual(4, len(result))
+        self.assertDictEqual({"add": 1, "remove": 1, "replace": 1, "update": 1, "same": 10}, result.summary)
+
+        self.assertEqual(added["urn"], result.added[0].urn)
+        self.assertEqual("add", result.added[0].operation)
+        self.assertIs(added, result.added[0].new)
+
+        self.assertEqual(route["urn"], result.removed[0].urn)
+        self.assertEqual("aws:ec2/route:Route", result.removed[0].type)
+
+        self.assertEqual(vpc["urn"], result.replaced[0].urn)
+        self.assertIn(PulumiPropertyChange(path="id", old="vpc-0704f4b9f5ad93528", new="vpc-123"), result.replaced[0].properties)
+
+        self.assertEqual(bucket["urn"], result.updated[0].urn)
+        self.assertListEqual(["outputs.tags.Environment"], [i.path for i in result.updated[0].properties])
+        self.assertEqual("prod", result.updated[0].properties[0].new)
+
+        self.assertEqual(4, len(result.changes))
+
+    def test_iterable_of_resources(self):
+        self.resources.pop()
+        result = diff_checkpoints(self.old["checkpoint"]["latest"]["resources"], iter(self.resources))
+        self.assertDictEqual({"add": 0, "remove": 1, "replace": 0, "update": 0, "same": 12}, result.summary)
+
+    def test_empty_checkpoint(self):
+        result = diff_checkpoints({"version": 3, "checkpoint": {"stack": "test", "latest": {}}}, self.new)
+        self.assertEqual(13, len(result.added))
@@ -0,0 +1,147 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from anytree import AsciiStyle, ContStyle, RenderTree
+from io import StringIO
+from pathlib import Path
+from pitfall.exporter import PulumiGraphExporter, dot_quote, find_roots, format_node_name, render_tree, walk
+from pitfall.state import PulumiResource, PulumiResources
+import json
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+
+class TestExporter(unittest.TestCase):
+    def setUp(self):
+        state_file     = Path(__file__).parent.joinpath('test_data/state.json')
+        self.resources = PulumiResources.from_checkpoint(json.loads(state_file.read_text()))
+        self.root      = self.resources[0]
+
+        self.component = self.resources.lookup(key="type", value="ComponentResource:VpcWithPublicSubnets")[0]
+        self.vpc       = self.resources.lookup(key="type", value="aws:ec2/vpc:Vpc")[0]
+        self.route     = self.resources.lookup(key="type", value="aws:ec2/route:Route")[0]
+
+    def test_find_roots(self):
+        roots = find_roots(self.resources)
+        self.assertEqual(self.root, roots[0])
+        self.assertListEqual(["pulumi:pulumi:Stack", "pulumi:providers:aws", "pulumi:providers:aws"], [i.type for i in roots])
+
+    def test_walk(self):
+        nodes = [i for i, _ in walk([self.root])]
+        self.assertEqual(11, len(nodes))
+        self.assertListEqual(list(self.root.descendants), nodes[1:])
+
+    def test_render_tree(self):
+        for style in (ContStyle, AsciiStyle()):
+            with self.subTest(style=style):
+                expected = RenderTree(self.root, style=style).by_attr(format_node_name) + '\n'
+
+                actual = StringIO()
+                render_tree([self.root], actual, style=style)
+                self.assertEqual(expected, actual.getvalue())
+
+    def test_render_deep_tree(self):
+        # a chain of resources deeper than the recursion limit
+        depth = sys.getrecursionlimit() + 100
+        parent = root = PulumiResource(urn="0", rtype="test:index:Resource", rid=None)
+        for i in range(1, depth):
+            parent = PulumiResource(urn=str(i), rtype="test:index:Resource", rid=str(i), parent=parent)
+
+        output = StringIO()
+        render_tree([root], output)
+        self.assertEqual(depth, len(output.getvalue().splitlines()))
+
+    def test_dot_quote(self):
+        self.assertEqual('"a \\"b\\" \\\\c"', dot_quote('a "b" \\c'))
+
+    def test_write_dot(self):
+        output = StringIO()
+        PulumiGraphExporter(self.resources, roots=[self.root]).write(output, fmt='dot')
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual('digraph tree {', lines[0])
+        self.assertEqual('}', lines[-1])
+        self.assertEqual(11, len([i for i in lines if '[label=' in i]))
+        self.assertEqual(10, len([i for i in lines if '->' in i]))
+        self.assertNotIn('style=dashed', output.getvalue())
+
+    def test_write_dot_with_dependencies(self):
+        output = StringIO()
+        PulumiGraphExporter(self.resources, dependencies=True).write_dot(output)
+
+        contents = output.getvalue()
+        self.assertEqual(13, contents.count('[label='))  # includes the providers, which are also roots
+        self.assertIn(f'{dot_quote(self.route.urn)} -> ', contents)
+        self.assertIn(f' -> {dot_quote(self.vpc.urn)} [style=dashed];', contents)
+
+    def test_collapse(self):
+        exporter = PulumiGraphExporter(self.resources, dependencies=True, collapse=["ComponentResource:VpcWithPublicSubnets"], roots=[self.root])
+
+        nodes = list(exporter.nodes())
+        self.assertListEqual(["pulumi:pulumi:Stack", "ComponentResource:VpcWithPublicSubnets", "aws:s3/bucket:Bucket"], [i.type for i, _ in nodes])
+        self.assertListEqual([0, 8, 0], [i for _, i in nodes])
+        self.assertEqual("ComponentResource:VpcWithPublicSubnets [+8]", exporter.label(*nodes[1]))
+
+        # dependencies within the collapsed subtree are not drawn
+        edges = list(exporter.edges())
+        self.assertListEqual(['parent', 'parent'], [i[2] for i in edges])
+
+    def test_write_graphml(self):
+        output = StringIO()
+        PulumiGraphExporter(self.resources, dependencies=True, roots=[self.root]).write(output, fmt='graphml')
+
+        namespace = {"g": "http://graphml.graphdrawing.org/xmlns"}
+        graph     = ET.fromstring(output.getvalue()).find('g:graph', namespace)
+
+        nodes = graph.findall('g:node', namespace)
+        edges = graph.findall('g:edge', namespace)
+        self.assertEqual(11, len(nodes))
+        self.assertEqual(self.root.urn, nodes[0].get('id'))
+        self.assertEqual(10, len([i for i in edges if i.find('g:data', namespace).text == 'parent']))
+        self.assertTrue(any(i.find('g:data', namespace).text == 'dependency' for i in edges))
+
+    def test_write_json(self):
+        output = StringIO()
+        PulumiGraphExporter(self.resources, roots=[self.root]).write(output, fmt='json')
+
+        graph = json.loads(output.getvalue())
+        self.assertEqual(11, len(graph["nodes"]))
+        self.assertEqual(10, len(graph["edges"]))
+        self.assertDictEqual({"source": self.root.urn, "target": self.component.urn, "kind": "parent"}, graph["edges"][0])
+
+        output = StringIO()
+        PulumiGraphExporter(PulumiResources()).write_json(output)
+        self.assertDictEqual({"nodes": [], "edges": []}, json.loads(output.getvalue()))
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            PulumiGraphExporter(self.resources).write(StringIO(), fmt='svg')
+
+    def test_export_graph(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name, start in (('graph.dot', 'digraph tree {'), ('graph.graphml', '<?xml'), ('graph.json', '{"nodes"')):
+                with self.subTest(filename=name):
+                    filename = Path(tmpdir).joinpath(name)
+                    self.resources.export_graph(filename, dependencies=True)
+                    self.assertTrue(filename.read_text().startswith(start))
+
+            filename = Path(tmpdir).joinpath('graph.txt')
+            with self.assertRaises(ValueError):
+                self.resources.export_graph(filename)
+            self.assertFalse(filename.exists())
+
+            self.resources.export_graph(filename, fmt='json')
+            self.assertEqual(11, len(json.loads(filename.read_text())["nodes"]))
@@ -0,0 +1,135 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall import exceptions
+from pitfall import utils
+from pitfall.fixtures import PulumiStateFixture
+from pitfall.secrets import SECRET_SIGNATURE_KEY, SECRET_SIGNATURE
+from pitfall.state import PulumiResources
+from unittest.mock import patch
+import json
+import tempfile
+import unittest
+
+
+OLD_STACK   = 'pitf-stack-388ef76614da4d71'
+OLD_PROJECT = 'pitf-project-f90c97ba86734aed'
+
+
+class TestPulumiStateFixture(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.old_key, cls.old_salt = utils.generate_encryptionsalt('fixture-passphrase')
+        cls.new_key, cls.new_salt = utils.generate_encryptionsalt('pulumi')
+
+        checkpoint = json.loads(Path(__file__).parent.joinpath('test_data/state.json').read_text())
+        checkpoint["checkpoint"]["latest"]["secrets_providers"]["state"]["salt"] = cls.old_salt
+
+        secret = {SECRET_SIGNATURE_KEY: SECRET_SIGNATURE, "ciphertext": utils.get_encrypted_secret(b'"s3cr3t"', cls.old_key)}
+
+        stack = checkpoint["checkpoint"]["latest"]["resources"][0]
+        stack["outputs"]["password"] = secret
+        stack["outputs"]["passwords"] = [secret, secret]
+
+        cls.checkpoint = checkpoint
+
+    def setUp(self):
+        self.tmpdir  = tempfile.TemporaryDirectory()
+        self.fixture = PulumiStateFixture.save(self.checkpoint, Path(self.tmpdir.name).joinpath('fixtures/vpc.json.gz'), passphrase='fixture-passphrase')
+        self.fixture._encryption_key = self.old_key  # skip deriving the key again
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def rebase(self, fixture: PulumiStateFixture = None) -> dict:
+        fixture = self.fixture if fixture is None else fixture
+        return fixture.rebase(stack='pitf-stack-0123456789abcdef', project='pitf-project-0123456789abcdef', encryptionsalt=self.new_salt, encryption_key=self.new_key)
+
+    def test_save(self):
+        self.assertTrue(self.fixture.path.is_absolute())
+        self.assertEqual(self.fixture.checkpoint, self.checkpoint)
+        self.assertEqual(self.fixture.stack, OLD_STACK)
+        self.assertEqual(self.fixture.project, OLD_PROJECT)
+        self.assertEqual(self.fixture.encryptionsalt, self.old_salt)
+
+    def test_rebase(self):
+        checkpoint = self.rebase()
+        contents   = json.dumps(checkpoint)
+
+        self.assertNotIn(OLD_STACK, contents)
+        self.assertNotIn(OLD_PROJECT, contents)
+        self.assertEqual(checkpoint["checkpoint"]["stack"], 'pitf-stack-0123456789abcdef')
+        self.assertEqual(checkpoint["checkpoint"]["latest"]["secrets_providers"]["state"]["salt"], self.new_salt)
+
+        resources = PulumiResources.from_checkpoint(checkpoint)
+        self.assertEqual(len(resources), 13)
+
+        stack = resources.lookup(key="type", value="pulumi:pulumi:Stack")[0]
+        self.assertEqual(stack.urn, 'urn:pulumi:pitf-stack-0123456789abcdef::pitf-project-0123456789abcdef::pulumi:pulumi:Stack::pitf-project-0123456789abcdef-pitf-stack-0123456789abcdef')
+        self.assertTrue(all(i.parent is None or i.parent.urn.startswith('urn:pulumi:pitf-stack-0123456789abcdef::') for i in resources))
+        self.assertEqual(stack.outputs["internet_gateway"]["tags"]["PulumiStack"], 'pitf-stack-0123456789abcdef')
+
+        # secrets are encrypted with the new key, and identical secrets share a ciphertext
+        ciphertext = stack.outputs["password"]["ciphertext"]
+        self.assertEqual(utils.get_decrypted_secret(ciphertext, self.new_key), b'"s3cr3t"')
+        self.assertEqual([i["ciphertext"] for i in stack.outputs["passwords"]], [ciphertext, ciphertext])
+
+        # the fixture is not modified
+        self.assertEqual(self.fixture.checkpoint, self.checkpoint)
+
+    def test_rebase_without_renaming_values(self):
+        fixture = PulumiStateFixture(self.fixture.path, passphrase='fixture-passphrase', rename_values=False)
+        fixture._encryption_key = self.old_key
+
+        stack = PulumiResources.from_checkpoint(self.rebase(fixture)).lookup(key="type", value="pulumi:pulumi:Stack")[0]
+        self.assertTrue(stack.urn.endswith('::pitf-project-0123456789abcdef-pitf-stack-0123456789abcdef'))
+        self.assertEqual(stack.outputs["internet_gateway"]["tags"]["PulumiStack"], OLD_STACK)
+
+    def test_rebase_without_generated_names(self):
+        contents = json.dumps(self.checkpoint).replace(OLD_PROJECT, 'web').replace(OLD_STACK, 'dev')
+        fixture  = PulumiStateFixture.save(json.loads(contents), Path(self.tmpdir.name).joinpath('fixtures/dev.json'), passphrase='fixture-passphrase')
+        fixture._encryption_key = self.old_key
+
+        resources = PulumiResources.from_checkpoint(self.rebase(fixture))
+        self.assertTrue(all(i.urn.startswith('urn:pulumi:pitf-stack-0123456789abcdef::pitf-project-0123456789abcdef::') for i in resources))
+
+        stack = resources.lookup(key="type", value="pulumi:pulumi:Stack")[0]
+        self.assertTrue(stack.urn.endswith('::pitf-project-0123456789abcdef-pitf-stack-0123456789abcdef'))
+        self.assertEqual(stack.outputs["internet_gateway"]["tags"]["PulumiStack"], 'dev')  # eg. "Environment": "dev" is left as is
+
+    def test_rebase_with_wrong_passphrase(self):
+        fixture = PulumiStateFixture(self.fixture.path, passphrase='wrong')
+
+        with patch('pitfall.utils.generate_aes_encryption_key', return_value=(b'\x00' * 32, b'')):
+            with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+                self.rebase(fixture)
+
+    def test_rebase_without_encryptionsalt(self):
+        checkpoint = json.loads(json.dumps(self.checkpoint))
+        del checkpoint["checkpoint"]["latest"]["secrets_providers"]
+
+        fixture = PulumiStateFixture.save(checkpoint, Path(self.tmpdir.name).joinpath('fixtures/nosalt.json'), passphrase='fixture-passphrase')
+        self.assertIsNone(fixture.encryptionsalt)
+
+        with self.assertRaises(exceptions.PulumiFixtureError):
+            self.rebase(fixture)
+
+        # a checkpoint without secrets needs no key to be rebased
+        stack = checkpoint["checkpoint"]["latest"]["resources"][0]
+        del stack["outputs"]["password"], stack["outputs"]["passwords"]
+
+        fixture   = PulumiStateFixture.save(checkpoint, Path(self.tmpdir.name).joinpath('fixtures/nosecrets.json'))
+        resources = PulumiResources.from_checkpoint(self.rebase(fixture))
+        self.assertTrue(all(i.urn.startswith('urn:pulumi:pitf-stack-0123456789abcdef::') for i in resources))
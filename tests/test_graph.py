@@ -0,0 +1,102 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall import exceptions
+from pitfall.graph import PulumiDependencyGraph
+from pitfall.state import PulumiResource, PulumiResources
+import json
+import unittest
+
+
+class TestPulumiDependencyGraph(unittest.TestCase):
+    def setUp(self):
+        self.stack  = PulumiResource(urn="stack", rtype="pulumi:pulumi:Stack", rid="1")
+        self.vpc    = PulumiResource(urn="vpc", rtype="aws:ec2/vpc:Vpc", rid="vpc-001", parent=self.stack, depends_on=[])
+        self.subnet = PulumiResource(urn="subnet", rtype="aws:ec2/subnet:Subnet", rid="subnet-001", parent=self.stack, dependencies={"vpcId": ["vpc"]}, depends_on=["vpc"])
+        self.sg     = PulumiResource(urn="sg", rtype="aws:ec2/securityGroup:SecurityGroup", rid="sg-001", parent=self.stack, dependencies={"vpcId": ["vpc"]})
+        self.ec2    = PulumiResource(urn="ec2", rtype="aws:ec2/instance:Instance", rid="i-001", parent=self.stack, dependencies={"subnetId": ["subnet"], "vpcSecurityGroupIds": ["sg"]})
+        self.bucket = PulumiResource(urn="bucket", rtype="aws:s3/bucket:Bucket", rid="bucket", parent=self.stack, depends_on=["unknown"])
+
+        self.resources = PulumiResources([self.stack, self.vpc, self.subnet, self.sg, self.ec2, self.bucket])
+        self.graph     = self.resources.dependency_graph()
+
+    def test_edges(self):
+        self.assertEqual(6, len(self.graph))
+        self.assertIn("ec2", self.graph)
+
+        self.assertListEqual(["vpc"], self.graph.dependencies["subnet"])  # duplicate edges are removed
+        self.assertListEqual(["subnet", "sg"], self.graph.dependencies["ec2"])
+        self.assertListEqual([], self.graph.dependencies["bucket"])  # unknown resources are ignored
+        self.assertListEqual(["subnet", "sg"], self.graph.dependents["vpc"])
+
+    def test_fan_in_fan_out(self):
+        self.assertDictEqual({"stack": 0, "vpc": 0, "subnet": 1, "sg": 1, "ec2": 2, "bucket": 0}, self.graph.fan_in)
+        self.assertDictEqual({"stack": 0, "vpc": 2, "subnet": 1, "sg": 1, "ec2": 0, "bucket": 0}, self.graph.fan_out)
+
+    def test_topological_order(self):
+        order = self.graph.topological_order()
+        self.assertEqual(6, len(order))
+
+        position = {urn: n for n, urn in enumerate(order)}
+        for urn, dependencies in self.graph.dependencies.items():
+            for i in dependencies:
+                self.assertLess(position[i], position[urn])
+
+    def test_topological_order_cycle(self):
+        graph = PulumiDependencyGraph()
+        graph.add_edge("a", "b")
+        graph.add_edge("b", "c")
+        graph.add_edge("c", "a")
+        graph.add_node("d")
+
+        with self.assertRaises(exceptions.PulumiDependencyCycleError) as e:
+            graph.topological_order()
+        self.assertIn("a, b, c", str(e.exception))
+
+    def test_levels(self):
+        expected = [["stack", "vpc", "bucket"], ["subnet", "sg"], ["ec2"]]
+        self.assertListEqual(expected, self.graph.levels())
+
+    def test_critical_path(self):
+        with self.subTest(msg="without durations"):
+            path, length = self.graph.critical_path()
+            self.assertListEqual(["vpc", "subnet", "ec2"], path)
+            self.assertEqual(3.0, length)
+
+        with self.subTest(msg="with durations"):
+            graph = self.resources.dependency_graph(durations={"vpc": 2.0, "subnet": 1.5, "sg": 4.0, "ec2": 30.0, "bucket": 40.0})
+
+            path, length = graph.critical_path()
+            self.assertListEqual(["bucket"], path)
+            self.assertEqual(40.0, length)
+
+            graph.durations["ec2"] = 60.0
+            path, length = graph.critical_path()
+            self.assertListEqual(["vpc", "sg", "ec2"], path)
+            self.assertEqual(66.0, length)
+
+        with self.subTest(msg="empty graph"):
+            self.assertTupleEqual(([], 0.0), PulumiDependencyGraph().critical_path())
+
+    def test_from_state_file(self):
+        state_file = Path(__file__).parent.joinpath('test_data/state.json')
+        checkpoint = json.loads(state_file.read_text())
+
+        resources = PulumiResources.from_checkpoint(checkpoint)
+        graph     = resources.dependency_graph()
+
+        self.assertEqual(len(resources), len(graph))
+        self.assertEqual(len(resources), len(graph.topological_order()))
+        self.assertTrue(any(graph.fan_in.values()))
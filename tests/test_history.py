@@ -0,0 +1,206 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from pitfall.history import CheckpointBackup, CheckpointHistory, CheckpointRetention, MTIME_RESOLUTION
+from unittest.mock import patch
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+
+class TestCheckpointHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir    = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmpdir.name).joinpath('backups/unit-test')
+        self.directory.mkdir(parents=True)
+
+        self.history = CheckpointHistory(directory=self.directory, stack='unit-test', cache_size=2)
+
+        self.timestamps = [1568899856000000000, 1568989822000000000, 1569080793000000000]
+        for n, i in enumerate(self.timestamps):
+            self.write_backup(i, n)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_backup(self, timestamp: int, version: int) -> Path:
+        path = self.directory.joinpath(f'unit-test.{timestamp}.json')
+        path.write_text(json.dumps({"version": 3, "checkpoint": {"stack": "unit-test", "latest": {"version": version}}}))
+        return path
+
+    def version(self, checkpoint: dict) -> int:
+        return checkpoint["checkpoint"]["latest"]["version"]
+
+    def test_backups(self):
+        self.directory.joinpath('unit-test.json.attrs').touch()
+        self.directory.joinpath('other-stack.1568899856000000000.json').touch()
+
+        backups = self.history.backups
+        self.assertEqual(3, len(self.history))
+        self.assertListEqual(self.timestamps[::-1], [i.timestamp for i in backups])
+
+        backup = backups[-1]
+        self.assertIsInstance(backup, CheckpointBackup)
+        self.assertEqual(backup.path.stat().st_size, backup.size)
+        self.assertEqual(datetime(2019, 9, 19, 13, 30, 56, tzinfo=timezone.utc), backup.time)
+
+    def test_getitem(self):
+        self.assertEqual(2, self.version(self.history[0]))
+        self.assertEqual(1, self.version(self.history[1]))
+        self.assertEqual(0, self.version(self.history[-1]))
+
+        with self.assertRaises(IndexError):
+            self.history[3]
+
+    def test_iteration_newest_first(self):
+        self.assertListEqual([2, 1, 0], [self.version(i) for i in self.history])
+
+    def test_load_is_cached(self):
+        with patch.object(CheckpointBackup, 'read', autospec=True, side_effect=CheckpointBackup.read) as mock_read:
+            self.history[0]
+            self.history[0]
+            self.assertEqual(1, mock_read.call_count)
+
+            # the least recently used backup is evicted
+            self.history[1]
+            self.history[2]
+            self.history[0]
+            self.assertEqual(4, mock_read.call_count)
+
+    def test_incremental_refresh(self):
+        self.assertEqual(3, len(self.history))
+
+        # backups are found without waiting for the modification time of the directory to change
+        self.write_backup(1569168944000000000, 3)
+        self.assertEqual(3, self.version(self.history[0]))
+
+        # backups written out of order are inserted by timestamp
+        self.write_backup(1568900000000000000, 4)
+        self.assertListEqual([3, 2, 1, 4, 0], [self.version(i) for i in self.history])
+
+        self.directory.joinpath(f'unit-test.{self.timestamps[0]}.json').unlink()
+        self.assertListEqual([3, 2, 1, 4], [self.version(i) for i in self.history])
+
+    def test_refresh_skips_unmodified_directory(self):
+        modified = self.directory.stat().st_mtime_ns / 1e9
+        later    = modified + MTIME_RESOLUTION + 1
+
+        # the directory was just modified, so it is rescanned as it may be modified again within the same tick
+        with patch('pitfall.history.time.time', return_value=modified):
+            self.assertEqual(3, len(self.history))
+            with patch('pitfall.history.os.scandir', wraps=os.scandir) as mock_scandir:
+                self.assertEqual(3, len(self.history))
+                mock_scandir.assert_called_once()
+
+        with patch('pitfall.history.time.time', return_value=later):
+            self.assertEqual(3, len(self.history))
+
+            with patch('pitfall.history.os.scandir') as mock_scandir:
+                self.assertEqual(3, len(self.history))
+                mock_scandir.assert_not_called()
+
+        self.write_backup(1569168944000000000, 3)
+        self.assertEqual(4, len(self.history))
+
+    def test_at(self):
+        self.assertIsNone(self.history.at(self.timestamps[0] - 1))
+        self.assertEqual(0, self.version(self.history.at(self.timestamps[0])))
+        self.assertEqual(1, self.version(self.history.at(self.timestamps[2] - 1)))
+        self.assertEqual(2, self.version(self.history.at(datetime.now(tz=timezone.utc))))
+        self.assertEqual(1, self.version(self.history.at(datetime(2019, 9, 21, tzinfo=timezone.utc))))
+
+    def test_missing_directory(self):
+        history = CheckpointHistory(directory=Path(self.tmpdir.name).joinpath('backups/missing'), stack='missing')
+        self.assertEqual(0, len(history))
+        self.assertListEqual([], list(history))
+        self.assertIsNone(history.find(self.timestamps[0]))
+
+    def test_compressed_backups(self):
+        path = self.directory.joinpath(f'unit-test.{self.timestamps[0]}.json')
+
+        backup = self.history.backups[-1]
+        self.assertFalse(backup.compressed)
+
+        compressed = backup.compress()
+        self.assertTrue(compressed.compressed)
+        self.assertFalse(path.exists())
+        self.assertEqual(path.with_name(path.name + '.gz'), compressed.path)
+        self.assertEqual(compressed.path.stat().st_size, compressed.size)
+
+        with gzip.open(compressed.path, 'rt') as f:
+            self.assertEqual(0, self.version(json.load(f)))
+
+        self.assertEqual(3, len(self.history))
+        self.assertTrue(self.history.backups[-1].compressed)
+        self.assertEqual(0, self.version(self.history[-1]))
+
+
+class TestCheckpointRetention(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir    = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmpdir.name)
+
+        self.history = CheckpointHistory(directory=self.directory, stack='unit-test')
+
+        # one backup per hour, the newest taken now
+        now = int(datetime.now(tz=timezone.utc).timestamp()) * 10**9
+        self.timestamps = [now - n * 3600 * 10**9 for n in range(6)]
+
+        for n, i in enumerate(self.timestamps):
+            self.directory.joinpath(f'unit-test.{i}.json').write_text(json.dumps({"version": 3, "checkpoint": {"latest": {"version": n}}}))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def names(self) -> list:
+        return sorted(i.name for i in self.directory.iterdir())
+
+    def test_keep_last(self):
+        retention = CheckpointRetention(keep_last=3, compress=False)
+        self.assertTupleEqual((3, 0), retention.apply(self.history))
+
+        expected = sorted(f'unit-test.{i}.json' for i in self.timestamps[:3])
+        self.assertListEqual(expected, self.names())
+
+    def test_max_age(self):
+        retention = CheckpointRetention(max_age=timedelta(hours=2, minutes=30), compress=False)
+        self.assertTupleEqual((3, 0), retention.apply(self.history))
+        self.assertEqual(3, len(self.history))
+
+    def test_newest_backup_is_always_kept(self):
+        for i in self.timestamps[1:]:
+            self.directory.joinpath(f'unit-test.{i}.json').unlink()
+
+        retention = CheckpointRetention(keep_last=0, max_age=timedelta(seconds=0))
+        self.assertTupleEqual((0, 0), retention.apply(self.history))
+        self.assertEqual(1, len(self.history))
+
+    def test_compress(self):
+        retention = CheckpointRetention(keep_last=4)
+        self.assertTupleEqual((2, 2), retention.apply(self.history))
+
+        expected = [f'unit-test.{i}.json' for i in self.timestamps[:2]]
+        expected.extend(f'unit-test.{i}.json.gz' for i in self.timestamps[2:4])
+        expected.sort()
+        self.assertListEqual(expected, self.names())
+
+        # compressed backups remain readable
+        self.assertListEqual([0, 1, 2, 3], [i["checkpoint"]["latest"]["version"] for i in self.history])
+
+        # applying the policy again is a no-op
+        self.assertTupleEqual((0, 0), retention.apply(self.history))
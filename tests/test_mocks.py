@@ -0,0 +1,168 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall import mocks
+from pitfall.mocks import PulumiMockCall, PulumiMockRecorder, PulumiMockResource, PulumiMockRun, PulumiMocks
+from pitfall.state import PulumiResources
+from types import SimpleNamespace
+from unittest.mock import patch
+import asyncio
+import tempfile
+import textwrap
+import unittest
+
+
+def mocks_supported() -> bool:
+    return mocks.pulumi is not None and hasattr(mocks.pulumi.runtime, 'set_mocks')
+
+
+class TestPulumiMocks(unittest.TestCase):
+    def test_defaults(self):
+        m = PulumiMocks()
+
+        resource = PulumiMockResource(type='aws:s3/bucket:Bucket', name='logs', inputs={'acl': 'private'})
+        self.assertEqual(m.new_resource(resource), ('logs_id', {'acl': 'private'}))
+
+        existing = PulumiMockResource(type='aws:s3/bucket:Bucket', name='logs', inputs={}, id='logs-1234')
+        self.assertEqual(m.new_resource(existing)[0], 'logs-1234')
+
+        self.assertEqual(m.call(PulumiMockCall(token='aws:index/getRegion:getRegion', args={})), {})
+
+    def test_handlers(self):
+        m = PulumiMocks(
+            new_resource=lambda r: (f'{r.name}-abc', dict(r.inputs, arn=f'arn:aws:s3:::{r.name}')),
+            call=lambda c: {'name': 'us-east-1'} if c.token == 'aws:index/getRegion:getRegion' else {}
+        )
+
+        resource = PulumiMockResource(type='aws:s3/bucket:Bucket', name='logs', inputs={'acl': 'private'})
+        self.assertEqual(m.new_resource(resource), ('logs-abc', {'acl': 'private', 'arn': 'arn:aws:s3:::logs'}))
+        self.assertEqual(m.call(PulumiMockCall(token='aws:index/getRegion:getRegion', args={})), {'name': 'us-east-1'})
+
+    @unittest.skipUnless(mocks_supported(), 'requires a version of the Pulumi SDK with runtime mocks')
+    def test_mocks_adapter(self):  # pragma: no cover
+        recorded = []
+        adapter  = mocks._mocks_adapter(PulumiMocks(new_resource=lambda r: recorded.append(r) or ('id', {}), call=lambda c: recorded.append(c) or {}))
+
+        adapter.new_resource('aws:s3/bucket:Bucket', 'logs', {'acl': 'private'}, 'urn:provider::id', '')
+        adapter.call('aws:index/getRegion:getRegion', {'a': 1}, '')
+
+        self.assertEqual(recorded, [
+            PulumiMockResource(type='aws:s3/bucket:Bucket', name='logs', inputs={'acl': 'private'}, provider='urn:provider::id'),
+            PulumiMockCall(token='aws:index/getRegion:getRegion', args={'a': 1})
+        ])
+
+
+class TestPulumiMockRecorder(unittest.TestCase):
+    def test_register(self):
+        recorder = PulumiMockRecorder()
+
+        stack  = 'urn:pulumi:dev::unit::pulumi:pulumi:Stack::unit-dev'
+        bucket = 'urn:pulumi:dev::unit::aws:s3/bucket:Bucket::logs'
+        policy = 'urn:pulumi:dev::unit::aws:s3/bucketPolicy:BucketPolicy::logs'
+
+        recorder.register(urn=stack, rtype='pulumi:pulumi:Stack', custom=False)
+        recorder.register(urn=bucket, rtype='aws:s3/bucket:Bucket', custom=True, rid='logs_id', parent=stack, inputs={'acl': 'private'}, outputs={'acl': 'private', 'size': object()})
+        recorder.register(
+            urn=policy, rtype='aws:s3/bucketPolicy:BucketPolicy', custom=True, rid='policy_id', parent=stack,
+            dependencies=[bucket], property_dependencies={'bucket': [bucket]}
+        )
+        recorder.register_outputs(stack, {'bucket_name': 'logs'})
+        recorder.register_outputs('urn:pulumi:dev::unit::unknown::x', {'a': 1})
+
+        self.assertEqual(len(recorder.resources), 3)
+        self.assertEqual(recorder.resources[0]["outputs"], {'bucket_name': 'logs'})
+        self.assertNotIn("id", recorder.resources[0])
+        self.assertIsInstance(recorder.resources[1]["outputs"]["size"], str)
+
+        resources = PulumiResources.from_iterable(recorder.resources)
+        self.assertEqual(len(resources), 3)
+        self.assertEqual(resources.get(bucket).parent.urn, stack)
+        self.assertEqual(resources.get(policy).depends_on, [bucket])
+        self.assertEqual(resources.get(policy).dependencies, {'bucket': [bucket]})
+
+
+class TestPulumiMockRun(unittest.TestCase):
+    def test_execute_without_pulumi(self):
+        run = PulumiMockRun(mocks=PulumiMocks(), project='unit', stack='dev')
+
+        with patch('pitfall.mocks.pulumi', None):
+            with self.assertRaises(ImportError):
+                run.execute()
+
+        with patch('pitfall.mocks.pulumi', SimpleNamespace(runtime=SimpleNamespace())):
+            with self.assertRaises(ImportError):
+                run.execute()
+
+    @unittest.skipUnless(mocks_supported(), 'requires a version of the Pulumi SDK with runtime mocks')
+    def test_execute(self):  # pragma: no cover
+        program = textwrap.dedent('''
+            import pulumi
+
+            config = pulumi.Config()
+            component = pulumi.ComponentResource('unit:index:Component', 'component')
+            resource = pulumi.CustomResource('unit:index:Resource', 'resource', {'name': config.require('name')}, opts=pulumi.ResourceOptions(parent=component))
+
+            pulumi.export('resource_id', resource.id)
+        ''')
+
+        with tempfile.TemporaryDirectory() as d:
+            Path(d).joinpath('__main__.py').write_text(program)
+
+            for name in ('example', 'another'):  # programs can be run repeatedly in the same process
+                run       = PulumiMockRun(mocks=PulumiMocks(), project='unit', stack='dev', config={'unit:name': name})
+                resources = run.execute(directory=d)
+
+                self.assertEqual(len(resources), 3)
+
+                resource = next(i for i in resources if i.type == 'unit:index:Resource')
+                self.assertEqual(resource.id, 'resource_id')
+                self.assertEqual(resource.inputs, {'name': name})
+                self.assertEqual(resource.parent.type, 'unit:index:Component')
+                self.assertEqual(resource.parent.parent.type, 'pulumi:pulumi:Stack')
+
+                stack = next(i for i in resources if i.type == 'pulumi:pulumi:Stack')
+                self.assertEqual(stack.outputs, {'resource_id': 'resource_id'})
+
+    @unittest.skipUnless(mocks_supported(), 'requires a version of the Pulumi SDK with runtime mocks')
+    def test_execute_restores_runtime(self):  # pragma: no cover
+        from pulumi.runtime import config, mocks as runtime_mocks, settings
+
+        program = textwrap.dedent('''
+            import pulumi
+
+            pulumi.export('name', pulumi.Config().require('name'))
+        ''')
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(loop.close)
+
+        mocks_loop, saved, values = runtime_mocks.loop, settings.SETTINGS, dict(config.CONFIG)
+
+        with tempfile.TemporaryDirectory() as d:
+            Path(d).joinpath('__main__.py').write_text(program)
+
+            for name in ('example', 'another'):  # two runs back to back
+                resources = PulumiMockRun(mocks=PulumiMocks(), project='unit', stack='dev', config={'unit:name': name}).execute(directory=d)
+                self.assertEqual(resources[0].outputs, {'name': name})
+
+        self.assertIs(asyncio.get_event_loop(), loop)
+        self.assertIs(runtime_mocks.loop, mocks_loop)
+        self.assertIs(settings.SETTINGS, saved)
+        self.assertEqual(config.CONFIG, values)
+
+        # the caller's event loop is still usable
+        self.assertEqual(loop.run_until_complete(asyncio.sleep(0, result='done')), 'done')
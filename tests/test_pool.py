@@ -0,0 +1,216 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall import exceptions
+from pitfall.config import PulumiConfigurationKey
+from pitfall.core import PulumiIntegrationTestOptions
+from pitfall.pool import PulumiStackPool
+from unittest.mock import patch
+import os
+import tempfile
+import unittest
+import yaml
+
+
+class FakeAction:
+    """ a stand-in for `pulumi up` and `pulumi destroy` that writes a state file with a resource per config key """
+    calls: list = []
+    fail: bool = False
+
+    def __init__(self, verbose: bool = False, state=None) -> None:
+        self.state = state
+
+    def deploy(self, resources: list) -> None:
+        FakeAction.calls.append((type(self).__name__, self.state.stack))
+
+        checkpoint = {"version": 3, "checkpoint": {"stack": self.state.stack, "latest": {"resources": resources}}}
+        self.state.write(checkpoint)
+
+
+class FakeUp(FakeAction):
+    def execute(self, expect_no_changes: bool = False) -> None:
+        config = yaml.safe_load(Path(f'Pulumi.{self.state.stack}.yaml').read_text())["config"]
+
+        if FakeAction.fail or any(k.endswith(':fail') for k in config):
+            raise exceptions.PulumiUpExecError("failed")
+
+        resources = [{"urn": f"urn:pulumi:{self.state.stack}::p::test:index:Key::{k}", "type": "test:index:Key", "inputs": {"value": v}} for k, v in config.items()]
+
+        outputs = {k.split(':')[-1]: v for k, v in config.items()}
+        resources.insert(0, {"urn": f"urn:pulumi:{self.state.stack}::p::pulumi:pulumi:Stack::p-{self.state.stack}", "type": "pulumi:pulumi:Stack", "outputs": outputs})
+
+        self.deploy(resources)
+
+
+class FakeDestroy(FakeAction):
+    def execute(self) -> None:
+        self.deploy([])
+
+
+class FakePreview:
+    def __init__(self, verbose: bool = False) -> None:
+        pass
+
+    def execute(self) -> None:
+        FakeAction.calls.append(('FakePreview', None))
+
+
+class TestPulumiStackPool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir  = tempfile.TemporaryDirectory()
+        self.program = Path(self.tmpdir.name).joinpath('program')
+        self.program.mkdir()
+        self.program.joinpath('__main__.py').write_text('import pulumi\n')
+
+        FakeAction.calls = []
+        FakeAction.fail  = False
+
+        for name, fake in (('PulumiUp', FakeUp), ('PulumiDestroy', FakeDestroy), ('PulumiPreview', FakePreview)):
+            patcher = patch(f'pitfall.core.{name}', fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.pool = self.create_pool()
+        self.pwd  = Path.cwd()
+
+    def tearDown(self):
+        self.pool.destroy()
+        os.chdir(self.pwd)
+        self.tmpdir.cleanup()
+
+        for i in ['PULUMI_HOME', 'PULUMI_CONFIG_PASSPHRASE']:
+            os.environ.pop(i, None)
+
+    def create_pool(self, size: int = 1) -> PulumiStackPool:
+        config = [PulumiConfigurationKey(name='size', value='small')]
+        return PulumiStackPool(directory=self.program, size=size, config=config, opts=PulumiIntegrationTestOptions(preview=False), root=Path(self.tmpdir.name).joinpath('pool'))
+
+    def values(self, lease) -> dict:
+        return {i.urn.split(':')[-1]: i.inputs["value"] for i in lease.state.resources.lookup(key="type", value="test:index:Key")}
+
+    def test_lease_and_reset(self):
+        self.assertEqual(self.pool.warm(), 1)
+        self.assertEqual(self.pool.warm(), 0)
+        self.assertEqual([i[0] for i in FakeAction.calls], ['FakeUp'])
+
+        config = [PulumiConfigurationKey(name='size', value='large'), PulumiConfigurationKey(name='zone', value='b')]
+
+        with self.pool.lease(config=config) as t:
+            self.assertTrue(t.deployed)
+            self.assertEqual(t.tmp_directory, self.pool.workspace(0))
+            self.assertEqual(Path.cwd(), t.tmp_directory)
+
+            t.up.execute()
+            self.assertEqual(self.values(t), {'size': 'large', 'zone': 'b'})
+
+        self.assertEqual(Path.cwd(), self.pwd)
+        self.assertEqual([i[0] for i in FakeAction.calls], ['FakeUp', 'FakeUp', 'FakeUp'])  # the stack was reset to the baseline
+
+        with self.pool.lease() as t:
+            self.assertEqual(self.values(t), {'size': 'small'})
+            stack = t.stack.name
+
+        self.assertEqual(len(FakeAction.calls), 3)  # the state was not modified, so the stack was not reset
+
+        # the names and encryption of the stacks are shared with pools in other processes
+        other = self.create_pool()
+        self.assertEqual(other.encryption(), self.pool.encryption())
+        with other.lease() as t:
+            self.assertEqual(t.stack.name, stack)
+
+    def test_reset_after_same_size_change(self):
+        self.pool.warm()
+
+        with self.pool.lease(config=[PulumiConfigurationKey(name='size', value='large')]) as t:
+            size = t.state.filepath.stat().st_size
+            t.up.execute()
+            self.assertEqual(t.state.filepath.stat().st_size, size)  # 'large' replaced 'small' in place
+
+        self.assertEqual([i[0] for i in FakeAction.calls], ['FakeUp', 'FakeUp', 'FakeUp'])
+
+        with self.pool.lease() as t:
+            self.assertEqual(self.values(t), {'size': 'small'})
+
+    def test_failed_reset_destroys_stack(self):
+        with self.pool.lease(config=[PulumiConfigurationKey(name='size', value='large')]) as t:
+            t.up.execute()
+            FakeAction.fail = True
+
+        self.assertEqual([i[0] for i in FakeAction.calls], ['FakeUp', 'FakeDestroy'])
+
+        FakeAction.fail = False
+        with self.pool.lease() as t:
+            self.assertFalse(t.deployed)
+
+        self.assertEqual(self.pool.warm(), 1)
+
+    def test_failed_reset_is_not_the_baseline(self):
+        self.pool.warm()
+
+        lease = self.pool.lease(config=[PulumiConfigurationKey(name='size', value='large')])
+        lease.setup()
+        self.addCleanup(os.chdir, self.pwd)
+
+        lease.up.execute()
+        FakeAction.fail = True
+
+        with patch.object(FakeDestroy, 'execute', side_effect=exceptions.PulumiDestroyExecError("failed")):
+            with self.assertRaises(exceptions.PulumiDestroyExecError):
+                lease.reset()
+
+        self.assertIsNone(lease._baseline_state)
+
+        lease.reset()  # the stack is destroyed
+
+        self.assertIsNone(lease._baseline_state)
+        self.assertFalse(lease.deployed)
+        self.assertEqual([i[0] for i in FakeAction.calls], ['FakeUp', 'FakeUp', 'FakeDestroy'])
+
+        lease.lock.close()
+        FakeAction.fail = False
+        self.assertEqual(self.pool.warm(), 1)
+
+    def test_lease_timeout(self):
+        pool = self.create_pool(size=2)
+
+        first  = pool.lease()
+        second = pool.lease()
+        self.assertEqual({first.slot, second.slot}, {0, 1})
+
+        with self.assertRaises(exceptions.PulumiStackPoolTimeoutError):
+            pool.lease(timeout=0.1)
+
+        self.assertEqual(pool.warm(), 0)  # leased stacks are skipped
+
+        first.delete()
+        self.assertTrue(first.lock.closed)
+
+        third = pool.lease(timeout=0.1)
+        self.assertEqual(third.slot, first.slot)
+
+        second.delete()
+        third.delete()
+        pool.destroy()
+
+    def test_destroy(self):
+        self.pool.warm()
+        self.pool.destroy()
+
+        self.assertEqual([i[0] for i in FakeAction.calls], ['FakeUp', 'FakeDestroy'])
+        self.assertFalse(self.pool.workspace(0).exists())
+
+    def test_size(self):
+        with self.assertRaises(ValueError):
+            PulumiStackPool(directory=self.program, size=0)
@@ -0,0 +1,236 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from pitfall.exceptions import PulumiProxyRecordingError
+from pitfall.proxy import Cassette, PulumiRecordingProxy, request_key
+from unittest.mock import patch
+from urllib.parse import urlsplit
+import urllib.request
+import http.client
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """ a stand-in for a cloud API that returns a different response to every request """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.count += 1
+        body = json.dumps({"path": self.path, "host": self.headers["Host"], "count": self.server.count}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body   = self.rfile.read(length)
+
+        self.server.count += 1
+        response = bytes([0xff, 0xfe]) + body  # not valid UTF-8
+
+        self.send_response(201)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_HEAD(self):
+        self.server.count += 1
+        self.send_response(200)
+        self.send_header('Content-Length', '1234')
+        self.end_headers()
+
+
+def request(address: tuple, method: str, target: str, body: bytes = None, headers: dict = None) -> tuple:
+    connection = http.client.HTTPConnection(*address, timeout=10)
+    try:
+        connection.request(method, target, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read(), dict(response.getheaders())
+    finally:
+        connection.close()
+
+
+class TestRequestKey(unittest.TestCase):
+    def test_ignores_volatile_fields(self):
+        a = request_key('GET', 'https://ec2.amazonaws.com/?Action=DescribeVpcs&X-Amz-Date=20191001T000000Z&VpcId=vpc-1')
+        b = request_key('get', 'http://EC2.amazonaws.com/?VpcId=vpc-1&Action=DescribeVpcs&X-Amz-Date=20191002T101010Z')
+        self.assertEqual(a, b)
+
+        self.assertNotEqual(a, request_key('GET', 'http://ec2.amazonaws.com/?Action=DescribeVpcs&VpcId=vpc-2'))
+        self.assertNotEqual(a, request_key('POST', 'http://ec2.amazonaws.com/?Action=DescribeVpcs&VpcId=vpc-1'))
+
+    def test_json_body(self):
+        a = request_key('POST', 'http://dynamodb/', b'{"TableName": "t", "ClientRequestToken": "abc", "At": "2019-10-01T00:00:00Z"}', 'application/x-amz-json-1.0')
+        b = request_key('POST', 'http://dynamodb/', b'{"ClientRequestToken": "xyz", "At": "2019-10-02T11:11:11Z", "TableName": "t"}', 'application/x-amz-json-1.0')
+        c = request_key('POST', 'http://dynamodb/', b'{"TableName": "u"}', 'application/x-amz-json-1.0')
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_form_body(self):
+        content_type = 'application/x-www-form-urlencoded; charset=utf-8'
+        a = request_key('POST', 'http://ec2/', b'Action=RunInstances&ClientToken=6f713df4-54ad-4582-b0c6-1d2e3f4a5b6c&ImageId=ami-1', content_type)
+        b = request_key('POST', 'http://ec2/', b'ImageId=ami-1&Action=RunInstances&ClientToken=00000000-0000-0000-0000-000000000000', content_type)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, request_key('POST', 'http://ec2/', b'Action=RunInstances&ImageId=ami-2', content_type))
+
+    def test_binary_body(self):
+        self.assertEqual(request_key('PUT', 'http://s3/b/k', b'\x00\x01'), request_key('PUT', 'http://s3/b/k', b'\x00\x01'))
+        self.assertNotEqual(request_key('PUT', 'http://s3/b/k', b'\x00\x01'), request_key('PUT', 'http://s3/b/k', b'\x00\x02'))
+
+
+class TestCassette(unittest.TestCase):
+    def test_play_in_order(self):
+        cassette = Cassette('cassette.json')
+        self.assertTrue(cassette.path.is_absolute())
+
+        for n in range(3):
+            cassette.append({"key": "k", "request": {}, "response": {"status": 200 + n}})
+
+        self.assertEqual([cassette.play("k")["status"] for _ in range(5)], [200, 201, 202, 202, 202])
+        self.assertIsNone(cassette.play("missing"))
+        self.assertEqual(len(cassette), 3)
+
+
+class TestPulumiRecordingProxy(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir   = tempfile.TemporaryDirectory()
+        self.cassette = Path(self.tmpdir.name).joinpath('cassettes/test.json')
+
+        self.upstream       = ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+        self.upstream.count = 0
+        self.thread         = threading.Thread(target=self.upstream.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self.thread.start()
+
+        self.upstream_url = 'http://%s:%d' % self.upstream.server_address[:2]
+
+    def tearDown(self):
+        self.upstream.shutdown()
+        self.upstream.server_close()
+        self.tmpdir.cleanup()
+
+    def proxy_address(self, proxy: PulumiRecordingProxy) -> tuple:
+        parts = urlsplit(proxy.url)
+        return parts.hostname, parts.port
+
+    def test_record_and_replay_forward_proxy(self):
+        with PulumiRecordingProxy(cassette=self.cassette) as proxy:
+            self.assertEqual(proxy.mode, 'record')
+            address = self.proxy_address(proxy)
+
+            first  = request(address, 'GET', f'{self.upstream_url}/vpcs?X-Amz-Date=20191001T000000Z')
+            second = request(address, 'GET', f'{self.upstream_url}/vpcs?X-Amz-Date=20191001T000005Z')
+            posted = request(address, 'POST', f'{self.upstream_url}/objects', body=b'data')
+            head   = request(address, 'HEAD', f'{self.upstream_url}/objects')
+
+        self.assertEqual(json.loads(first[1])["count"], 1)
+        self.assertEqual(json.loads(second[1])["count"], 2)
+        self.assertEqual(posted[:2], (201, b'\xff\xfedata'))
+        self.assertEqual(head[2]["Content-Length"], '1234')
+        self.assertEqual(self.upstream.count, 4)
+
+        self.assertTrue(self.cassette.exists())
+        self.assertEqual(len(json.loads(self.cassette.read_text())["interactions"]), 4)
+
+        # the upstream is no longer reachable when replaying
+        self.upstream.shutdown()
+
+        with PulumiRecordingProxy(cassette=self.cassette) as proxy:
+            self.assertEqual(proxy.mode, 'replay')
+            address = self.proxy_address(proxy)
+
+            replayed = [request(address, 'GET', f'{self.upstream_url}/vpcs?X-Amz-Date=20191101T000000Z') for _ in range(3)]
+            self.assertEqual(request(address, 'POST', f'{self.upstream_url}/objects', body=b'data')[:2], posted[:2])
+            self.assertEqual(request(address, 'HEAD', f'{self.upstream_url}/objects')[2]["Content-Length"], '1234')
+
+            missed = request(address, 'GET', f'{self.upstream_url}/subnets')
+
+        self.assertEqual([json.loads(i[1])["count"] for i in replayed], [1, 2, 2])
+        self.assertEqual(missed[0], 502)
+        self.assertEqual(proxy.hits, 5)
+        self.assertEqual(proxy.misses, [f'GET {self.upstream_url}/subnets'])
+        self.assertEqual(self.upstream.count, 4)
+
+    def test_record_and_replay_with_target(self):
+        with PulumiRecordingProxy(cassette=self.cassette, mode='record', target=self.upstream_url + '/') as proxy:
+            status, body, _ = request(self.proxy_address(proxy), 'GET', '/buckets?list-type=2')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["host"], '%s:%d' % self.upstream.server_address[:2])
+
+        with PulumiRecordingProxy(cassette=self.cassette, mode='replay', target=self.upstream_url) as proxy:
+            self.assertEqual(request(self.proxy_address(proxy), 'GET', '/buckets?list-type=2')[1], body)
+
+    def test_relative_url_without_target(self):
+        with self.assertRaises(PulumiProxyRecordingError):
+            with PulumiRecordingProxy(cassette=self.cassette, mode='record') as proxy:
+                self.assertEqual(request(self.proxy_address(proxy), 'GET', '/buckets')[0], 400)
+
+    def test_connect_not_supported(self):
+        proxy = PulumiRecordingProxy(cassette=self.cassette, mode='record')
+
+        with self.assertRaises(PulumiProxyRecordingError) as e:
+            with proxy:
+                self.assertEqual(request(self.proxy_address(proxy), 'CONNECT', 'ec2.amazonaws.com:443')[0], 501)
+
+        self.assertIn('CONNECT ec2.amazonaws.com:443', str(e.exception))
+        self.assertEqual(proxy.misses, ['CONNECT ec2.amazonaws.com:443'])
+
+    def test_nothing_recorded(self):
+        proxy = PulumiRecordingProxy(cassette=self.cassette, mode='record')
+        proxy.start()
+
+        with self.assertRaises(PulumiProxyRecordingError):
+            proxy.stop()
+
+        self.assertFalse(self.cassette.exists())  # an empty cassette would be replayed by later runs
+
+    def test_upgrade_https(self):
+        proxy = PulumiRecordingProxy(cassette=self.cassette, upgrade_https=True)
+        self.assertEqual(proxy.upstream_url('http://ec2.amazonaws.com/?Action=DescribeVpcs'), 'https://ec2.amazonaws.com/?Action=DescribeVpcs')
+        self.assertEqual(proxy.upstream_url('https://ec2.amazonaws.com/'), 'https://ec2.amazonaws.com/')
+
+    def test_mode(self):
+        with self.assertRaises(ValueError):
+            PulumiRecordingProxy(cassette=self.cassette, mode='rewind')
+
+        with patch.dict(os.environ, {'PITFALL_PROXY_MODE': 'record'}):
+            self.assertEqual(PulumiRecordingProxy(cassette=self.cassette, mode='replay').mode, 'record')
+
+    def test_environment(self):
+        with PulumiRecordingProxy(cassette=self.cassette, target=self.upstream_url) as proxy:
+            self.assertEqual(proxy.environment, {
+                'HTTP_PROXY': proxy.url, 'http_proxy': proxy.url, 'HTTPS_PROXY': proxy.url, 'https_proxy': proxy.url,
+                'NO_PROXY': 'localhost,127.0.0.1,::1', 'no_proxy': 'localhost,127.0.0.1,::1'
+            })
+            request(self.proxy_address(proxy), 'GET', '/buckets')
+
+    def test_environment_excludes_loopback(self):
+        with PulumiRecordingProxy(cassette=self.cassette, target=self.upstream_url) as proxy:
+            with patch.dict(os.environ, proxy.environment):
+                for host in ('localhost', '127.0.0.1', '::1'):
+                    self.assertTrue(urllib.request.proxy_bypass_environment(host), host)
+                self.assertFalse(urllib.request.proxy_bypass_environment('ec2.amazonaws.com'))
+            request(self.proxy_address(proxy), 'GET', '/buckets')
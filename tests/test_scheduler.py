@@ -0,0 +1,155 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Executor, Future
+from pathlib import Path
+from pitfall import exceptions
+from pitfall.config import PulumiConfigurationKey
+from pitfall.scheduler import StackGraph
+from tests.test_pool import FakeAction, FakeDestroy, FakePreview, FakeUp
+from unittest.mock import patch
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+
+class SerialExecutor(Executor):
+    """ runs each function when it is submitted, in the current process """
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class TestStackGraph(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        self.program = Path(self.tmpdir.name).joinpath('program')
+        self.program.mkdir()
+        self.program.joinpath('__main__.py').write_text('import pulumi\n')
+
+        FakeAction.calls = []
+        FakeAction.fail  = False
+
+        for name, fake in (('PulumiUp', FakeUp), ('PulumiDestroy', FakeDestroy), ('PulumiPreview', FakePreview)):
+            patcher = patch(f'pitfall.core.{name}', fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.pwd = Path.cwd()
+
+    def tearDown(self):
+        os.chdir(self.pwd)
+        self.tmpdir.cleanup()
+
+        for i in ['PULUMI_HOME', 'PULUMI_CONFIG_PASSPHRASE']:
+            os.environ.pop(i, None)
+
+    def key(self, name: str, value: str) -> PulumiConfigurationKey:
+        return PulumiConfigurationKey(name=name, value=value)
+
+    def create_graph(self, **kwargs) -> StackGraph:
+        """ network -> cluster -> app, and an independent monitoring stack """
+        graph = StackGraph(**kwargs)
+        graph.add('app', self.program, config=[self.key('replicas', '3')], depends_on={'cluster': None})
+        graph.add('cluster', self.program, config=[self.key('nodes', '2')], depends_on={'network': {'vpc_id': 'network_vpc_id'}})
+        graph.add('network', self.program, config=[self.key('vpc_id', 'vpc-1234'), self.key('cidr', '10.0.0.0/16')])
+        graph.add('monitoring', self.program, config=[self.key('retention', '7')])
+        return graph
+
+    def test_order(self):
+        graph = self.create_graph()
+        self.assertEqual(graph.order(), [['network', 'monitoring'], ['cluster'], ['app']])
+        self.assertEqual(graph.dependents('network'), ['cluster'])
+
+        with self.assertRaises(ValueError):
+            graph.add('app', self.program)
+
+        graph.add('dns', self.program, depends_on={'mesh': None})
+        with self.assertRaises(ValueError):
+            graph.order()
+
+        graph.add('mesh', self.program, depends_on={'dns': None})
+        with self.assertRaises(exceptions.PulumiDependencyCycleError):
+            graph.order()
+
+    def test_deploy_and_destroy(self):
+        graph  = self.create_graph()
+        result = graph.deploy(executor=SerialExecutor())
+
+        self.assertTrue(result.succeeded)
+        self.assertEqual(result.outputs['network'], {'vpc_id': 'vpc-1234', 'cidr': '10.0.0.0/16'})
+        self.assertEqual(result.outputs['cluster'], {'nodes': '2', 'network_vpc_id': 'vpc-1234'})
+        self.assertEqual(result.outputs['app'], {'replicas': '3', 'nodes': '2', 'network_vpc_id': 'vpc-1234'})
+        self.assertEqual(graph.outputs, result.outputs)
+        self.assertEqual(Path.cwd(), self.pwd)
+
+        stacks = {name: graph.pool(name)._names(0)[1] for name in graph.nodes}
+        root   = graph.root
+
+        result = graph.destroy(executor=SerialExecutor())
+        self.assertTrue(result.succeeded)
+        self.assertEqual(graph.outputs, {})
+        self.assertFalse(root.exists())
+
+        # stacks are destroyed in reverse topological order
+        destroyed = [i[1] for i in FakeAction.calls if i[0] == 'FakeDestroy']
+        self.assertEqual(len(destroyed), 4)
+        self.assertLess(destroyed.index(stacks['app']), destroyed.index(stacks['cluster']))
+        self.assertLess(destroyed.index(stacks['cluster']), destroyed.index(stacks['network']))
+
+    def test_failure_isolated_to_branch(self):
+        graph = self.create_graph()
+        graph.nodes['cluster'].config.append(self.key('fail', 'true'))
+
+        result = graph.deploy(executor=SerialExecutor())
+
+        self.assertFalse(result.succeeded)
+        self.assertIsInstance(result.errors['cluster'], exceptions.PulumiUpExecError)
+        self.assertEqual(result.skipped, ['app'])
+        self.assertEqual(sorted(result.outputs), ['monitoring', 'network'])
+
+        with self.assertRaises(exceptions.PulumiStackGraphError) as e:
+            result.raise_for_errors()
+        self.assertEqual(e.exception.skipped, ['app'])
+
+        self.assertTrue(graph.destroy(executor=SerialExecutor()).succeeded)
+
+    def test_context_manager_in_processes(self):
+        root = Path(self.tmpdir.name).joinpath('graph')
+
+        with patch('pitfall.scheduler.ProcessPoolExecutor', lambda max_workers: _fork_executor(max_workers)):
+            with self.create_graph(root=root, max_workers=2) as graph:
+                self.assertEqual(graph.outputs['app']['network_vpc_id'], 'vpc-1234')
+                self.assertEqual(graph.outputs['monitoring'], {'retention': '7'})
+
+            self.assertEqual(graph.outputs, {})
+            self.assertTrue(root.exists())  # the root is only deleted if it is temporary
+
+            graph.nodes['network'].config.append(self.key('fail', 'true'))
+            with self.assertRaises(exceptions.PulumiStackGraphError):
+                with graph:
+                    pass  # pragma: no cover
+
+        self.assertEqual(graph.outputs, {})
+
+
+def _fork_executor(max_workers: int) -> Executor:
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
@@ -0,0 +1,163 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pitfall import exceptions
+from pitfall import utils
+from pitfall.secrets import PulumiSecret, PulumiSecretsDecryptor, SECRET_SIGNATURE_KEY, SECRET_SIGNATURE, find_ciphertexts, is_secret, wrap_secrets
+from pitfall.state import PulumiResource
+from unittest.mock import patch
+import json
+import os
+import unittest
+
+
+def encrypt_secret(value, key: bytes) -> dict:
+    """ returns the value as an encrypted secret in the format used by the Pulumi state file """
+    ciphertext = utils.get_encrypted_secret(json.dumps(value).encode('utf-8'), key)
+    return {SECRET_SIGNATURE_KEY: SECRET_SIGNATURE, "ciphertext": ciphertext}
+
+
+class TestPulumiSecrets(unittest.TestCase):
+    def setUp(self):
+        self.key = os.urandom(32)
+        self.decryptor = PulumiSecretsDecryptor(key=self.key)
+
+    def test_is_secret(self):
+        self.assertTrue(is_secret(encrypt_secret("ACME Corp", self.key)))
+        self.assertFalse(is_secret({"ciphertext": "v1:abc:def"}))
+        self.assertFalse(is_secret("ACME Corp"))
+
+    def test_secret_value(self):
+        secret = PulumiSecret(ciphertext=encrypt_secret({"user": "admin"}, self.key)["ciphertext"], decryptor=self.decryptor)
+
+        self.assertEqual("PulumiSecret('[secret]')", repr(secret))
+        self.assertEqual(0, len(self.decryptor))
+
+        self.assertDictEqual({"user": "admin"}, secret.value)
+        self.assertEqual(1, len(self.decryptor))
+
+    def test_secret_value_without_key(self):
+        secret = PulumiSecret(ciphertext=encrypt_secret("ACME Corp", self.key)["ciphertext"])
+
+        with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+            secret.value
+
+    def test_secret_value_with_wrong_key(self):
+        secret = PulumiSecret(ciphertext=encrypt_secret("ACME Corp", self.key)["ciphertext"], decryptor=PulumiSecretsDecryptor(key=os.urandom(32)))
+
+        with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+            secret.value
+
+    def test_secret_value_malformed(self):
+        for ciphertext in ['not-a-secret', 'v1:!!!:???', 'v1:AAAA:AAAA', 'v1::']:
+            secret = PulumiSecret(ciphertext=ciphertext, decryptor=self.decryptor)
+            with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+                secret.value
+
+        with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+            self.decryptor.decrypt_all(['v1:abc'])
+
+        ciphertext = utils.get_encrypted_secret(b'{not json', self.key)
+        with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+            self.decryptor.decrypt(ciphertext)
+
+    def test_secret_equality(self):
+        ciphertext = encrypt_secret("ACME Corp", self.key)["ciphertext"]
+
+        secret = PulumiSecret(ciphertext=ciphertext, decryptor=self.decryptor)
+        self.assertEqual(secret, PulumiSecret(ciphertext=ciphertext))
+        self.assertNotEqual(secret, PulumiSecret(ciphertext=encrypt_secret("ACME Corp", self.key)["ciphertext"]))
+        self.assertNotEqual(secret, "ACME Corp")
+        self.assertEqual(1, len({secret, PulumiSecret(ciphertext=ciphertext)}))
+
+        # outputs containing secrets compare equal without decrypting them
+        outputs = {"tags": {"Customer": encrypt_secret("ACME Corp", self.key)}}
+        self.assertEqual(wrap_secrets(outputs, decryptor=self.decryptor), wrap_secrets(outputs))
+        self.assertEqual(0, len(self.decryptor))
+
+    def test_wrap_secrets(self):
+        outputs = {
+            "bucket": "pitfall-14add43",
+            "tags": {"Customer": encrypt_secret("ACME Corp", self.key)},
+            "users": [encrypt_secret("admin", self.key), "guest"]
+        }
+
+        wrapped = wrap_secrets(outputs, decryptor=self.decryptor)
+
+        self.assertEqual("pitfall-14add43", wrapped["bucket"])
+        self.assertIsInstance(wrapped["tags"]["Customer"], PulumiSecret)
+        self.assertEqual("ACME Corp", wrapped["tags"]["Customer"].value)
+        self.assertEqual("admin", wrapped["users"][0].value)
+        self.assertEqual("guest", wrapped["users"][1])
+
+        # the original outputs are not modified
+        self.assertTrue(is_secret(outputs["tags"]["Customer"]))
+
+    def test_find_ciphertexts(self):
+        first  = encrypt_secret("ACME Corp", self.key)
+        second = encrypt_secret("admin", self.key)
+
+        value = {"tags": {"Customer": first}, "users": [second, PulumiSecret(first["ciphertext"])], "name": "test"}
+
+        expected = sorted([first["ciphertext"], first["ciphertext"], second["ciphertext"]])
+        actual   = sorted(find_ciphertexts(value))
+        self.assertListEqual(expected, actual)
+
+    def test_reveal(self):
+        customer = encrypt_secret("ACME Corp", self.key)
+
+        value = {"tags": {"Customer": customer, "Owner": "@bincyber"}, "users": [encrypt_secret("admin", self.key)]}
+
+        expected = {"tags": {"Customer": "ACME Corp", "Owner": "@bincyber"}, "users": ["admin"]}
+        self.assertDictEqual(expected, self.decryptor.reveal(value))
+        self.assertEqual(2, len(self.decryptor))
+
+        # plaintext values are cached by ciphertext
+        with patch('pitfall.utils.get_decrypted_secret') as mock_decrypt:
+            self.assertEqual({"Customer": "ACME Corp"}, self.decryptor.reveal({"Customer": customer}))
+            self.assertEqual("ACME Corp", self.decryptor.decrypt(customer["ciphertext"]))
+            mock_decrypt.assert_not_called()
+
+    def test_reveal_without_key(self):
+        decryptor = PulumiSecretsDecryptor()
+
+        self.assertDictEqual({"name": "test"}, decryptor.reveal({"name": "test"}))
+
+        with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+            decryptor.reveal({"Customer": encrypt_secret("ACME Corp", self.key)})
+
+    def test_reveal_resources(self):
+        first = PulumiResource(
+            urn="test-bucket", rtype="aws:s3/bucket:Bucket", rid="test-s3-bucket",
+            inputs={"tags": {"Customer": encrypt_secret("ACME Corp", self.key)}},
+            outputs={"tags": {"Customer": encrypt_secret("ACME Corp", self.key)}}
+        )
+        second = PulumiResource(
+            urn="test-user", rtype="aws:iam/user:User", rid="admin",
+            inputs={"name": "admin"},
+            outputs={"password": encrypt_secret("hunter2", self.key)}
+        )
+
+        with patch('pitfall.utils.get_decrypted_secret', wraps=utils.get_decrypted_secret) as mock_decrypt:
+            revealed = self.decryptor.reveal_resources([first, second])
+            self.assertEqual(3, mock_decrypt.call_count)
+
+        self.assertEqual("ACME Corp", revealed["test-bucket"]["inputs"]["tags"]["Customer"])
+        self.assertEqual("ACME Corp", revealed["test-bucket"]["outputs"]["tags"]["Customer"])
+        self.assertDictEqual({"name": "admin"}, revealed["test-user"]["inputs"])
+        self.assertDictEqual({"password": "hunter2"}, revealed["test-user"]["outputs"])
+
+        expected = revealed["test-user"]
+        actual   = self.decryptor.reveal_resource(second)
+        self.assertDictEqual(expected, actual)
@@ -0,0 +1,124 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall import exceptions
+from pitfall.config import PulumiConfigurationKey
+from pitfall.secrets import PulumiSecret
+from pitfall.shared import PulumiSharedStack, to_configuration_key
+from tests.test_pool import FakeAction, FakeDestroy, FakePreview, FakeUp
+from unittest.mock import patch, MagicMock
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+class TestPulumiSharedStack(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir  = tempfile.TemporaryDirectory()
+        self.program = Path(self.tmpdir.name).joinpath('vpc')
+        self.program.mkdir()
+        self.program.joinpath('__main__.py').write_text('import pulumi\n')
+
+        FakeAction.calls = []
+        FakeAction.fail  = False
+
+        for name, fake in (('PulumiUp', FakeUp), ('PulumiDestroy', FakeDestroy), ('PulumiPreview', FakePreview)):
+            patcher = patch(f'pitfall.core.{name}', fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.pwd = Path.cwd()
+
+    def tearDown(self):
+        os.chdir(self.pwd)
+        self.tmpdir.cleanup()
+
+        for i in ['PULUMI_HOME', 'PULUMI_CONFIG_PASSPHRASE']:
+            os.environ.pop(i, None)
+
+    def create(self) -> PulumiSharedStack:
+        config = [PulumiConfigurationKey(name='vpc_id', value='vpc-1234'), PulumiConfigurationKey(name='cidr_block', value='10.0.0.0/16')]
+        return PulumiSharedStack(directory=self.program, config=config, root=Path(self.tmpdir.name).joinpath('shared'))
+
+    def calls(self) -> list:
+        return [i[0] for i in FakeAction.calls]
+
+    def test_shared_by_users(self):
+        first  = self.create()
+        second = self.create()
+
+        self.assertEqual(first.acquire(), {'vpc_id': 'vpc-1234', 'cidr_block': '10.0.0.0/16'})
+        self.assertEqual(Path.cwd(), self.pwd)
+
+        with second:
+            self.assertEqual(second.outputs, first.outputs)
+            self.assertEqual(self.calls(), ['FakeUp'])  # deployed once
+
+            config = second.config({'vpc_id': 'base-vpc-id'})
+            self.assertEqual(config, [PulumiConfigurationKey(name='base-vpc-id', value='vpc-1234')])
+            self.assertCountEqual([i.name for i in second.config()], ['vpc_id', 'cidr_block'])
+
+        self.assertEqual(self.calls(), ['FakeUp'])  # another user remains
+        self.assertEqual(list(json.loads(first.users_filepath.read_text())), [first.token])
+
+        self.assertTrue(first.release())
+        self.assertEqual(self.calls(), ['FakeUp', 'FakeDestroy'])  # destroyed by the last user
+        self.assertFalse(first.pool.workspace(0).exists())
+
+        self.assertFalse(first.release())  # no longer a user
+
+    def test_exited_users_are_removed(self):
+        process = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True)
+        pid     = int(process.stdout)
+
+        shared = self.create()
+        shared.acquire()
+
+        with shared._users() as users:
+            users['exited'] = pid
+
+        self.assertTrue(shared.release())
+        self.assertEqual(json.loads(shared.users_filepath.read_text()), {})
+
+    def test_failed_deployment(self):
+        FakeAction.fail = True
+
+        shared = self.create()
+        with self.assertRaises(exceptions.PulumiUpExecError):
+            shared.acquire()
+
+        self.assertFalse(shared.acquired)
+        self.assertEqual(json.loads(shared.users_filepath.read_text()), {})
+
+
+class TestToConfigurationKey(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(to_configuration_key('a', 'vpc-1'), PulumiConfigurationKey(name='a', value='vpc-1'))
+        self.assertEqual(to_configuration_key('a', 3), PulumiConfigurationKey(name='a', value=3))
+        self.assertEqual(to_configuration_key('a', ['subnet-1', 'subnet-2']), PulumiConfigurationKey(name='a', value='["subnet-1", "subnet-2"]'))
+        self.assertEqual(to_configuration_key('a', None), PulumiConfigurationKey(name='a', value='null'))
+
+    def test_secrets(self):
+        decryptor = MagicMock()
+        decryptor.decrypt.side_effect = lambda ciphertext: {'v1:a': 'hunter2', 'v1:b': 5432}[ciphertext]
+
+        self.assertEqual(to_configuration_key('p', PulumiSecret('v1:a', decryptor)), PulumiConfigurationKey(name='p', value=b'hunter2', encrypted=True))
+        self.assertEqual(to_configuration_key('p', PulumiSecret('v1:b', decryptor)), PulumiConfigurationKey(name='p', value=b'5432', encrypted=True))
+
+        nested = to_configuration_key('db', {'host': 'db.local', 'port': PulumiSecret('v1:b', decryptor)})
+        self.assertEqual(nested, PulumiConfigurationKey(name='db', value=b'{"host": "db.local", "port": 5432}', encrypted=True))
@@ -0,0 +1,167 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+from pitfall import exceptions
+from pitfall.actions import PulumiPreview
+from pitfall.snapshot import PulumiSnapshots, normalize, serialize
+from pitfall.state import PulumiResources
+from unittest.mock import patch
+import copy
+import json
+import os
+import tempfile
+import unittest
+
+
+class TestNormalize(unittest.TestCase):
+    def test_normalize(self):
+        value = {
+            "urn:pulumi:pitf-stack-0123456789abcdef::pitfall::aws:s3/bucket:Bucket::logs": {
+                "id": "logs-1a2b3c4",
+                "bucket": "logs-1a2b3c4",
+                "versionId": "v-1a2b3c4",
+                "createdAt": "2019-09-19T13:30:56.123Z",
+                "requestId": "6f713df4-54ad-4582-b0c6-1d2e3f4a5b6c",
+                "password": {"4dabf18193072939515e22adb298388d": "1b47061264138c4ac30d75fd1eb44270", "ciphertext": "v1:abc:def"},
+                "tags": ["Name", "logs"],
+                "size": 10,
+                "name": "pitf-project-0123456789abcdef"
+            }
+        }
+
+        expected = {
+            "urn:pulumi:<stack>::pitfall::aws:s3/bucket:Bucket::logs": {
+                "id": "<id>",
+                "bucket": "logs-1a2b3c4",
+                "versionId": "v-1a2b3c4",
+                "createdAt": "<timestamp>",
+                "requestId": "<uuid>",
+                "password": "<secret>",
+                "tags": ["Name", "logs"],
+                "size": 10,
+                "name": "pitf-project-<random>"
+            }
+        }
+
+        self.assertEqual(normalize(value), expected)
+        self.assertEqual(normalize({"id": None}), {"id": None})
+        self.assertEqual(normalize({"id": "a", "arn": "b"}, volatile_keys=["arn"], patterns=[]), {"id": "a", "arn": "<arn>"})
+
+    def test_normalize_autonamed_keys(self):
+        value = {"name": "logs-1a2b3c4", "bucket": "logs-1a2b3c4", "tags": {"name": "logs-1a2b3c4"}, "policy": "deny-1a2b3c4-all"}
+
+        self.assertEqual(
+            normalize(value), {"name": "logs-<random>", "bucket": "logs-1a2b3c4", "tags": {"name": "logs-<random>"}, "policy": "deny-1a2b3c4-all"}
+        )
+        self.assertEqual(normalize(value, autonamed_keys=["bucket"])["bucket"], "logs-<random>")
+        self.assertEqual(normalize(value, autonamed_keys=[])["name"], "logs-1a2b3c4")
+        self.assertNotEqual(normalize({"bucket": "logs-1a2b3c4"}), normalize({"bucket": "logs-5d6e7f8"}))
+
+    def test_serialize(self):
+        self.assertEqual(serialize({"b": 1, "a": "é"}), serialize({"a": "é", "b": 1}))
+        self.assertTrue(serialize({}).endswith(b'\n'))
+
+
+class TestPulumiSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir    = tempfile.TemporaryDirectory()
+        self.snapshots = PulumiSnapshots(directory=Path(self.tmpdir.name).joinpath('snapshots'), update=False)
+
+        self.checkpoint = json.loads(Path(__file__).parent.joinpath('test_data/state.json').read_text())
+
+        self.preview         = PulumiPreview()
+        self.preview._stdout = Path(__file__).parent.joinpath('test_data/preview.json').read_text()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_assert_match_records_missing_snapshot(self):
+        resources = PulumiResources.from_checkpoint(self.checkpoint)
+
+        self.assertFalse(self.snapshots.path('resources').exists())
+        self.snapshots.assert_match('resources', resources)
+        self.assertTrue(self.snapshots.path('resources').exists())
+
+        snapshot = json.loads(self.snapshots.path('resources').read_text())
+        for urn, resource in snapshot.items():
+            self.assertIn('urn:pulumi:<stack>::', urn)
+            if resource["id"] is not None:
+                self.assertEqual(resource["id"], "<id>")
+
+        self.assertTrue(self.snapshots.matches('resources', resources))
+        self.snapshots.assert_match('resources', resources)
+
+    def test_assert_match_preview(self):
+        self.snapshots.assert_match('preview', self.preview)
+
+        snapshot = json.loads(self.snapshots.path('preview').read_text())
+        steps    = list(self.preview.iter_steps())
+        self.assertEqual(sum(len(i) for i in snapshot.values()), len(steps))
+
+        self.snapshots.assert_match('preview', self.preview)
+
+    def test_assert_match_ignores_volatile_fields(self):
+        self.snapshots.assert_match('resources', PulumiResources.from_checkpoint(self.checkpoint))
+
+        redeployed = copy.deepcopy(self.checkpoint)
+        for i in redeployed["checkpoint"]["latest"]["resources"]:
+            i["urn"] = i["urn"].replace("urn:pulumi:", "urn:pulumi:other-", 1)
+            if i.get("parent"):
+                i["parent"] = i["parent"].replace("urn:pulumi:", "urn:pulumi:other-", 1)
+            if i.get("id"):
+                i["id"] = "another-id"
+
+        self.snapshots.assert_match('resources', PulumiResources.from_checkpoint(redeployed))
+
+    def test_assert_match_mismatch(self):
+        self.snapshots.assert_match('resources', PulumiResources.from_checkpoint(self.checkpoint))
+
+        changed  = copy.deepcopy(self.checkpoint)
+        resource = next(i for i in changed["checkpoint"]["latest"]["resources"] if i.get("id"))
+        resource.setdefault("inputs", {})["pitfall"] = "changed"
+
+        resources = PulumiResources.from_checkpoint(changed)
+        self.assertFalse(self.snapshots.matches('resources', resources))
+
+        with self.assertRaises(exceptions.PulumiSnapshotMismatchError) as e:
+            self.snapshots.assert_match('resources', resources)
+
+        self.assertIsInstance(e.exception, AssertionError)
+        self.assertEqual(len(e.exception.changes), 1)
+        self.assertEqual(e.exception.changes[0].kind, 'add')
+        self.assertTrue(e.exception.changes[0].path.endswith('inputs.pitfall'))
+        self.assertIn('inputs.pitfall', str(e.exception))
+
+    def test_assert_match_update(self):
+        self.snapshots.assert_match('data', {"a": 1})
+
+        with patch.dict(os.environ, {'PITFALL_UPDATE_SNAPSHOTS': 'true'}):
+            snapshots = PulumiSnapshots(directory=self.snapshots.directory)
+        self.assertTrue(snapshots.update)
+
+        snapshots.assert_match('data', {"a": 2})
+        self.assertEqual(json.loads(self.snapshots.path('data').read_text()), {"a": 2})
+        self.snapshots.assert_match('data', {"a": 2})
+
+    def test_file_hash_is_cached(self):
+        self.snapshots.assert_match('data', {"a": 1})
+
+        with patch.object(Path, 'read_bytes', side_effect=AssertionError('snapshot file was read')):
+            for _ in range(3):
+                self.snapshots.assert_match('data', {"a": 1})
+
+        self.snapshots.path('data').write_text('{"a": 3}')
+        with self.assertRaises(exceptions.PulumiSnapshotMismatchError):
+            self.snapshots.assert_match('data', {"a": 1})
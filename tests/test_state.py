@@ -12,19 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from anytree import LoopError, TreeError
 from contextlib import redirect_stdout
 from io import StringIO
 from pathlib import Path
 from pitfall import utils
 from pitfall import exceptions
-from pitfall.state import PulumiState, PulumiResource, PulumiResources
-from unittest.mock import patch, MagicMock
+from pitfall.secrets import PulumiSecret, SECRET_SIGNATURE_KEY, SECRET_SIGNATURE
+from pitfall.state import PropertyCompressor, PulumiState, PulumiResource, PulumiResources
+from unittest.mock import patch, MagicMock, PropertyMock
 import copy
+import gzip
 import os
 import json
 import shutil
 import subprocess
 import unittest
+import zlib
 
 
 class TestPulumiResource(unittest.TestCase):
@@ -35,6 +39,116 @@ class TestPulumiResource(unittest.TestCase):
         actual   = resource.__repr__()
         self.assertEqual(expected, actual)
 
+    def test_from_state(self):
+        state_resource = {
+            "urn": "test-bucket",
+            "type": "aws:s3/bucket:Bucket",
+            "id": "test-s3-bucket",
+            "provider": "urn:pulumi:pitf-stack-1::pitf-project-1::pulumi:providers:aws::default::4b11ab10",
+            "inputs": {"bucket": "test-s3-bucket"},
+            "outputs": {"arn": "arn:aws:s3:::test-s3-bucket", "bucket": "test-s3-bucket"},
+            "propertyDependencies": {"bucket": []},
+            "dependencies": ["test-kms-key"]
+        }
+
+        resource = PulumiResource.from_state(state_resource)
+        self.assertEqual("test-bucket", resource.urn)
+        self.assertEqual("aws:s3/bucket:Bucket", resource.type)
+        self.assertEqual("test-s3-bucket", resource.id)
+        self.assertEqual(state_resource["provider"], resource.provider)
+
+        # properties are decoded on first access
+        self.assertIsNone(resource._properties)
+        self.assertIsInstance(resource._payload, str)
+
+        self.assertDictEqual(state_resource["inputs"], resource.inputs)
+        self.assertDictEqual(state_resource["outputs"], resource.outputs)
+        self.assertDictEqual(state_resource["propertyDependencies"], resource.dependencies)
+        self.assertListEqual(state_resource["dependencies"], resource.depends_on)
+        self.assertEqual('', resource._payload)
+
+        resource.outputs = {"arn": "arn:aws:s3:::new-bucket"}
+        self.assertDictEqual({"arn": "arn:aws:s3:::new-bucket"}, resource.outputs)
+        self.assertDictEqual(state_resource["inputs"], resource.inputs)
+
+    def test_from_state_compressed(self):
+        tags = {f"Tag{i}": f"value-{i}" for i in range(50)}
+
+        resource = PulumiResource.from_state({"urn": "test-bucket", "type": "aws:s3/bucket:Bucket", "outputs": {"tags": tags}})
+        self.assertIsInstance(resource._payload, bytes)
+
+        self.assertDictEqual({}, resource.inputs)
+        self.assertDictEqual({"tags": tags}, resource.outputs)
+        self.assertDictEqual({}, resource.dependencies)
+        self.assertListEqual([], resource.depends_on)
+        self.assertIsNone(resource.id)
+        self.assertIsNone(resource.provider)
+
+    def test_from_state_with_preset_dictionary(self):
+        compressor = PropertyCompressor()
+        tags       = {f"Tag{i}": f"value-{i}" for i in range(50)}
+
+        first  = PulumiResource.from_state({"urn": "first", "type": "aws:s3/bucket:Bucket", "outputs": {"tags": tags}}, compressor)
+        second = PulumiResource.from_state({"urn": "second", "type": "aws:s3/bucket:Bucket", "outputs": {"tags": dict(tags, Tag0="changed")}}, compressor)
+
+        # the properties of the first bucket are the dictionary, so the second bucket only stores how it differs
+        self.assertIs(first._dictionary, second._dictionary)
+        self.assertLess(len(second._payload), len(zlib.compress(json.dumps({"tags": tags}).encode('utf-8'), 1)) // 2)
+
+        self.assertDictEqual({"tags": tags}, first.outputs)
+        self.assertEqual("changed", second.outputs["tags"]["Tag0"])
+        self.assertIsNone(second._dictionary)
+
+    def test_tree(self):
+        parent   = PulumiResource(urn="test-stack", rtype="pulumi:pulumi:Stack", rid="1")
+        resource = PulumiResource(urn="test-resource", rtype="test-type", rid="test-id", parent=parent)
+        child    = PulumiResource(urn="test-child", rtype="test-type", rid="test-child-id", parent=resource)
+
+        self.assertIs(parent, resource.parent)
+        self.assertTupleEqual((resource,), parent.children)
+        self.assertTupleEqual((), child.children)
+        self.assertTupleEqual((parent, resource, child), child.path)
+        self.assertTupleEqual((resource, child), parent.descendants)
+
+        with self.assertRaises(LoopError):
+            parent.parent = child
+
+        with self.assertRaises(LoopError):
+            resource.parent = resource
+
+        with self.assertRaises(TreeError):
+            resource.parent = "test-stack"
+
+        # moving a resource detaches it from its previous parent
+        child.parent = parent
+        self.assertTupleEqual((resource, child), parent.children)
+        self.assertTupleEqual((), resource.children)
+
+        child.parent = None
+        self.assertTupleEqual((resource,), parent.children)
+        self.assertIsNone(child.parent)
+
+    def test_children(self):
+        parent = PulumiResource(urn="test-stack", rtype="pulumi:pulumi:Stack", rid="1")
+        first  = PulumiResource(urn="test-first", rtype="test-type", rid="1", parent=parent)
+        second = PulumiResource(urn="test-second", rtype="test-type", rid="2")
+
+        parent.children = [second, first]
+        self.assertTupleEqual((second, first), parent.children)
+        self.assertIs(parent, second.parent)
+
+        # the previous children are restored if a child cannot be attached
+        with self.assertRaises(TreeError):
+            parent.children = [first, "test-third"]
+        self.assertTupleEqual((second, first), parent.children)
+
+        with self.assertRaises(TreeError):
+            parent.children = [first, first]
+
+        del parent.children
+        self.assertTupleEqual((), parent.children)
+        self.assertIsNone(first.parent)
+
 
 class TestPulumiResources(unittest.TestCase):
     def setUp(self):
@@ -55,6 +169,10 @@ class TestPulumiResources(unittest.TestCase):
         for i in self.pulumi_resources:
             self.assertIsInstance(i, PulumiResource)
 
+    def test_iterator_is_reentrant(self):
+        pairs = [(i, j) for i in self.pulumi_resources for j in self.pulumi_resources]
+        self.assertEqual(25, len(pairs))
+
     def test_append(self):
         new_resource = PulumiResource(urn="test-resource", rtype="test", rid="6", parent=self.first)
         self.pulumi_resources.append(new_resource)
@@ -70,6 +188,128 @@ class TestPulumiResources(unittest.TestCase):
         answer = self.pulumi_resources.lookup(key="type", value="aws:ec2/subnet:Subnet")
         self.assertEqual(2, len(answer))
 
+    def test_lookup_children_by_parent(self):
+        answer = self.pulumi_resources.lookup(key="parent", value=self.second)
+        self.assertTupleEqual((self.third, self.fifth), answer)
+
+        answer = self.pulumi_resources.lookup(key="parent", value=self.first)
+        self.assertTupleEqual((self.second, self.fourth), answer)
+
+        # the URN of the parent is also accepted
+        answer = self.pulumi_resources.lookup(key="parent", value="test-vpc")
+        self.assertTupleEqual((self.third, self.fifth), answer)
+
+        self.assertTupleEqual((), self.pulumi_resources.lookup(key="parent", value=self.third))
+        self.assertTupleEqual((self.first,), self.pulumi_resources.lookup(key="parent", value=None))
+
+    def test_get(self):
+        self.assertIs(self.third, self.pulumi_resources.get("test-subnet-1"))
+        self.assertIsNone(self.pulumi_resources.get("does-not-exist"))
+
+        new_resource = PulumiResource(urn="test-resource", rtype="test", rid="6", parent=self.first)
+        self.pulumi_resources.append(new_resource)
+        self.assertIs(new_resource, self.pulumi_resources.get("test-resource"))
+
+    def test_lookup_missing_urn(self):
+        self.assertTupleEqual((), self.pulumi_resources.lookup(key="urn", value="does-not-exist"))
+
+    def test_from_checkpoint(self):
+        checkpoint = {
+            "checkpoint": {
+                "latest": {
+                    "resources": [
+                        {"urn": "test-stack", "type": "pulumi:pulumi:Stack"},
+                        {"urn": "test-subnet-1", "type": "aws:ec2/subnet:Subnet", "id": "subnet-001", "parent": "test-vpc"},
+                        {"urn": "test-vpc", "type": "aws:ec2/vpc:Vpc", "id": "vpc-001", "parent": "test-stack"},
+                        {"urn": "test-bucket", "type": "aws:s3/bucket:Bucket", "id": "test-s3-bucket", "parent": "test-stack"},
+                        {"urn": "test-orphan", "type": "aws:s3/bucket:Bucket", "id": "test-orphan", "parent": "does-not-exist"}
+                    ]
+                }
+            }
+        }
+
+        resources = PulumiResources.from_checkpoint(checkpoint)
+        self.assertEqual(5, len(resources))
+
+        stack = resources.get("test-stack")
+        vpc   = resources.get("test-vpc")
+
+        self.assertTrue(stack.is_root)
+        self.assertTupleEqual((vpc, resources.get("test-bucket")), stack.children)
+        self.assertIs(vpc, resources.get("test-subnet-1").parent)
+        self.assertIsNone(resources.get("test-orphan").parent)
+
+    def test_from_checkpoint_without_resources(self):
+        resources = PulumiResources.from_checkpoint({"checkpoint": {"stack": "unit-test"}})
+        self.assertEqual(0, len(resources))
+
+    def test_index(self):
+        index = self.pulumi_resources.index("type")
+        self.assertListEqual([self.third, self.fifth], index["aws:ec2/subnet:Subnet"])
+        self.assertIs(index, self.pulumi_resources.index("type"))
+
+        index = self.pulumi_resources.index("parent")
+        self.assertListEqual([self.second, self.fourth], index["test-stack"])
+        self.assertListEqual([self.first], index[None])
+
+        # indexes that have been built are updated when resources are appended
+        new_resource = PulumiResource(urn="test-subnet-3", rtype="aws:ec2/subnet:Subnet", rid="subnet-003", parent=self.second)
+        self.pulumi_resources.append(new_resource)
+        self.assertIn(new_resource, self.pulumi_resources.index("type")["aws:ec2/subnet:Subnet"])
+        self.assertIn(new_resource, self.pulumi_resources.index("parent")["test-vpc"])
+        self.assertEqual(3, self.pulumi_resources.types["aws:ec2/subnet:Subnet"])
+
+        with self.assertRaises(ValueError):
+            self.pulumi_resources.index("inputs")
+
+    def test_lookup_uses_index(self):
+        with patch('pitfall.state.findall_by_attr') as mock_findall:
+            answer = self.pulumi_resources.lookup(key="id", value="subnet-002")
+            self.assertTupleEqual((self.fifth,), answer)
+            mock_findall.assert_not_called()
+
+    def test_where(self):
+        self.fourth.outputs = {"tags": {"Environment": "test", "Name": "bucket"}}
+        self.third.outputs  = {"tags": {"Environment": "test", "Name": "subnet-1"}, "cidrBlocks": ["10.0.0.0/20"]}
+        self.fifth.outputs  = {"tags": {"Environment": "prod", "Name": "subnet-2"}}
+
+        with self.subTest(msg="indexed attributes"):
+            answer = self.pulumi_resources.where(type="aws:ec2/subnet:Subnet", parent=self.second)
+            self.assertTupleEqual((self.third, self.fifth), answer)
+
+            answer = self.pulumi_resources.where(type="aws:ec2/subnet:Subnet", id="subnet-002")
+            self.assertTupleEqual((self.fifth,), answer)
+
+            answer = self.pulumi_resources.where(parent="test-stack")
+            self.assertTupleEqual((self.second, self.fourth), answer)
+
+        with self.subTest(msg="nested outputs"):
+            answer = self.pulumi_resources.where(outputs__tags__Environment="test")
+            self.assertTupleEqual((self.third, self.fourth), answer)
+
+            answer = self.pulumi_resources.where(type="aws:ec2/subnet:Subnet", outputs__tags__Environment="test")
+            self.assertTupleEqual((self.third,), answer)
+
+            answer = self.pulumi_resources.where(outputs__cidrBlocks__0="10.0.0.0/20")
+            self.assertTupleEqual((self.third,), answer)
+
+            answer = self.pulumi_resources.where(outputs__tags__Owner="@bincyber")
+            self.assertTupleEqual((), answer)
+
+        with self.subTest(msg="predicates"):
+            answer = self.pulumi_resources.where(outputs__tags__Name=lambda x: x.startswith("subnet"))
+            self.assertTupleEqual((self.third, self.fifth), answer)
+
+            answer = self.pulumi_resources.where(id=lambda x: x is None or x.startswith("vpc"))
+            self.assertTupleEqual((self.second,), answer)
+
+        with self.subTest(msg="JMESPath"):
+            answer = self.pulumi_resources.where("outputs.tags.Environment == 'prod'")
+            self.assertTupleEqual((self.fifth,), answer)
+
+            answer = self.pulumi_resources.where("contains(keys(outputs), 'cidrBlocks')", type="aws:ec2/subnet:Subnet")
+            self.assertTupleEqual((self.third,), answer)
+
     def test_providers_extraction(self):
         providers = self.pulumi_resources.providers
 
@@ -273,6 +513,53 @@ class TestPulumiState(unittest.TestCase):
         actual       = self.pulumi_state.previous
         self.assertDictEqual(expected, actual)
 
+    def test_diff(self):
+        test_state = json.loads(Path(__file__).parent.joinpath('test_data/state.json').read_text())
+
+        self.pulumi_state.write()
+        with self.subTest(msg="from the previous state"):
+            with patch('pitfall.state.PulumiState.previous', new_callable=PropertyMock) as mock_previous:
+                mock_previous.return_value = test_state
+
+                result = self.pulumi_state.diff()
+                self.assertDictEqual({"add": 0, "remove": 13, "replace": 0, "update": 0, "same": 0}, result.summary)
+
+        with self.subTest(msg="between checkpoints"):
+            result = self.pulumi_state.diff(old=self.pulumi_state.current, new=test_state)
+            self.assertEqual(13, len(result.added))
+
+    def test_history(self):
+        history = self.pulumi_state.history
+        self.assertIs(history, self.pulumi_state.history)
+        self.assertEqual(self.pulumi_state.dirpath.joinpath('backups/unit-test'), history.directory)
+        self.assertEqual(0, len(history))
+
+        backups_directory = history.directory
+        backups_directory.mkdir(parents=True)
+        backups_directory.joinpath('unit-test.1568899856000000000.json').write_text(json.dumps(self.pulumi_state.new))
+        self.assertEqual(1, len(history))
+
+        # the history follows the state directory when the working directory changes
+        os.chdir(self.pwd)
+        self.assertIsNot(history, self.pulumi_state.history)
+
+    def test_apply_retention(self):
+        self.pulumi_state.apply_retention()  # no policy
+
+        self.pulumi_state.retention = MagicMock()
+        self.pulumi_state.apply_retention()
+        self.pulumi_state.retention.apply.assert_called_once_with(self.pulumi_state.history)
+
+    def test_previous_state_compressed(self):
+        backups_directory = self.pulumi_state.dirpath.joinpath(f'backups/{self.pulumi_state.stack}')
+        backups_directory.mkdir(parents=True, exist_ok=True)
+
+        with gzip.open(backups_directory.joinpath(f'{self.pulumi_state.stack}.1569080793000000000.json.gz'), 'wt') as f:
+            json.dump(self.pulumi_state.new, f)
+        backups_directory.joinpath(f'{self.pulumi_state.stack}.1569168944000000000.json').write_text('{}')
+
+        self.assertDictEqual(self.pulumi_state.new, self.pulumi_state.previous)
+
     def test_to_json(self):
         expected = json.dumps(self.pulumi_state.new, indent=4)
         self.assertEqual(expected, self.pulumi_state.to_json())
@@ -285,6 +572,56 @@ class TestPulumiState(unittest.TestCase):
         expected = json.dumps(self.pulumi_state.new, indent=4)
         self.assertEqual(expected, self.pulumi_state.to_json())
 
+    def test_digest(self):
+        self.assertIsNone(self.pulumi_state.digest)
+
+        self.pulumi_state.write({"version": 3, "checkpoint": {"stack": "unit-test", "value": "small"}})
+        digest = self.pulumi_state.digest
+
+        self.pulumi_state.write({"version": 3, "checkpoint": {"stack": "unit-test", "value": "large"}})
+        self.assertNotEqual(digest, self.pulumi_state.digest)
+
+    def test_seed(self):
+        fixture = MagicMock()
+        fixture.rebase.return_value = {"version": 3, "checkpoint": {"stack": "unit-test", "latest": {"resources": []}}}
+
+        self.pulumi_state.seed(fixture, project='unit')
+
+        fixture.rebase.assert_called_once_with(stack='unit-test', project='unit', encryptionsalt=self.pulumi_state.encryptionsalt, encryption_key=None)
+
+        latest = self.pulumi_state.current["checkpoint"]["latest"]
+        self.assertEqual(latest["resources"], [])
+        self.assertEqual(latest["manifest"], self.pulumi_state.new["checkpoint"]["latest"]["manifest"])
+
+    def test_compressed_state_file(self):
+        test_state = Path(__file__).parent.joinpath('test_data/state.json').read_text()
+
+        self.pulumi_state.write()
+        self.assertEqual('unit-test.json', self.pulumi_state.filepath.name)
+
+        # Pulumi's compressed state file is read when the uncompressed one does not exist
+        self.pulumi_state.filepath.unlink()
+        with gzip.open(self.pulumi_state.filepath.with_suffix('.json.gz'), 'wt') as f:
+            f.write(test_state)
+
+        self.assertEqual('unit-test.json.gz', self.pulumi_state.filepath.name)
+        self.assertDictEqual(json.loads(test_state), self.pulumi_state.current)
+        self.assertEqual(13, len(self.pulumi_state.resources))
+        self.assertEqual(13, len(list(self.pulumi_state.iter_resources())))
+
+        # writing an uncompressed state file replaces the compressed one
+        self.pulumi_state.write()
+        self.assertEqual('unit-test.json', self.pulumi_state.filepath.name)
+        self.assertFalse(self.pulumi_state.filepath.with_suffix('.json.gz').exists())
+
+        self.pulumi_state.compressed = True
+        self.pulumi_state.write()
+        self.assertEqual('unit-test.json.gz', self.pulumi_state.filepath.name)
+        self.assertFalse(self.pulumi_state.dirpath.joinpath('stacks/unit-test.json').exists())
+
+        with gzip.open(self.pulumi_state.filepath, 'rt') as f:
+            self.assertEqual(self.pulumi_state.to_json(), f.read())
+
     def test_resources(self):
         # copy the test state file to the temp Pulumi state directory
         test_state = Path(__file__).parent.joinpath('test_data/state.json').read_text()
@@ -312,3 +649,92 @@ class TestPulumiState(unittest.TestCase):
         self.assertIsInstance(resource.inputs, dict)
         self.assertIsInstance(resource.outputs, dict)
         self.assertIsInstance(resource.dependencies, dict)
+
+    def test_no_outputs(self):
+        self.assertIsNone(self.pulumi_state.outputs)
+
+        self.pulumi_state.write()
+        self.assertIsNone(self.pulumi_state.outputs)
+
+    def test_outputs(self):
+        test_state = Path(__file__).parent.joinpath('test_data/state.json').read_text()
+        self.pulumi_state.filepath.parent.mkdir(parents=True, exist_ok=False)
+        self.pulumi_state.filepath.write_text(test_state)
+
+        outputs = self.pulumi_state.outputs
+        self.assertIsInstance(outputs, dict)
+        self.assertEqual("vpc-0704f4b9f5ad93528", outputs["vpc"]["id"])
+
+        # outputs are cached until the state file is modified
+        with patch('pitfall.state.PulumiState.current', new_callable=PropertyMock) as mock_current:
+            self.assertIs(outputs, self.pulumi_state.outputs)
+            mock_current.assert_not_called()
+
+        contents = json.loads(test_state)
+        contents["checkpoint"]["latest"]["resources"][0]["outputs"] = {"s3_bucket_name": "pitfall-test-bucket"}
+        self.pulumi_state.filepath.write_text(json.dumps(contents))
+        os.utime(self.pulumi_state.filepath, ns=(0, 0))
+
+        self.assertDictEqual({"s3_bucket_name": "pitfall-test-bucket"}, self.pulumi_state.outputs)
+
+    def test_outputs_with_secrets(self):
+        key = os.urandom(32)
+
+        pulumi_state = PulumiState(stack='unit-test', encryptionsalt=self.pulumi_state.encryptionsalt, encryption_key=key)
+
+        ciphertext = utils.get_encrypted_secret(b'"ACME Corp"', key)
+
+        contents = json.loads(Path(__file__).parent.joinpath('test_data/state.json').read_text())
+        contents["checkpoint"]["latest"]["resources"][0]["outputs"] = {
+            "customer": {SECRET_SIGNATURE_KEY: SECRET_SIGNATURE, "ciphertext": ciphertext}
+        }
+
+        pulumi_state.filepath.parent.mkdir(parents=True, exist_ok=False)
+        pulumi_state.filepath.write_text(json.dumps(contents))
+
+        secret = pulumi_state.outputs["customer"]
+        self.assertIsInstance(secret, PulumiSecret)
+        self.assertEqual("ACME Corp", secret.value)
+
+    def test_current_state_is_cached(self):
+        expected = {"version": 3, "checkpoint": {"stack": self.pulumi_state.stack, "latest": {"resources": []}}}
+        self.pulumi_state.filepath.parent.mkdir(parents=True, exist_ok=False)
+        self.pulumi_state.filepath.write_text(json.dumps(expected))
+
+        current = self.pulumi_state.current
+
+        with patch('json.loads') as mock_loads:
+            self.assertIs(current, self.pulumi_state.current)
+            mock_loads.assert_not_called()
+
+        # the cache is rebuilt when the state file changes
+        expected["checkpoint"]["latest"]["resources"].append({"urn": "test-stack", "type": "pulumi:pulumi:Stack"})
+        self.pulumi_state.filepath.write_text(json.dumps(expected))
+
+        self.assertDictEqual(expected, self.pulumi_state.current)
+
+    def test_resources_are_cached(self):
+        test_state = Path(__file__).parent.joinpath('test_data/state.json').read_text()
+        self.pulumi_state.filepath.parent.mkdir(parents=True, exist_ok=False)
+        self.pulumi_state.filepath.write_text(test_state)
+
+        resources = self.pulumi_state.resources
+        self.assertIs(resources, self.pulumi_state.resources)
+
+        self.pulumi_state.invalidate()
+        self.assertIsNot(resources, self.pulumi_state.resources)
+        self.assertEqual(len(resources), len(self.pulumi_state.resources))
+
+    def test_resources_without_state_file(self):
+        self.assertEqual(0, len(self.pulumi_state.resources))
+
+    def test_iter_resources(self):
+        self.assertListEqual([], list(self.pulumi_state.iter_resources()))
+
+        test_state = Path(__file__).parent.joinpath('test_data/state.json').read_text()
+        self.pulumi_state.filepath.parent.mkdir(parents=True, exist_ok=False)
+        self.pulumi_state.filepath.write_text(test_state)
+
+        expected = json.loads(test_state)["checkpoint"]["latest"]["resources"]
+        actual   = list(self.pulumi_state.iter_resources())
+        self.assertListEqual(expected, actual)
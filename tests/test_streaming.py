@@ -0,0 +1,109 @@
+# Copyright 2019 Ali (@bincyber)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from io import BytesIO, StringIO
+from pathlib import Path
+from pitfall import streaming
+from pitfall.streaming import JSONStreamReader
+from unittest.mock import patch
+import json
+import unittest
+
+
+class TestJSONStreamReader(unittest.TestCase):
+    def setUp(self):
+        self.state   = Path(__file__).parent.joinpath('test_data/state.json').read_text()
+        self.preview = Path(__file__).parent.joinpath('test_data/preview.json').read_text()
+
+    def tearDown(self):
+        pass
+
+    def test_iter_items(self):
+        expected = json.loads(self.state)["checkpoint"]["latest"]["resources"]
+
+        for chunk_size in [1, 7, 64, 65536]:
+            with self.subTest(chunk_size=chunk_size):
+                reader = JSONStreamReader(StringIO(self.state), chunk_size=chunk_size)
+                actual = list(reader.iter_items(('checkpoint', 'latest', 'resources')))
+                self.assertListEqual(expected, actual)
+
+    def test_iter_items_top_level_key(self):
+        expected = json.loads(self.preview)["steps"]
+
+        reader = JSONStreamReader(StringIO(self.preview), chunk_size=16)
+        actual = list(reader.iter_items(('steps',)))
+        self.assertListEqual(expected, actual)
+
+    def test_iter_items_is_lazy(self):
+        reader = JSONStreamReader(StringIO(self.state), chunk_size=64)
+        items  = reader.iter_items(('checkpoint', 'latest', 'resources'))
+
+        first = next(items)
+        self.assertEqual("pulumi:pulumi:Stack", first["type"])
+        self.assertLess(len(reader.buffer), len(self.state))
+
+    def test_iter_items_skips_strings_and_scalars(self):
+        document = '{"a": "x\\\\\\"}]", "b": null, "c": -1.5e3, "d": [{"e": "]"}], "items": [1, 23, 456, "7,8"]}'
+
+        reader = JSONStreamReader(StringIO(document), chunk_size=1)
+        actual = list(reader.iter_items(('items',)))
+        self.assertListEqual([1, 23, 456, "7,8"], actual)
+
+    def test_iter_items_empty_array(self):
+        reader = JSONStreamReader(StringIO('{"items": [ ]}'))
+        self.assertListEqual([], list(reader.iter_items(('items',))))
+
+    def test_iter_items_missing_path(self):
+        for document in ['{}', '{"a": 1}', '{"a": {"b": 1}}', '[]']:
+            with self.subTest(document=document):
+                reader = JSONStreamReader(StringIO(document), chunk_size=1)
+                self.assertListEqual([], list(reader.iter_items(('a', 'b'))))
+
+    def test_iter_items_raises_exception(self):
+        for document in ['{"items": [1, 2', '{"items": [1 2]}', '{"a" 1}', '']:
+            with self.subTest(document=document):
+                reader = JSONStreamReader(StringIO(document), chunk_size=4)
+                with self.assertRaises(json.JSONDecodeError):
+                    list(reader.iter_items(('items',)))
+
+    def test_iter_items_without_ijson(self):
+        with patch('pitfall.streaming.ijson', None):
+            actual = list(streaming.iter_items(StringIO('{"items": [{"a": 1}]}'), ('items',)))
+            self.assertListEqual([{"a": 1}], actual)
+
+            # binary input is decoded incrementally
+            actual = list(streaming.iter_items(BytesIO('{"items": [{"a": "\u00e9t\u00e9"}]}'.encode('utf-8')), ('items',), chunk_size=1))
+            self.assertListEqual([{"a": "\u00e9t\u00e9"}], actual)
+
+    @unittest.skipIf(streaming.ijson is None, "ijson is not installed")
+    def test_iter_items_with_ijson(self):
+        expected = json.loads(self.state)["checkpoint"]["latest"]["resources"]
+
+        with patch('pitfall.streaming.ijson.items', wraps=streaming.ijson.items) as items:
+            actual = list(streaming.iter_items(BytesIO(self.state.encode('utf-8')), ('checkpoint', 'latest', 'resources')))
+
+        self.assertListEqual(expected, actual)
+        self.assertEqual('checkpoint.latest.resources.item', items.call_args[0][1])
+
+        # numbers are decoded as floats rather than Decimals, as with the json module
+        actual = list(streaming.iter_items(BytesIO(b'{"items": [1, 1.5, {"a": [2.25]}]}'), ('items',)))
+        self.assertListEqual([1, 1.5, {"a": [2.25]}], actual)
+        self.assertIsInstance(actual[1], float)
+
+        self.assertListEqual([], list(streaming.iter_items(BytesIO(b'{"a": 1}'), ('items',))))
+
+        # ijson reads bytes, so text input is read by JSONStreamReader
+        with patch('pitfall.streaming.ijson.items') as items:
+            self.assertListEqual([1], list(streaming.iter_items(StringIO('{"items": [1]}'), ('items',))))
+            items.assert_not_called()
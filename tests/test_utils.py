@@ -18,6 +18,8 @@ from pitfall import exceptions
 from pitfall.config import DEFAULT_PULUMI_CONFIG_PASSPHRASE
 from unittest.mock import patch, MagicMock
 import base64
+import os
+import sys
 import tempfile
 import unittest
 
@@ -125,6 +127,13 @@ class TestUtils(unittest.TestCase):
         ciphertext = base64.b64decode(salt_b64)
         self.assertIsInstance(ciphertext, bytes)
 
+    def test_get_encryption_key(self):
+        key, encryptionsalt = utils.generate_encryptionsalt(DEFAULT_PULUMI_CONFIG_PASSPHRASE)
+        self.assertEqual(key, utils.get_encryption_key(DEFAULT_PULUMI_CONFIG_PASSPHRASE, encryptionsalt))
+
+        with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+            utils.get_encryption_key(DEFAULT_PULUMI_CONFIG_PASSPHRASE, 'v2:' + encryptionsalt[3:])
+
     def test_verify_encryptionsalt(self):
         encryptionsalt = 'v1:fKW0HhgPPt8=:v1:jGE7R0+7qd3jUOlx:9IkhVrRrOgMRgrPnr9xbKJCUR0IV8Q=='
         _, salt_b64, _, nonce_b64, message_b64 = encryptionsalt.split(':')
@@ -192,6 +201,21 @@ class TestUtils(unittest.TestCase):
         decrypted = utils.decrypt_with_aes_gcm(key=key, nonce=nonce, ciphertext=ciphertext, mac=mac)
         self.assertEqual(plaintext, decrypted)
 
+    def test_get_decrypted_secret(self):
+        plaintext = b'thisvalueistopsecret'
+
+        key = os.urandom(32)
+
+        encrypted_secret = utils.get_encrypted_secret(plaintext, key)
+
+        self.assertEqual(plaintext, utils.get_decrypted_secret(encrypted_secret, key))
+
+        with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+            utils.get_decrypted_secret(encrypted_secret, os.urandom(32))
+
+        with self.assertRaises(exceptions.PulumiSecretDecryptionError):
+            utils.get_decrypted_secret(encrypted_secret.replace('v1:', 'v2:', 1), key)
+
     def test_sha1sum(self):
         message = b'hello world'
 
@@ -237,3 +261,32 @@ class TestUtils(unittest.TestCase):
         with patch('distutils.spawn.find_executable', MagicMock(return_value=None)):
             with self.assertRaises(exceptions.PulumiBinaryNotFoundError):
                 self.assertIsNone(utils.find_pulumi_binary())
+
+    def test_find_python_binary(self):
+        with patch('distutils.spawn.find_executable', MagicMock(return_value='/usr/bin/python3')):
+            self.assertEqual('/usr/bin/python3', utils.find_python_binary())
+
+        with patch('distutils.spawn.find_executable', MagicMock(return_value=None)):
+            self.assertEqual(sys.executable, utils.find_python_binary())
+
+    def test_get_python_version(self):
+        self.assertEqual(sys.version_info[:2], utils.get_python_version(sys.executable))
+
+        with self.assertRaises(exceptions.PythonVersionExecError):
+            utils.get_python_version('/nonexistent/python3')
+
+        with self.assertRaises(exceptions.PythonVersionExecError):
+            utils.get_python_version('false')
+
+    def test_parse_import_times(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       259 |        259 |       _json\n"
+            "import time:       675 |       1563 |   json.decoder\n"
+            "import time:       477 |       2757 | json\n"
+            "import time:       102 |        102 | pulumi\n"
+        )
+
+        expected = {"json": 2757, "pulumi": 102}
+        actual   = utils.parse_import_times(stderr)
+        self.assertDictEqual(expected, actual)